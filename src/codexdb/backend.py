@@ -0,0 +1,299 @@
+import abc
+import codexdb.results
+import collections
+import concurrent.futures
+import itertools
+import numpy as np
+import openai
+import threading
+import time
+
+
+class CompletionBackend(abc.ABC):
+    """ Completes chat messages (interface of OpenAI's chat API). """
+
+    @abc.abstractmethod
+    def create(self, messages, temperature, stream=False, **kwargs):
+        """ Complete given chat messages.
+
+        Args:
+            messages: chat messages to complete
+            temperature: degree of randomness
+            stream: whether to return an iterator over chunks
+            kwargs: further arguments such as model and stop sequences
+
+        Returns:
+            response (or iterator over chunks when streaming)
+        """
+        raise NotImplementedError()
+
+    def __enter__(self):
+        """ Returns backend for use in with statement. """
+        return self
+
+    def __exit__(self, *_):
+        """ Releases resources of backend. """
+        self.close()
+
+    def close(self):
+        """ Releases resources of backend (nothing by default). """
+        pass
+
+
+class OpenAIBackend(CompletionBackend):
+    """ Generates completions via OpenAI's chat API. """
+
+    def __init__(self, model_id=None):
+        """ Initializes with model to use.
+
+        Args:
+            model_id: use this model instead of requested one (optional)
+        """
+        self.model_id = model_id
+
+    def create(self, messages, temperature, stream=False, **kwargs):
+        """ Complete given chat messages via OpenAI. """
+        if self.model_id is not None:
+            kwargs['model'] = self.model_id
+        return openai.ChatCompletion.create(
+            messages=messages, temperature=temperature,
+            stream=stream, **kwargs)
+
+
+class ReplayBackend(CompletionBackend):
+    """ Local stand-in replaying completions of a prior run.
+
+    Requests are answered with code of the tries in the result file,
+    in the recorded order, after a delay reproducing the recorded
+    request latency. Solving the same test cases with the same
+    settings therefore reproduces the prior run without LLM access.
+    """
+
+    def __init__(self, result_path, delay_scale=1.0):
+        """ Loads generated code and latencies from result file.
+
+        Args:
+            result_path: path to result file of prior run
+            delay_scale: multiply recorded latencies by this factor
+        """
+        self.delay_scale = delay_scale
+        results = codexdb.results.load_results(result_path, False)
+        self.tries = [
+            t for tries in results.values() for t in tries 
+            if not (t.get('template_hit') or t.get('compiled'))]
+        if not self.tries:
+            raise ValueError(f'No tries to replay in {result_path}!')
+        self.nr_requests = 0
+        self.lock = threading.Lock()
+
+    def create(self, messages, temperature, stream=False, **kwargs):
+        """ Answer with code of next recorded try. """
+        with self.lock:
+            one_try = self.tries[self.nr_requests % len(self.tries)]
+            self.nr_requests += 1
+        latency_s = one_try['gen_stats'].get('last_request_s', 0)
+        time.sleep(latency_s * self.delay_scale)
+
+        content = f'```python\n{one_try["code"]}\n```'
+        if stream:
+            chunks = [
+                {'choices':[{'delta':{'content':line + '\n'}}]}
+                for line in content.split('\n')]
+            return iter(chunks)
+        return {
+            'choices':[{'message':{'content':content}}],
+            'usage':{'prompt_tokens':0, 'completion_tokens':0}}
+
+
+class HedgedBackend(CompletionBackend):
+    """ Sends slow requests to a second backend as well.
+
+    If the primary backend has not answered within a percentile of
+    its observed latencies, the same request is sent to the hedge
+    backend and the first answer is used. When streaming, latency
+    refers to the arrival of the first chunk. Token usage of the
+    losing request is added to the hedging statistics once it is
+    known (losing streams are read to the end in the background).
+    Closing the backend waits for pending requests.
+    """
+
+    def __init__(
+            self, primary, hedge, percentile=95,
+            min_observations=20, default_delay_s=10):
+        """ Initializes primary and hedge backend.
+
+        Args:
+            primary: backend receiving all requests
+            hedge: backend receiving requests if primary is slow
+            percentile: hedge after this percentile of primary latency
+            min_observations: use default delay with fewer observations
+            default_delay_s: hedge after this delay before calibration
+        """
+        self.primary = primary
+        self.hedge = hedge
+        self.percentile = percentile
+        self.min_observations = min_observations
+        self.default_delay_s = default_delay_s
+        self.latencies_s = collections.deque(maxlen=1000)
+        self.nr_hedged = 0
+        self.nr_hedge_wins = 0
+        self.nr_loser_tokens = 0
+        self.lock = threading.Lock()
+        self.executor = concurrent.futures.ThreadPoolExecutor(8)
+
+    def create(self, messages, temperature, stream=False, **kwargs):
+        """ Complete messages, hedging if primary backend is slow.
+
+        Hedging statistics are added to the response (key 'hedge').
+        """
+        start_s = time.time()
+        delay_s = self.hedge_delay()
+        primary = self.executor.submit(
+            self._request, self.primary, messages,
+            temperature, stream, kwargs)
+        primary.add_done_callback(
+            lambda f:self._observe(f, start_s))
+        done, _ = concurrent.futures.wait([primary], timeout=delay_s)
+        hedged = not done
+        winner = 'primary'
+        if hedged:
+            hedge = self.executor.submit(
+                self._request, self.hedge, messages,
+                temperature, stream, kwargs)
+            winner_future = self._first_success(primary, hedge)
+            winner = 'primary' if winner_future is primary else 'hedge'
+        else:
+            winner_future = primary
+
+        with self.lock:
+            if hedged:
+                self.nr_hedged += 1
+                self.nr_hedge_wins += (winner == 'hedge')
+            win_rate = self.nr_hedge_wins / self.nr_hedged \
+                if self.nr_hedged else None
+        stats = {
+            'delay_s':delay_s, 'hedged':hedged, 'winner':winner,
+            'latency_s':time.time() - start_s, 'win_rate':win_rate}
+
+        if hedged:
+            loser_future = hedge if winner == 'primary' else primary
+            loser_future.add_done_callback(
+                lambda f:self._record_loser(f, stats, stream))
+
+        response = winner_future.result()
+        if stream:
+            return self._annotate_chunks(response, stats)
+        response = dict(response)
+        response['hedge'] = stats
+        return response
+
+    def close(self):
+        """ Waits for pending requests and releases threads. """
+        self.executor.shutdown(wait=True)
+        self.primary.close()
+        self.hedge.close()
+
+    def hedge_delay(self):
+        """ Calculates delay before sending hedge request.
+
+        Returns:
+            delay in seconds
+        """
+        with self.lock:
+            latencies_s = list(self.latencies_s)
+        if len(latencies_s) < self.min_observations:
+            return self.default_delay_s
+        return float(np.percentile(latencies_s, self.percentile))
+
+    def _annotate_chunks(self, chunks, stats):
+        """ Add hedging statistics to first streamed chunk. """
+        for chunk_idx, chunk in enumerate(chunks):
+            if chunk_idx == 0:
+                chunk = dict(chunk)
+                chunk['hedge'] = stats
+            yield chunk
+
+    def _first_success(self, primary, hedge):
+        """ Returns first request that succeeds (or primary). """
+        pending = {primary, hedge}
+        while pending:
+            done, pending = concurrent.futures.wait(
+                pending, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in sorted(done, key=lambda f:f is not primary):
+                if future.exception() is None:
+                    return future
+        return primary
+
+    def _observe(self, future, start_s):
+        """ Record latency of successful primary request. """
+        if future.exception() is None:
+            with self.lock:
+                self.latencies_s.append(time.time() - start_s)
+
+    def _drain_loser(self, chunks, stats):
+        """ Read losing stream to the end and record its token usage. """
+        usage = None
+        for chunk in chunks:
+            if chunk.get('usage'):
+                usage = chunk['usage']
+        self._record_usage(usage, stats)
+
+    def _record_loser(self, future, stats, stream):
+        """ Record token usage of losing request in statistics. """
+        if future.exception() is not None:
+            return
+        response = future.result()
+        if not stream:
+            self._record_usage(response.get('usage'), stats)
+            return
+        try:
+            self.executor.submit(self._drain_loser, response, stats)
+        except RuntimeError:
+            # Backend is closing and waits for this thread
+            self._drain_loser(response, stats)
+
+    def _record_usage(self, usage, stats):
+        """ Add token usage of losing request to statistics. """
+        if usage is not None:
+            with self.lock:
+                stats['loser_usage'] = dict(usage)
+                self.nr_loser_tokens += usage.get('prompt_tokens', 0) + \
+                    usage.get('completion_tokens', 0)
+
+    def _request(self, backend, messages, temperature, stream, kwargs):
+        """ Send request, waiting for first chunk when streaming. """
+        response = backend.create(
+            messages, temperature, stream=stream, **kwargs)
+        if stream:
+            chunks = iter(response)
+            first_chunk = next(chunks)
+            return itertools.chain([first_chunk], chunks)
+        return response
+
+
+def create_backend(hedge_model=None, hedge_percentile=95, replay_path=None):
+    """ Create completion backend for given settings.
+
+    When replaying prior results, hedge requests are answered by
+    replaying as well (the hedge model only enables hedging). Hence,
+    replay runs never send requests to OpenAI.
+
+    Args:
+        hedge_model: hedge slow requests with this model (optional)
+        hedge_percentile: hedge after this percentile of latency
+        replay_path: replay prior results instead of using OpenAI
+
+    Returns:
+        completion backend
+    """
+    if replay_path is not None:
+        primary = ReplayBackend(replay_path)
+    else:
+        primary = OpenAIBackend()
+    if hedge_model is None:
+        return primary
+    if replay_path is not None:
+        hedge = ReplayBackend(replay_path)
+    else:
+        hedge = OpenAIBackend(hedge_model)
+    return HedgedBackend(primary, hedge, hedge_percentile)
@@ -4,14 +4,18 @@ Created on Nov 23, 2024
 @author: immanueltrummer
 '''
 import argparse
+import codexdb.cases
+import codexdb.catalog
 import json
-import pandas
 
 from pathlib import Path
 
 
 def get_inputs(db_dir, db_id):
-    """ Extracts all .csv files in directory. 
+    """ Extracts data of all .csv files in directory. 
+    
+    Data is read from up-to-date copies in other table formats, if
+    available (see codexdb.catalog.DbCatalog.convert).
     
     Args:
         db_dir: directory containing databases.
@@ -24,8 +28,13 @@ def get_inputs(db_dir, db_id):
     db_path = Path(db_dir) / Path(db_id)
     for csv_path in db_path.glob('*.csv'):
         file_name = csv_path.name
-        csv_file = pandas.read_csv(csv_path)
-        name2df[file_name] = csv_file
+        table_path = csv_path
+        for table_format in codexdb.catalog.table_readers:
+            copy_path = codexdb.catalog.fresh_copy(csv_path, table_format)
+            if table_format != 'csv' and copy_path is not None:
+                table_path = copy_path
+                break
+        name2df[file_name] = codexdb.catalog.read_table(str(table_path))
     
     return name2df
 
@@ -92,25 +101,23 @@ if __name__ == '__main__':
     parser.add_argument('modification', type=str, help='Code modification')
     args = parser.parse_args()
     
-    with open(args.test_path) as file:
-        test_cases = json.load(file)
-
-    for i in range(0, 200, 2):
-        test_case = test_cases[i]
+    with codexdb.cases.TestCaseStore(args.test_path) as test_cases:
+        for i in range(0, 200, 2):
+            test_case = test_cases[i]
 
-        db_id = test_case['db_id']
-        inputs = get_inputs(args.db_dir, db_id)
-        db_description = []
-        for table_name, table_df in inputs.items():
-            db_description += [table_to_JSON(table_name, table_df)]
+            db_id = test_case['db_id']
+            inputs = get_inputs(args.db_dir, db_id)
+            db_description = []
+            for table_name, table_df in inputs.items():
+                db_description += [table_to_JSON(table_name, table_df)]
         
-        query = test_case['query']
-        question = test_case['question']
-        results = test_case['results']
-        test_name = f'CodingTest{i}'
-        alpha_test = make_alpha_test(
-            test_name, db_description, query, 
-            results, args.modification)
+            query = test_case['query']
+            question = test_case['question']
+            results = test_case['results']
+            test_name = f'CodingTest{i}'
+            alpha_test = make_alpha_test(
+                test_name, db_description, query, 
+                results, args.modification)
         
-        with open(f'{test_name}.json', 'w') as file:
-            json.dump(alpha_test, file)
\ No newline at end of file
+            with open(f'{test_name}.json', 'w') as file:
+                json.dump(alpha_test, file)
\ No newline at end of file
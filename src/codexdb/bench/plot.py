@@ -4,8 +4,8 @@ Created on Jan 28, 2022
 @author: immanueltrummer
 '''
 import argparse
+import codexdb.results
 import collections
-import json
 import re
 import statistics
 
@@ -49,14 +49,13 @@ def agg_all(run_dir, solved, map_fct, agg_fct):
                 run_id = get_run_id(model_id, prompt_style, nr_samples)
                 result_path = f'{run_dir}/results_{run_id}.json'
                 try:
-                    with open(result_path) as file:
-                        data = json.load(file)
-                        for tries in data.values():
-                            for one_try in tries:
-                                if not solved or one_try['similarity']==1.0:
-                                    value = map_fct(one_try)
-                                    if value is not None:
-                                        values.append(value)
+                    data = codexdb.results.load_results(result_path, False)
+                    for tries in data.values():
+                        for one_try in tries:
+                            if not solved or one_try['similarity']==1.0:
+                                value = map_fct(one_try)
+                                if value is not None:
+                                    values.append(value)
                 except Exception as e:
                     pass
                     #print(e)
@@ -76,8 +75,7 @@ def analyze_code(run_dir):
     nr_samples = 2
     run_id = get_run_id(model_id, prompt_style, nr_samples)
     result_path = f'{run_dir}/results_{run_id}.json'
-    with open(result_path) as file:
-        data = json.load(file)
+    data = codexdb.results.load_results(result_path, False)
     
     lib_count = collections.defaultdict(lambda:0)
     tries_by_case = data.values()
@@ -111,8 +109,7 @@ def analyze_training(run_dir):
     """ Analyze training process. """
     print('Analyzing training process ...')
     result_path = f'{run_dir}/train_plain.json'
-    with open(result_path) as file:
-        data = json.load(file)
+    data = codexdb.results.load_results(result_path, False)
 
     tries_by_case = data.values()
     nr_solved = 0
@@ -200,11 +197,10 @@ def generate_plot(run_dir, y_fct):
                 run_id = get_run_id(model_id, prompt_style, nr_samples)
                 result_path = f'{run_dir}/results_{run_id}.json'
                 try:
-                    with open(result_path) as file:
-                        data = json.load(file)
-                        y_coordinate = y_fct(data)
-                        point = f'({nr_samples}, {y_coordinate})'
-                        line += [point]
+                    data = codexdb.results.load_results(result_path, False)
+                    y_coordinate = y_fct(data)
+                    point = f'({nr_samples}, {y_coordinate})'
+                    line += [point]
                 except Exception as e:
                     #print(f'Exception for {result_path}: {e}')
                     line += ['(-1, -1)']
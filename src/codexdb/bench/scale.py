@@ -4,12 +4,14 @@ Created on Jan 29, 2022
 @author: immanueltrummer
 '''
 import argparse
+import codexdb.cases
 import codexdb.catalog
 import codexdb.engine
 import json
 import math
 import os
 import pandas as pd
+import tempfile
 import time
 
 def get_code(language, test_case):
@@ -53,15 +55,18 @@ def scale_data(source_path, factor, target_path):
         factor: duplicate rows by this factor
         target_path: write scaled data here
     """
-    os.system(f'cp {source_path} /tmp/scaled1')
-    nr_iterations = math.ceil(math.log(factor, 2))
-    for i in range(nr_iterations):
-        print(f'Doubling rows - iteration {i} ...')
-        # Double the number of rows (without header)
-        os.system(f'cat /tmp/scaled1 > /tmp/scaled2')
-        os.system(f'tail -n +2 /tmp/scaled1 >> /tmp/scaled2')
-        os.system('cp /tmp/scaled2 /tmp/scaled1')
-    os.system(f'cp /tmp/scaled1 {target_path}')
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        scaled_1 = f'{tmp_dir}/scaled1'
+        scaled_2 = f'{tmp_dir}/scaled2'
+        os.system(f'cp {source_path} {scaled_1}')
+        nr_iterations = math.ceil(math.log(factor, 2))
+        for i in range(nr_iterations):
+            print(f'Doubling rows - iteration {i} ...')
+            # Double the number of rows (without header)
+            os.system(f'cat {scaled_1} > {scaled_2}')
+            os.system(f'tail -n +2 {scaled_1} >> {scaled_2}')
+            os.system(f'cp {scaled_2} {scaled_1}')
+        os.system(f'cp {scaled_1} {target_path}')
 
 def scale_tables(catalog, db_id, factor, code):
     """ Scale up data size of tables in database by given factor.
@@ -77,21 +82,34 @@ def scale_tables(catalog, db_id, factor, code):
     """
     scaled_code = code
     schema = catalog.schema(db_id)
-    tables = schema['table_names_original']
+    tables = schema.tables
     table_byte_sizes = []
     table_nr_rows = []
-    for table in tables:
-        original_file = catalog.file_name(db_id, table)
-        original_path = catalog.file_path(db_id, table)
-        scaled_file = f'xxl_{original_file}'
-        catalog.assign_file(db_id, table, scaled_file)
-        scaled_path = catalog.file_path(db_id, table)
-        scale_data(original_path, factor, scaled_path)
-        scaled_code = scaled_code.replace(original_file, scaled_file)
-        byte_size = os.path.getsize(scaled_path)
-        nr_rows = sum(1 for _ in open(scaled_path))
-        table_byte_sizes += [byte_size]
-        table_nr_rows += [nr_rows]
+    # Directory of packed databases may not exist
+    os.makedirs(catalog.db_dir(db_id), exist_ok=True)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for table in tables:
+            original_file = catalog.file_name(db_id, table)
+            original_path = f'{tmp_dir}/original.csv'
+            if codexdb.catalog.table_file_format(original_file) == 'csv':
+                catalog.stage(db_id, table, original_path)
+            scaled_file = f'xxl_{original_file}'
+            catalog.assign_file(db_id, table, scaled_file)
+            scaled_path = catalog.file_path(db_id, table)
+            csv_path = scaled_path
+            if codexdb.catalog.table_file_format(original_file) == 'csv':
+                scale_data(original_path, factor, scaled_path)
+            else:
+                # Scale CSV data, then store scaled data in binary format
+                csv_path = f'{tmp_dir}/scaled.csv'
+                scale_data(catalog.csv_path(db_id, table), factor, csv_path)
+                df = pd.read_csv(csv_path)
+                codexdb.catalog.write_table(df, scaled_path)
+            scaled_code = scaled_code.replace(original_file, scaled_file)
+            byte_size = os.path.getsize(scaled_path)
+            nr_rows = sum(1 for _ in open(csv_path))
+            table_byte_sizes += [byte_size]
+            table_nr_rows += [nr_rows]
     return scaled_code, table_byte_sizes, table_nr_rows
 
 def unscale_tables(catalog, db_id):
@@ -102,8 +120,7 @@ def unscale_tables(catalog, db_id):
         db_id: unscale all tables in this database
     """
     schema = catalog.schema(db_id)
-    tables = schema['table_names_original']
-    for table in tables:
+    for table in schema.tables:
         key = (db_id, table)
         del catalog.table_to_file[key]
 
@@ -143,15 +160,18 @@ if __name__ == '__main__':
     parser.add_argument('test_path', type=str, help='Path to file with tests')
     parser.add_argument('nr_tests', type=int, help='How many test cases')
     parser.add_argument('timeout_s', type=int, help='Timeout in seconds')
+    parser.add_argument(
+        '--table_format', type=str, default='csv', 
+        help='Preferred format of table files (csv, parquet, or feather)')
     args = parser.parse_args()
     
-    catalog = codexdb.catalog.DbCatalog(args.data_dir)
-    with open(args.test_path) as file:
-        test_cases = json.load(file)
+    catalog = codexdb.catalog.DbCatalog(args.data_dir, args.table_format)
     engine = get_engine(args.language)
     
-    nr_all_tests = len(test_cases)
-    nr_tests = min(args.nr_tests, nr_all_tests)
+    with codexdb.cases.TestCaseStore(args.test_path) as test_cases:
+        nr_all_tests = len(test_cases)
+        nr_tests = min(args.nr_tests, nr_all_tests)
+        case_tries = [test_cases[i] for i in range(nr_tests)]
     factors = [1000, 1000000]
     nr_factors = len(factors)
     
@@ -164,8 +184,7 @@ if __name__ == '__main__':
     
     results = []
     for test_case_id in range(nr_tests):
-        test_case_key = str(test_case_id)
-        tries = test_cases[test_case_key]
+        tries = case_tries[test_case_id]
         test_case = tries[-1]
         for factor in factors:
             print(f'Treating test case {test_case_id}, factor {factor}')
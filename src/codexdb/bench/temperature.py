@@ -16,7 +16,7 @@ if __name__ == '__main__':
     
     openai.api_key = args.ai_key
     data_dir = '/home/ubuntu/spider/spider'
-    test_path = '/home/ubuntu/spider/spider/results_dev.json'
+    test_path = '/home/ubuntu/spider/spider/results_dev.jsonl'
     test_start = 0
     test_step = 2
     test_end = 200
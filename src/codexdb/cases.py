@@ -0,0 +1,156 @@
+import argparse
+import json
+import numpy as np
+import os
+
+
+class TestCaseStore():
+    """ Random access to test cases, stored one per line (.jsonl).
+
+    An index file (.idx) stores the byte offset of each line. Only
+    test cases that are accessed are read and parsed. Legacy test
+    case files (one .json list, or one dictionary mapping indexes
+    to entries as in result files) are loaded completely instead.
+    The index is rebuilt if it is missing or older than the test
+    cases.
+    """
+
+    def __init__(self, path):
+        """ Opens test case file and its offset index.
+
+        Args:
+            path: path to test case file (.jsonl or legacy .json)
+        """
+        self.path = path
+        if path.endswith('.json'):
+            with open(path) as file:
+                self.cases = json.load(file)
+            if isinstance(self.cases, dict):
+                self.cases = {int(i):c for i, c in self.cases.items()}
+            self.offsets = None
+        else:
+            self.cases = None
+            index_path = path + '.idx'
+            if not os.path.exists(index_path) or \
+                os.path.getmtime(index_path) < os.path.getmtime(path):
+                write_index(path)
+            if os.path.getsize(index_path) > 0:
+                self.offsets = np.memmap(
+                    index_path, dtype='int64', mode='r')
+            else:
+                self.offsets = np.zeros(0, dtype='int64')
+            self.file = open(path, 'rb')
+
+    def __enter__(self):
+        """ Returns store for use in with statement. """
+        return self
+
+    def __exit__(self, *_):
+        """ Closes test case file. """
+        self.close()
+
+    def __getitem__(self, idx):
+        """ Returns test case with given index.
+
+        Args:
+            idx: index of test case
+
+        Returns:
+            test case (dictionary)
+        """
+        if self.cases is not None:
+            return self.cases[idx]
+        self.file.seek(int(self.offsets[idx]))
+        return json.loads(self.file.readline())
+
+    def __len__(self):
+        """ Returns number of test cases. """
+        if self.cases is not None:
+            return len(self.cases)
+        return len(self.offsets)
+
+    def close(self):
+        """ Closes test case file. """
+        if self.cases is None:
+            self.file.close()
+
+
+class TestCaseWriter():
+    """ Writes test cases one by one into an indexed store. """
+
+    def __init__(self, path):
+        """ Opens test case file for writing.
+
+        Args:
+            path: path to test case file (.jsonl)
+        """
+        self.path = path
+        self.file = open(path, 'wb')
+        self.offsets = []
+
+    def __enter__(self):
+        """ Returns writer for use in with statement. """
+        return self
+
+    def __exit__(self, *_):
+        """ Closes test case file and writes index. """
+        self.close()
+
+    def close(self):
+        """ Closes test case file and writes index. """
+        self.file.close()
+        offsets = np.array(self.offsets, dtype='int64')
+        offsets.tofile(self.path + '.idx')
+
+    def write(self, test_case):
+        """ Appends one test case.
+
+        Args:
+            test_case: dictionary describing test case
+        """
+        self.offsets.append(self.file.tell())
+        line = json.dumps(test_case) + '\n'
+        self.file.write(line.encode())
+
+
+def convert(json_path):
+    """ Convert legacy test case file into indexed store.
+
+    Args:
+        json_path: path to legacy .json test case file
+
+    Returns:
+        path to test case file of indexed store
+    """
+    store_path = os.path.splitext(json_path)[0] + '.jsonl'
+    with open(json_path) as file:
+        test_cases = json.load(file)
+    with TestCaseWriter(store_path) as writer:
+        for test_case in test_cases:
+            writer.write(test_case)
+    return store_path
+
+
+def write_index(path):
+    """ Write index with line offsets for test case file.
+
+    Args:
+        path: path to test case file (.jsonl)
+    """
+    offsets = []
+    with open(path, 'rb') as file:
+        offset = 0
+        for line in file:
+            offsets.append(offset)
+            offset += len(line)
+    np.array(offsets, dtype='int64').tofile(path + '.idx')
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('json_path', type=str, help='Legacy test case file')
+    args = parser.parse_args()
+
+    store_path = convert(args.json_path)
+    print(f'Wrote indexed test cases to {store_path}')
@@ -3,22 +3,139 @@ Created on Oct 5, 2021
 
 @author: immanueltrummer
 '''
+import argparse
+import collections
+import contextlib
+import fcntl
+import hashlib
+import importlib.util
+import io
 import json
+import mmap
+import numpy as np
+import os
+import pandas as pd
+import shutil
+import tempfile
+import threading
+
+
+# Maps supported table file formats to pandas functions reading them
+table_readers = {
+    'csv':'read_csv', 'parquet':'read_parquet', 'feather':'read_feather'}
+
+# Mode of files written via temporary files (created private)
+file_mode = 0o644
+
+class DbSchema(dict):
+    """ Schema of one database with precomputed per-table indexes.
+    
+    The schema remains a dictionary (the JSON object describing it)
+    and can be stored and serialized as before. Attributes give
+    direct access to tables, their columns, and keys.
+    """
+    
+    __slots__ = (
+        'db_id', 'tables', 'lower_tables', 'table_columns', 
+        'lower_columns', 'column_positions', 'column_types', 
+        'primary_keys', 'foreign_keys')
+    
+    def __init__(self, schema):
+        """ Precomputes indexes for given schema.
+        
+        Args:
+            schema: JSON object describing schema (in Spider format)
+        """
+        super().__init__(schema)
+        self.db_id = schema.get('db_id')
+        self.tables = tuple(schema['table_names_original'])
+        self.lower_tables = tuple(t.lower() for t in self.tables)
+        all_columns = schema['column_names_original']
+        all_types = schema.get('column_types', [])
+        columns = [[] for _ in self.tables]
+        types = [[] for _ in self.tables]
+        for col_idx, (tbl_idx, column) in enumerate(all_columns):
+            if tbl_idx >= 0:
+                columns[tbl_idx].append(column)
+                col_type = all_types[col_idx] \
+                    if col_idx < len(all_types) else None
+                types[tbl_idx].append(col_type)
+        self.table_columns = tuple(tuple(c) for c in columns)
+        self.lower_columns = tuple(
+            tuple(c.lower() for c in cols) for cols in columns)
+        positions = [{} for _ in self.tables]
+        for tbl_idx, cols in enumerate(self.lower_columns):
+            for pos, column in enumerate(cols):
+                positions[tbl_idx].setdefault(column, pos)
+        self.column_positions = tuple(positions)
+        self.column_types = tuple(tuple(t) for t in types)
+        
+        def key_column(col_idx):
+            """ Returns table index and name of key column. """
+            tbl_idx, column = all_columns[col_idx]
+            return tbl_idx, column
+        
+        primary_keys = []
+        for key in schema.get('primary_keys', []):
+            key = key if isinstance(key, list) else [key]
+            primary_keys.append(tuple(key_column(c) for c in key))
+        self.primary_keys = tuple(primary_keys)
+        self.foreign_keys = tuple(
+            (key_column(c_1), key_column(c_2)) 
+            for c_1, c_2 in schema.get('foreign_keys', []))
+
 
 class DbCatalog():
-    """ Information over all databases in database directory. """
+    """ Information over all databases in database directory.
+    
+    Table statistics are kept in an indexed store next to schemata
+    (stats.jsonl, see KeyedStore) and read on demand. New statistics
+    are written in batches, appended to a file of updates. Updates
+    are merged into the store once there are as many updates as
+    stored entries. Processes sharing the data directory merge their
+    statistics, keeping the newest entry for each table.
+    """
     
-    def __init__(self, data_dir):
+    def __init__(self, data_dir, table_format='csv', save_every=100):
         """ Initialize for given database directory. 
         
         Args:
             data_dir: contains databases and schemata
+            table_format: preferred format of table files (see convert)
+            save_every: write statistics after that many new entries
         """
+        if table_format not in table_readers:
+            raise ValueError(f'Unknown table format: {table_format}')
+        if not format_available(table_format):
+            print(f'Table format {table_format} requires pyarrow, which '
+                  'is not installed - using CSV files instead.')
+            table_format = 'csv'
         self.data_dir = data_dir
+        self.table_format = table_format
         self.schema_path = f'{data_dir}/schemata.json'
-        with open(self.schema_path) as file:
-            self.schemata = json.load(file)
+        store_path = f'{data_dir}/schemata.jsonl'
+        if os.path.exists(self.schema_path) and (
+            not os.path.exists(store_path) or 
+            os.path.getmtime(store_path) < os.path.getmtime(self.schema_path)):
+            with open(self.schema_path) as file:
+                write_schema_store(json.load(file), store_path)
+        self.schemata = SchemaStore(store_path)
+        pack_path = f'{data_dir}/tables.pack'
+        self.table_pack = None
+        if os.path.exists(pack_path + '.jsonl'):
+            self.table_pack = TablePack(pack_path)
         self.table_to_file = {}
+        self.stats_path = f'{data_dir}/stats.jsonl'
+        self.updates_path = f'{data_dir}/stats.updates.jsonl'
+        self.save_every = save_every
+        self.new_stats = {}
+        self.stats_store = None
+        self.store_id = None
+        self.stats_updates = {}
+        self.updates_offset = 0
+        self.nr_updates = 0
+        self.stats_versions = {}
+        self._open_stats()
     
     def assign_file(self, db_id, table, file_name):
         """ Assign file to given table in given database.
@@ -30,6 +147,42 @@ class DbCatalog():
         """
         self.table_to_file[(db_id, table)] = file_name
         
+    def close(self):
+        """ Write statistics that have not been saved yet. """
+        self.save_stats()
+    
+    def convert(self, db_ids=None):
+        """ Store copies of CSV table files in preferred format.
+        
+        Copies are only written if missing or older than CSV files.
+        
+        Args:
+            db_ids: convert tables of those databases (default: all)
+        """
+        if self.table_format == 'csv':
+            return
+        for db_id in db_ids or list(self.db_ids()):
+            for table in self.schema(db_id).tables:
+                csv_path = self.csv_path(db_id, table)
+                if fresh_copy(csv_path, self.table_format) is not None:
+                    continue
+                try:
+                    convert_table(csv_path, self.table_format)
+                except Exception as e:
+                    print(f'Cannot convert {csv_path}: {e}')
+    
+    def csv_path(self, db_id, table):
+        """ Returns path to CSV file containing data for table.
+        
+        Args:
+            db_id: search table in this database
+            table: name of table
+        
+        Returns:
+            path to CSV file (source of copies in other formats)
+        """
+        return f'{self.db_dir(db_id)}/{table}.csv'
+    
     def db_dir(self, db_id):
         """ Returns directory storing specific database.
         
@@ -47,11 +200,14 @@ class DbCatalog():
         Returns:
             list with database IDs
         """
-        return self.schemata.keys()
+        return self.schemata.ids()
     
     def file_name(self, db_id, table):
         """ Returns name of file storing table data.
         
+        Files in the preferred table format are used if available and
+        not older than the CSV file (CSV files otherwise).
+        
         Args:
             db_id: ID of database
             table: name of table
@@ -60,8 +216,13 @@ class DbCatalog():
             name of file storing data
         """
         key = (db_id, table)
-        default = f'{table}.csv'
-        return self.table_to_file.get(key, default)
+        if key in self.table_to_file:
+            return self.table_to_file[key]
+        if self.table_format != 'csv':
+            csv_path = f'{self.db_dir(db_id)}/{table}.csv'
+            if fresh_copy(csv_path, self.table_format) is not None:
+                return f'{table}.{self.table_format}'
+        return f'{table}.csv'
     
     def file_path(self, db_id, table):
         """ Returns path to file containing data for table.
@@ -86,9 +247,198 @@ class DbCatalog():
         Returns:
             list of files associated with database tables
         """
-        tables = self.schema(db_id)['table_names_original']
+        tables = self.schema(db_id).tables
         return [self.file_name(db_id, t) for t in tables]
     
+    def open_file(self, db_id, table):
+        """ Opens file containing table data (packed or not).
+        
+        Args:
+            db_id: ID of database
+            table: name of table
+        
+        Returns:
+            binary file object
+        """
+        if self.packed(db_id, table):
+            file_name = self.file_name(db_id, table)
+            return io.BytesIO(self.table_pack.read(db_id, file_name))
+        return open(self.file_path(db_id, table), 'rb')
+    
+    def pack(self, db_ids=None):
+        """ Pack files of all tables into one file (see TablePack).
+        
+        Args:
+            db_ids: pack tables of those databases (default: all)
+        """
+        pack_path = f'{self.data_dir}/tables.pack'
+        with TablePackWriter(pack_path + '.tmp') as writer:
+            for db_id in db_ids or list(self.db_ids()):
+                for table in self.schema(db_id).tables:
+                    file_name = self.file_name(db_id, table)
+                    try:
+                        with self.open_file(db_id, table) as file:
+                            writer.write(db_id, file_name, file.read())
+                    except Exception as e:
+                        print(f'Cannot pack {db_id}/{file_name}: {e}')
+        os.replace(pack_path + '.tmp', pack_path)
+        for suffix in ['.jsonl', '.jsonl.idx']:
+            os.replace(pack_path + '.tmp' + suffix, pack_path + suffix)
+        self.table_pack = TablePack(pack_path)
+    
+    def packed(self, db_id, table):
+        """ Returns True iff table file is stored in pack file.
+        
+        Args:
+            db_id: ID of database
+            table: name of table
+        
+        Returns:
+            flag indicating whether table file is packed
+        """
+        if self.table_pack is None:
+            return False
+        file_name = self.file_name(db_id, table)
+        return self.table_pack.entry(db_id, file_name) is not None
+    
+    def save_stats(self):
+        """ Add new table statistics to store next to schemata.
+        
+        New statistics are appended to the updates under a file lock,
+        after reading updates of other processes. For each table, the
+        entry for the most recently changed table file is kept (e.g.,
+        if other processes saved in between). Only the new entries
+        are written, unless updates are merged into the store.
+        """
+        if not self.new_stats:
+            return
+        with self._stats_lock(fcntl.LOCK_EX):
+            self._read_updates()
+            lines = []
+            for key, new_stats in self.new_stats.items():
+                old_stats = self._stored_stats(key)
+                if old_stats is None or \
+                    old_stats['mtime'] <= new_stats['mtime']:
+                    self.stats_updates[key] = new_stats
+                    lines.append(json.dumps([key, new_stats]) + '\n')
+            with open(self.updates_path, 'ab') as file:
+                # Remove incomplete line left by crashed process
+                file.truncate(self.updates_offset)
+                file.write(''.join(lines).encode())
+                self.updates_offset = file.tell()
+            self.nr_updates += len(lines)
+            nr_stored = len(self.stats_store) if self.stats_store else 0
+            if self.nr_updates > max(nr_stored, self.save_every):
+                self._compact_stats()
+        for key in self.new_stats:
+            db_id = key.rsplit('/', 1)[0]
+            self.stats_versions.pop(db_id, None)
+        self.new_stats = {}
+    
+    def stats_version(self, db_id):
+        """ Returns hash over statistics of all tables in database.
+        
+        The version is calculated once per database. It is updated
+        after saving changed statistics of the database's tables.
+        
+        Args:
+            db_id: ID of database
+        
+        Returns:
+            hash identifying table data of database
+        """
+        if db_id not in self.stats_versions:
+            hashes = [
+                self.table_stats(db_id, table)['hash'] 
+                for table in self.schema(db_id).tables]
+            digest = hashlib.sha1(json.dumps(hashes).encode()).hexdigest()
+            self.stats_versions[db_id] = digest
+        return self.stats_versions[db_id]
+    
+    def table_stats(self, db_id, table):
+        """ Returns statistics on table data.
+        
+        Statistics are stored in a file and only recalculated if
+        the file containing table data changes. 
+        
+        Args:
+            db_id: ID of database
+            table: name of table
+        
+        Returns:
+            dictionary with statistics (see data_stats)
+        """
+        key = f'{db_id}/{self.file_name(db_id, table)}'
+        if self.packed(db_id, table):
+            size, mtime = self.table_pack.entry(db_id, self.file_name(
+                db_id, table))[1], self.table_pack.mtime
+        else:
+            file_stat = os.stat(self.file_path(db_id, table))
+            size, mtime = file_stat.st_size, file_stat.st_mtime
+        stats = self.new_stats.get(key)
+        if stats is None:
+            stats = self._stored_stats(key)
+        if stats is not None and stats['bytes'] == size and \
+            stats['mtime'] == mtime:
+            return stats
+        
+        with self.open_file(db_id, table) as file:
+            digest = file_hash(file)
+        if stats is None or stats['hash'] != digest:
+            print(f'Calculating statistics for {key} ...')
+            stats = data_stats(self.table_data(db_id, table))
+            stats['hash'] = digest
+        stats = {**stats, 'bytes':size, 'mtime':mtime}
+        self.new_stats[key] = stats
+        if len(self.new_stats) >= self.save_every:
+            self.save_stats()
+        return stats
+    
+    def stage(self, db_id, table, path):
+        """ Copy file containing table data (packed or not).
+        
+        Args:
+            db_id: ID of database
+            table: name of table
+            path: write copy to this path
+        """
+        if self.packed(db_id, table):
+            file_name = self.file_name(db_id, table)
+            with open(path, 'wb') as file:
+                file.write(self.table_pack.read(db_id, file_name))
+        else:
+            shutil.copyfile(self.file_path(db_id, table), path)
+    
+    def table_data(self, db_id, table, nrows=None, dtype=None):
+        """ Read table data (packed or not).
+        
+        Args:
+            db_id: ID of database
+            table: name of table
+            nrows: read at most that many rows (default: all)
+            dtype: types of columns in CSV files (default: inferred)
+        
+        Returns:
+            data frame with table data
+        """
+        table_format = table_file_format(self.file_name(db_id, table))
+        with self.open_file(db_id, table) as file:
+            return read_table(file, nrows, dtype, table_format)
+    
+    def update_stats(self, db_ids=None):
+        """ Calculate statistics for all tables with changed data.
+        
+        Args:
+            db_ids: update statistics for those databases (default: all)
+        """
+        for db_id in db_ids or list(self.db_ids()):
+            for table in self.schema(db_id).tables:
+                try:
+                    self.table_stats(db_id, table)
+                except Exception as e:
+                    print(f'Cannot calculate statistics for {table}: {e}')
+        self.save_stats()
+    
     def schema(self, db_id):
         """ Returns description of database schema.
         
@@ -96,6 +446,528 @@ class DbCatalog():
             db_id: unique name of database
         
         Returns:
-            JSON object describing database schema
+            schema of database (see DbSchema)
+        """
+        return self.schemata[db_id]
+    
+    def _open_stats(self):
+        """ Open store of table statistics (if it exists). """
+        legacy_path = f'{self.data_dir}/stats.json'
+        if os.path.exists(legacy_path) and \
+            not os.path.exists(self.stats_path):
+            with self._stats_lock(fcntl.LOCK_EX):
+                if not os.path.exists(self.stats_path):
+                    with open(legacy_path) as file:
+                        write_keyed_store(json.load(file), self.stats_path)
+        with self._stats_lock(fcntl.LOCK_SH):
+            self._read_updates()
+    
+    def _compact_stats(self):
+        """ Merge updates into store of table statistics.
+        
+        Requires an exclusive lock on the statistics.
+        """
+        stats = dict(self.stats_store.items()) if self.stats_store else {}
+        stats.update(self.stats_updates)
+        write_keyed_store(stats, self.stats_path)
+        open(self.updates_path, 'wb').close()
+        self._read_updates()
+    
+    def _read_updates(self):
+        """ Read statistics updates appended since the last read.
+        
+        If updates were merged into the store (possibly by another
+        process), the store is reopened and updates are read anew.
+        Requires a (shared or exclusive) lock on the statistics.
+        """
+        store_id = None
+        if os.path.exists(self.stats_path):
+            store_stat = os.stat(self.stats_path)
+            store_id = (store_stat.st_ino, store_stat.st_mtime_ns)
+        if store_id != self.store_id:
+            self.stats_store = None
+            if store_id is not None:
+                self.stats_store = KeyedStore(self.stats_path)
+            self.store_id = store_id
+            self.stats_updates = {}
+            self.updates_offset = 0
+            self.nr_updates = 0
+        if not os.path.exists(self.updates_path):
+            return
+        with open(self.updates_path, 'rb') as file:
+            file.seek(self.updates_offset)
+            for line in file:
+                if not line.endswith(b'\n'):
+                    break
+                key, stats = json.loads(line)
+                old_stats = self._stored_stats(key)
+                if old_stats is None or old_stats['mtime'] <= stats['mtime']:
+                    self.stats_updates[key] = stats
+                self.updates_offset += len(line)
+                self.nr_updates += 1
+    
+    @contextlib.contextmanager
+    def _stats_lock(self, operation):
+        """ Lock store of table statistics (against other processes).
+        
+        Without write access to the data directory, statistics can
+        only be read and no lock is taken.
         """
-        return self.schemata[db_id]
\ No newline at end of file
+        try:
+            lock_file = open(self.stats_path + '.lock', 'a')
+        except OSError:
+            yield
+            return
+        with lock_file:
+            fcntl.flock(lock_file, operation)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+    
+    def _stored_stats(self, key):
+        """ Returns saved statistics for given key (or None). """
+        stats = self.stats_updates.get(key)
+        if stats is None and self.stats_store is not None and \
+            key in self.stats_store:
+            stats = self.stats_store[key]
+        return stats
+
+
+class KeyedStore():
+    """ Random access to JSON objects by key, stored one per line (.jsonl).
+    
+    Lines are sorted by key and contain the key and the object (both
+    as JSON), separated by a tab. An index file (.idx) stores the byte
+    offset of each line. Objects are found via binary search over the 
+    index, loaded on demand, and recently used objects are cached.
+    """
+    
+    def __init__(self, path, cache_size=256):
+        """ Opens store file and its offset index.
+        
+        Args:
+            path: path to store file (written via write_keyed_store)
+            cache_size: maximal number of cached objects
+        """
+        self.path = path
+        self.cache_size = cache_size
+        self.cache = collections.OrderedDict()
+        self.lock = threading.Lock()
+        index_path = path + '.idx'
+        if os.path.getsize(index_path) > 0:
+            self.offsets = np.memmap(index_path, dtype='int64', mode='r')
+        else:
+            self.offsets = np.zeros(0, dtype='int64')
+        self.file = open(path, 'rb')
+    
+    def __contains__(self, key):
+        """ Returns True iff object with given key is stored. """
+        with self.lock:
+            return key in self.cache or self._find(key) is not None
+    
+    def __getitem__(self, key):
+        """ Returns object with given key.
+        
+        Args:
+            key: key of object
+        
+        Returns:
+            stored object
+        """
+        with self.lock:
+            if key in self.cache:
+                self.cache.move_to_end(key)
+                return self.cache[key]
+            line = self._find(key)
+            if line is None:
+                raise KeyError(key)
+            value = self._value(json.loads(line.split(b'\t', 1)[1]))
+            self.cache[key] = value
+            if len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+            return value
+    
+    def __getstate__(self):
+        """ Returns state for pickling (reopens files when unpickled). """
+        return {'path':self.path, 'cache_size':self.cache_size}
+    
+    def __len__(self):
+        """ Returns number of stored objects. """
+        return len(self.offsets)
+    
+    def __setstate__(self, state):
+        """ Reopens files after unpickling. """
+        self.__init__(state['path'], state['cache_size'])
+    
+    def items(self):
+        """ Returns list of all keys and objects, sorted by key. """
+        with self.lock:
+            self.file.seek(0)
+            items = []
+            for line in self.file:
+                key, stored = line.split(b'\t', 1)
+                value = self._value(json.loads(stored))
+                items.append((json.loads(key), value))
+            return items
+    
+    def keys(self):
+        """ Returns sorted list of all keys. """
+        with self.lock:
+            self.file.seek(0)
+            return [json.loads(line.split(b'\t', 1)[0]) for line in self.file]
+    
+    def _find(self, key):
+        """ Returns line storing object with given key (or None). """
+        low, high = 0, len(self.offsets)
+        while low < high:
+            middle = (low + high) // 2
+            self.file.seek(int(self.offsets[middle]))
+            line = self.file.readline()
+            line_key = json.loads(line.split(b'\t', 1)[0])
+            if line_key == key:
+                return line
+            elif line_key < key:
+                low = middle + 1
+            else:
+                high = middle
+        return None
+    
+    def _value(self, stored):
+        """ Returns object for JSON object read from store. """
+        return stored
+
+
+class SchemaStore(KeyedStore):
+    """ Random access to schemata, keyed by database ID. """
+    
+    def ids(self):
+        """ Returns sorted list of all database IDs. """
+        return self.keys()
+    
+    def _value(self, stored):
+        """ Returns typed schema for stored schema. """
+        return DbSchema(stored)
+
+
+class TablePack():
+    """ Files of many tables, packed into one memory-mapped file.
+    
+    The pack file (.pack) contains the concatenated content of table
+    files. An index (.pack.jsonl, see KeyedStore) maps database ID and
+    file name to offset and length of the file content. Reading a file
+    amounts to extracting a slice of the pack file.
+    """
+    
+    def __init__(self, path):
+        """ Opens pack file and its index.
+        
+        Args:
+            path: path to pack file (written via TablePackWriter)
+        """
+        self.path = path
+        self.index = KeyedStore(path + '.jsonl', cache_size=1024)
+        self.mtime = os.path.getmtime(path)
+        self.data = b''
+        if os.path.getsize(path) > 0:
+            with open(path, 'rb') as file:
+                self.data = mmap.mmap(
+                    file.fileno(), 0, access=mmap.ACCESS_READ)
+    
+    def __getstate__(self):
+        """ Returns state for pickling (reopens files when unpickled). """
+        return {'path':self.path}
+    
+    def __setstate__(self, state):
+        """ Reopens files after unpickling. """
+        self.__init__(state['path'])
+    
+    def entry(self, db_id, file_name):
+        """ Returns offset and length of packed file (or None).
+        
+        Args:
+            db_id: ID of database
+            file_name: name of table file
+        
+        Returns:
+            offset and length in bytes or None (if not packed)
+        """
+        key = f'{db_id}/{file_name}'
+        if key not in self.index:
+            return None
+        return self.index[key]
+    
+    def read(self, db_id, file_name):
+        """ Returns content of packed file (or None).
+        
+        Args:
+            db_id: ID of database
+            file_name: name of table file
+        
+        Returns:
+            file content (bytes) or None (if not packed)
+        """
+        entry = self.entry(db_id, file_name)
+        if entry is None:
+            return None
+        offset, length = entry
+        return self.data[offset:offset+length]
+
+
+class TablePackWriter():
+    """ Packs table files one by one into a single file. """
+    
+    def __init__(self, path):
+        """ Opens pack file for writing.
+        
+        Args:
+            path: path to pack file (.pack)
+        """
+        self.path = path
+        self.file = open(path, 'wb')
+        self.entries = {}
+    
+    def __enter__(self):
+        """ Returns writer for use in with statement. """
+        return self
+    
+    def __exit__(self, *_):
+        """ Closes pack file and writes index. """
+        self.close()
+    
+    def close(self):
+        """ Closes pack file and writes index. """
+        self.file.close()
+        write_keyed_store(self.entries, self.path + '.jsonl')
+    
+    def write(self, db_id, file_name, content):
+        """ Appends content of one table file.
+        
+        Args:
+            db_id: ID of database
+            file_name: name of table file
+            content: file content (bytes)
+        """
+        key = f'{db_id}/{file_name}'
+        self.entries[key] = [self.file.tell(), len(content)]
+        self.file.write(content)
+
+
+def convert_table(csv_path, table_format):
+    """ Store copy of CSV file in other table format.
+    
+    The copy has the same column types as inferred when reading
+    the CSV file (so code processes both files in the same way).
+    
+    Args:
+        csv_path: path to CSV file with table data
+        table_format: format of copy (stored next to CSV file)
+    
+    Returns:
+        path to copy
+    """
+    df = pd.read_csv(csv_path)
+    out_path = os.path.splitext(csv_path)[0] + f'.{table_format}'
+    write_table(df, out_path)
+    return out_path
+
+
+def format_available(table_format):
+    """ Check if libraries for reading and writing table format exist.
+    
+    Args:
+        table_format: format of table files
+    
+    Returns:
+        True iff files in this format can be read and written
+    """
+    if table_format == 'csv':
+        return True
+    return importlib.util.find_spec('pyarrow') is not None
+
+
+def fresh_copy(csv_path, table_format):
+    """ Returns path to up-to-date copy of CSV file (or None).
+    
+    Args:
+        csv_path: path to CSV file with table data
+        table_format: format of copy (stored next to CSV file)
+    
+    Returns:
+        path to copy or None (if copy is missing or outdated)
+    """
+    copy_path = os.path.splitext(csv_path)[0] + f'.{table_format}'
+    if not os.path.exists(copy_path):
+        return None
+    if os.path.exists(csv_path) and \
+        os.path.getmtime(copy_path) < os.path.getmtime(csv_path):
+        return None
+    return copy_path
+
+
+def file_hash(file):
+    """ Calculates hash over file content.
+    
+    Args:
+        file: binary file object
+    
+    Returns:
+        hex digest of file content
+    """
+    digest = hashlib.sha1()
+    for chunk in iter(lambda:file.read(1 << 20), b''):
+        digest.update(chunk)
+    return digest.hexdigest()
+
+
+def data_stats(df, nr_frequent=10):
+    """ Calculates statistics for table data.
+    
+    Args:
+        df: data frame with table data
+        nr_frequent: number of most frequent values stored per column
+    
+    Returns:
+        dictionary with number of rows ('rows') and, for each column,
+        number of distinct values ('distinct'), fraction of null values
+        ('nulls'), inferred data type ('dtypes'), value range of numeric
+        columns ('min', 'max'), and most frequent values with their
+        counts ('frequent')
+    """
+    numeric = [
+        c for c in df.columns if pd.api.types.is_numeric_dtype(df[c]) 
+        and not pd.api.types.is_bool_dtype(df[c]) and df[c].notna().any()]
+    stats = {
+        'rows':len(df),
+        'distinct':{c:int(df[c].nunique()) for c in df.columns},
+        'nulls':{
+            c:float(df[c].isna().mean()) if len(df) else 0.0 
+            for c in df.columns},
+        'dtypes':{c:str(df[c].dtype) for c in df.columns},
+        'min':{c:df[c].min().item() for c in numeric},
+        'max':{c:df[c].max().item() for c in numeric},
+        'frequent':{}}
+    for column in df.columns:
+        counts = df[column].value_counts().head(nr_frequent)
+        stats['frequent'][column] = [
+            [getattr(v, 'item', lambda:v)(), int(n)] 
+            for v, n in counts.items()]
+    return stats
+
+
+def read_table(source, nrows=None, dtype=None, table_format=None):
+    """ Read table data from file, depending on its format.
+    
+    Args:
+        source: path to table file or binary file object
+        nrows: read at most that many rows (default: all)
+        dtype: types of columns in CSV files (default: inferred)
+        table_format: format of table file (default: by file extension)
+    
+    Returns:
+        data frame with table data
+    """
+    table_format = table_format or table_file_format(source)
+    if table_format == 'csv':
+        return pd.read_csv(source, nrows=nrows, dtype=dtype)
+    df = getattr(pd, table_readers[table_format])(source)
+    return df if nrows is None else df.head(nrows)
+
+
+def table_file_format(file_name):
+    """ Returns format of table file (by its extension).
+    
+    Args:
+        file_name: name or path of table file
+    
+    Returns:
+        table format (CSV by default)
+    """
+    extension = os.path.splitext(file_name)[1][1:].lower()
+    return extension if extension in table_readers else 'csv'
+
+
+def typed_schema(schema):
+    """ Returns typed schema for JSON object describing schema.
+    
+    Args:
+        schema: typed schema or JSON object (e.g., from result file)
+    
+    Returns:
+        schema as DbSchema object
+    """
+    return schema if isinstance(schema, DbSchema) else DbSchema(schema)
+
+
+def write_keyed_store(entries, path):
+    """ Write objects into indexed store (see KeyedStore).
+    
+    Output only depends on the objects, so processes writing the same
+    objects concurrently do not interfere with each other.
+    
+    Args:
+        entries: maps keys (strings) to objects
+        path: path to store file (.jsonl), index is stored next to it
+    """
+    offsets = []
+    data_dir = os.path.dirname(path) or '.'
+    fd, tmp_path = tempfile.mkstemp(dir=data_dir, suffix='.tmp')
+    os.fchmod(fd, file_mode)
+    with os.fdopen(fd, 'wb') as file:
+        for key in sorted(entries):
+            offsets.append(file.tell())
+            line = json.dumps(key) + '\t' + json.dumps(entries[key])
+            file.write((line + '\n').encode())
+    fd, tmp_index_path = tempfile.mkstemp(dir=data_dir, suffix='.tmp')
+    os.fchmod(fd, file_mode)
+    with os.fdopen(fd, 'wb') as file:
+        np.array(offsets, dtype='int64').tofile(file)
+    os.replace(tmp_index_path, path + '.idx')
+    os.replace(tmp_path, path)
+
+
+def write_table(df, path):
+    """ Write table data into file, depending on its format.
+    
+    Args:
+        df: data frame with table data
+        path: path to table file (format given by file extension)
+    """
+    table_format = table_file_format(path)
+    if table_format == 'csv':
+        df.to_csv(path, index=False)
+    elif table_format == 'parquet':
+        df.to_parquet(path, index=False)
+    else:
+        df.reset_index(drop=True).to_feather(path)
+
+
+def write_schema_store(schemata, path):
+    """ Write schemata into indexed store (see SchemaStore).
+    
+    Args:
+        schemata: maps database IDs to schemata
+        path: path to schema file (.jsonl), index is stored next to it
+    """
+    write_keyed_store(schemata, path)
+
+
+if __name__ == '__main__':
+    
+    parser = argparse.ArgumentParser()
+    parser.add_argument('data_dir', type=str, help='Data directory')
+    parser.add_argument(
+        '--table_format', type=str, default='csv', 
+        choices=list(table_readers), 
+        help='Store copies of table files in this format')
+    parser.add_argument(
+        '--pack', action='store_true', 
+        help='Pack table files into one file (for many small tables)')
+    args = parser.parse_args()
+    
+    catalog = DbCatalog(args.data_dir, args.table_format)
+    catalog.convert()
+    if args.pack:
+        catalog.pack()
+    catalog.update_stats()
+    print(f'Statistics stored in {catalog.stats_path}')
@@ -4,18 +4,26 @@ Created on Jan 17, 2022
 @author: immanueltrummer
 '''
 import abc
+import codexdb.backend
+import codexdb.catalog
 import codexdb.plan
 import numpy as np
 import openai.error
-import pandas as pd
 import random
 import re
 import time
 
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
 class CodeGenerator(abc.ABC):
     """ Generates code in different languages using OpenAI. """
     
-    def __init__(self, catalog, examples, nr_samples, prompt_style, model_id):
+    def __init__(
+            self, catalog, examples, nr_samples, 
+            prompt_style, model_id, stream=False, backend=None):
         """ Initializes with examples for few-shot learning.
         
         Args:
@@ -24,21 +32,27 @@ class CodeGenerator(abc.ABC):
             nr_samples: maximal number of examples to use.
             prompt_style: style of prompt to generate
             model_id: OpenAI model to use for generation
+            stream: whether to stream completions token by token
+            backend: completion backend (default: OpenAI)
         """
         self.catalog = catalog
         self.examples = examples
         self.nr_samples = nr_samples
         self.prompt_style = prompt_style
         self.ai_kwargs = {'model':model_id}
+        self.stream = stream
+        self.backend = backend or codexdb.backend.OpenAIBackend()
         self.code_prefix = ''
         self.code_suffix = ''
     
-    def generate(self, test_case, temperature):
+    def generate(self, test_case, temperature, on_code=None, correction=None):
         """ Generate code to solve given test case.
         
         Args:
             test_case: generate code solving this test case
             temperature: degree of randomness during generation
+            on_code: called with partial code while streaming
+            correction: additional instruction for generated code (optional)
         
         Returns:
             statistics, generated code
@@ -50,18 +64,20 @@ class CodeGenerator(abc.ABC):
         db_dir = self.catalog.db_dir(db_id)
         question = test_case['question']
         query = test_case['query']
-        suffix = self.get_prompt(schema, db_dir, files, question, query)
+        suffix = self.get_prompt(
+            schema, db_dir, files, question, query, correction)
         prompt = prefix + '\n' + suffix
-        stats, gen_code = self._complete(prompt, temperature)
+        stats, gen_code = self._complete(prompt, temperature, on_code)
         final_code = self.code_prefix + gen_code + self.code_suffix
         return stats, final_code
 
-    def _complete(self, prompt, temperature):
+    def _complete(self, prompt, temperature, on_code=None):
         """ Generate code by completing given prompt. 
         
         Args:
             prompt: initiate generation with this prompt
             temperature: degree of randomness
+            on_code: called with partial code while streaming
         
         Returns:
             statistics, generated code
@@ -73,18 +89,23 @@ class CodeGenerator(abc.ABC):
             try:
                 print(f'\nPrompt:\n*******\n{prompt}\n*******')
                 start_s = time.time()
-                response = openai.ChatCompletion.create(
-                    messages=[
-                        {'role':'system', 
-                         'content':'You write Python code, implementing Python comments.'},
-                        {'role':'user', 'content':prompt}],
-                    temperature=temperature,
-                    **self.ai_kwargs)
-                completion = self._extract_code(response)
+                messages = [
+                    {'role':'system', 
+                     'content':'You write Python code, implementing Python comments.'},
+                    {'role':'user', 'content':prompt}]
+                if self.stream:
+                    completion = self._stream_code(
+                        messages, temperature, start_s, stats, on_code)
+                else:
+                    response = self.backend.create(
+                        messages, temperature, **self.ai_kwargs)
+                    completion = self._extract_code(response)
+                    usage = response['usage']
+                    stats['prompt_tokens'] = usage['prompt_tokens']
+                    stats['completion_tokens'] = usage['completion_tokens']
+                    if 'hedge' in response:
+                        stats['hedge'] = response['hedge']
                 total_s = time.time() - start_s
-                usage = response['usage']
-                stats['prompt_tokens'] = usage['prompt_tokens']
-                stats['completion_tokens'] = usage['completion_tokens']
                 stats['last_request_s'] = total_s
                 stats['error'] = False
                 return stats, completion
@@ -102,19 +123,21 @@ class CodeGenerator(abc.ABC):
                 stats['error'] = True
         return stats, ''
     
-    def _db_sample(self, db_dir, file_name, max_rows):
-        """ Returns data sample from specified file. 
+    def _db_sample(self, schema, table, max_rows, dtypes):
+        """ Returns data sample from specified table (packed or not). 
         
         Args:
-            db_dir: directory containing database data
-            file_name: name of file within directory
+            schema: schema of database containing table
+            table: name of table
             max_rows: maximal number of sample rows
+            dtypes: maps columns to data types inferred over all rows
         
         Returns:
             list of string representing sample rows
         """
         lines = []
-        df = pd.read_csv(f'{db_dir}/{file_name}')
+        df = self.catalog.table_data(
+            schema.db_id, table, nrows=max_rows, dtype=dtypes)
         nr_rows = df.shape[0]
         nr_cols = df.shape[1]
         for row_idx in range(min(max_rows, nr_rows)):
@@ -128,6 +151,19 @@ class CodeGenerator(abc.ABC):
             lines.append(','.join(row_parts))
         return lines
     
+    def _table_dtypes(self, schema, table):
+        """ Returns data types of table columns from catalog statistics.
+        
+        Args:
+            schema: description of database schema
+            table: name of table
+        
+        Returns:
+            dictionary mapping columns to data types
+        """
+        stats = self.catalog.table_stats(schema.db_id, table)
+        return stats['dtypes']
+    
     def _extract_code(self, response):
         """ Extract Python code from LLM answer.
         
@@ -138,14 +174,124 @@ class CodeGenerator(abc.ABC):
             answer extract containing Python code.
         """
         completion = response['choices'][0]['message']['content']
+        return self._extract_snippet(completion)
+    
+    def _extract_snippet(self, completion):
+        """ Extract Python code from text generated by the LLM.
+        
+        Args:
+            completion: text generated by the LLM.
+        
+        Returns:
+            code between Python fences or full text.
+        """
         snippets = re.findall('```python(.*)```', completion, re.DOTALL)
         if snippets:
             completion = snippets[0]
         
         return completion
     
+    def _partial_code(self, completion):
+        """ Extract code from partial completion received so far.
+        
+        Args:
+            completion: prefix of text generated by the LLM
+        
+        Returns:
+            code received so far, flag indicating whether code is complete
+        """
+        stops = self.ai_kwargs.get('stop') or []
+        if isinstance(stops, str):
+            stops = [stops]
+        for stop in stops:
+            stop_idx = completion.find(stop)
+            if stop_idx >= 0:
+                return self._extract_snippet(completion[:stop_idx]), True
+        
+        start_idx = completion.find('```python')
+        if start_idx < 0:
+            return completion, False
+        code = completion[start_idx + len('```python'):]
+        end_idx = code.find('```')
+        if end_idx < 0:
+            return code, False
+        return code[:end_idx], True
+    
+    def _stream_code(self, messages, temperature, start_s, stats, on_code):
+        """ Stream completion and stop as soon as code is complete.
+        
+        Args:
+            messages: chat messages to complete
+            temperature: degree of randomness
+            start_s: start time of request in seconds
+            stats: add streaming statistics to this dictionary
+            on_code: called with partial code after each chunk
+        
+        Returns:
+            generated code
+        """
+        chunks = self.backend.create(
+            messages, temperature, stream=True, 
+            stream_options={'include_usage':True}, **self.ai_kwargs)
+        completion = ''
+        code = ''
+        nr_chunks = 0
+        complete = False
+        usage = None
+        for chunk in chunks:
+            if 'hedge' in chunk:
+                stats['hedge'] = chunk['hedge']
+            if chunk.get('usage'):
+                usage = chunk['usage']
+            if not chunk['choices']:
+                continue
+            delta = chunk['choices'][0]['delta'].get('content')
+            if not delta:
+                continue
+            if nr_chunks == 0:
+                stats['first_token_s'] = time.time() - start_s
+            nr_chunks += 1
+            completion += delta
+            code, complete = self._partial_code(completion)
+            if on_code is not None:
+                on_code(code)
+            if complete:
+                break
+        
+        if hasattr(chunks, 'close'):
+            chunks.close()
+        if usage is not None:
+            stats['prompt_tokens'] = usage['prompt_tokens']
+            stats['completion_tokens'] = usage['completion_tokens']
+        else:
+            # Usage is only reported at the end of complete streams
+            prompt = ''.join(m['content'] for m in messages)
+            stats['prompt_tokens'] = self._count_tokens(prompt)
+            stats['completion_tokens'] = self._count_tokens(completion)
+            stats['tokens_estimated'] = tiktoken is None
+        stats['stopped_early'] = complete
+        return code
+    
+    def _count_tokens(self, text):
+        """ Count tokens in text (estimated without tiktoken).
+        
+        Args:
+            text: count tokens in this text
+        
+        Returns:
+            number of tokens (integer)
+        """
+        if tiktoken is None:
+            return (len(text) + 3) // 4
+        try:
+            encoding = tiktoken.encoding_for_model(self.ai_kwargs['model'])
+        except KeyError:
+            encoding = tiktoken.get_encoding('cl100k_base')
+        return len(encoding.encode(text))
+    
     @abc.abstractmethod
-    def get_prompt(self, schema, db_dir, files, question, query):
+    def get_prompt(
+            self, schema, db_dir, files, question, query, correction=None):
         """ Generate prompt for processing specific query. 
         
         Args:
@@ -154,6 +300,7 @@ class CodeGenerator(abc.ABC):
             files: location of data files for tables
             question: natural language query
             query: SQL translation of query
+            correction: additional instruction for generated code (optional)
         
         Returns:
             Prompt for generating code for executing query
@@ -173,7 +320,9 @@ class CodeGenerator(abc.ABC):
 class PythonGenerator(CodeGenerator):
     """ Generates Python code to solve database queries. """
     
-    def __init__(self, *pargs, id_case, mod_start, mod_between, mod_end):
+    def __init__(
+            self, *pargs, id_case, mod_start, 
+            mod_between, mod_end, optimize_plans=False, **kwargs):
         """ Initializes for Python code generation.
         
         Args:
@@ -182,11 +331,14 @@ class PythonGenerator(CodeGenerator):
             mod_start: modification at start of query plan
             mod_between: modifications between plan steps
             mod_end: modifications at end of query plan
+            optimize_plans: whether to order plan steps via data statistics
+            kwargs: keyword arguments of super class constructor
         """
-        super().__init__(*pargs)
+        super().__init__(*pargs, **kwargs)
         self.ai_kwargs['max_tokens'] = 800
         self.ai_kwargs['stop'] = '"""'
-        self.planner = codexdb.plan.NlPlanner(id_case)
+        plan_catalog = self.catalog if optimize_plans else None
+        self.planner = codexdb.plan.NlPlanner(id_case, catalog=plan_catalog)
         self.id_case = id_case
         self.mod_start = mod_start
         self.mod_between = mod_between
@@ -207,8 +359,7 @@ class PythonGenerator(CodeGenerator):
             list of description lines
         """
         lines = []
-        tables = schema['table_names_original']
-        all_columns = schema['column_names_original']
+        tables = schema.tables
         nr_tables = len(tables)
         for tbl_idx in range(nr_tables):
             filename = files[tbl_idx]
@@ -220,21 +371,21 @@ class PythonGenerator(CodeGenerator):
             if self.prompt_style == 'data':
                 
                 lines.append(f'Sample from table {tbl_name}, stored in "{filename}":')
-                df = pd.read_csv(f'{db_dir}/{filename}')
+                dtypes = self._table_dtypes(schema, tables[tbl_idx])
                 headers = []
-                for col_name in df.columns:
+                for col_name in dtypes.keys():
                     if not self.id_case:
                         col_name = col_name.lower()
                     header = f'"{col_name}"'
                     headers.append(header)
                 lines.append(','.join(headers))
                 
-                file_name = files[tbl_idx]
-                lines += self._db_sample(db_dir, file_name, max_rows)
+                lines += self._db_sample(
+                    schema, tables[tbl_idx], max_rows, dtypes)
                 
                 type_items = []
-                for col_name, col_type in zip(df.columns, df.dtypes):
-                    if np.issubdtype(col_type, np.number):
+                for col_name, col_type in dtypes.items():
+                    if np.issubdtype(np.dtype(col_type), np.number):
                         print_type = 'numeric' 
                     else:
                         print_type = 'text'
@@ -243,9 +394,10 @@ class PythonGenerator(CodeGenerator):
                 lines.append('Column types: ' + ', '.join(type_items))
                     
             else:
-                table_columns = [c[1] for c in all_columns if c[0] == tbl_idx]
-                if not self.id_case:
-                    table_columns = [c.lower() for c in table_columns]
+                if self.id_case:
+                    table_columns = schema.table_columns[tbl_idx]
+                else:
+                    table_columns = schema.lower_columns[tbl_idx]
                 quoted_columns = ["'" + c + "'" for c in table_columns]
                 col_list = ','.join(quoted_columns)
                 line = f'Table {tbl_name} with columns {col_list}, ' \
@@ -254,7 +406,8 @@ class PythonGenerator(CodeGenerator):
                 
         return lines
     
-    def get_prompt(self, schema, db_dir, files, question, query):
+    def get_prompt(
+            self, schema, db_dir, files, question, query, correction=None):
         """ Generate prompt for processing specific query. 
         
         Args:
@@ -263,10 +416,12 @@ class PythonGenerator(CodeGenerator):
             files: location of data files for tables
             question: natural language query
             query: SQL translation of query
+            correction: additional instruction for generated code (optional)
         
         Returns:
             Prompt for generating code for executing query
         """
+        schema = codexdb.catalog.typed_schema(schema)
         prompt_parts = []
         prompt_parts.append('"""')
         prompt_parts += self._db_info(schema, db_dir, files, 5)
@@ -281,23 +436,26 @@ class PythonGenerator(CodeGenerator):
                     prompt_parts.append(f'Between steps: {self.mod_between}')
                 if self.mod_start:
                     prompt_parts.append(self.mod_start)
+                if correction:
+                    prompt_parts.append(correction)
                 if self.mod_end:
                     prompt_parts.append(self.mod_end)
             else:
+                mod_start = self.mod_start
+                if correction:
+                    mod_start = ' '.join(m for m in [mod_start, correction] if m)
                 prompt_parts.append('Processing steps:')
-                plan = self.planner.plan(query)
-                if self.mod_between:
-                    plan.intersperse_step([self.mod_between])
-                if self.mod_start:
-                    plan.add_step([self.mod_start], False)
-                if self.mod_end:
-                    plan.add_step([self.mod_end])
-                prompt_parts += plan.steps()
+                prompt_parts += self.planner.plan_steps(
+                    query, mod_start, self.mod_between, self.mod_end, 
+                    db_id=schema.db_id)
         else:
             prompt_parts.append(f'Query: "{question}".')
-            prompt_parts.append('1. Import pandas library.')
-            prompt_parts.append('2. Calculate query answer.')
-            prompt_parts.append("3. Store result in 'result.csv'.")
+            steps = ['Import pandas library.', 'Calculate query answer.']
+            if correction:
+                steps.append(correction)
+            steps.append("Store result in 'result.csv'.")
+            for step_idx, step in enumerate(steps, 1):
+                prompt_parts.append(f'{step_idx}. {step}')
         prompt_parts.append('"""')
         return '\n'.join(prompt_parts)
     
@@ -326,35 +484,38 @@ class PythonGenerator(CodeGenerator):
 class SqlGenerator(CodeGenerator):
     """ Translates natural language questions into SQL queries. """
     
-    def __init__(self, *kwargs):
+    def __init__(self, *pargs, **kwargs):
         """ Initializes for SQL query generation.
         
         Args:
-            kwargs: arguments for super class constructor
+            pargs: arguments for super class constructor
+            kwargs: keyword arguments for super class constructor
         """
-        super().__init__(*kwargs)
+        super().__init__(*pargs, **kwargs)
         self.ai_kwargs['max_tokens'] = 150
         self.ai_kwargs['stop'] = ['#', ';']
         self.code_prefix = 'SELECT '
     
-    def get_prompt(self, schema, db_dir, files, question, query):
-        """ Returns prompt for given question. """
+    def get_prompt(
+            self, schema, db_dir, files, question, query, correction=None):
+        """ Returns prompt for given question and optional correction. """
+        schema = codexdb.catalog.typed_schema(schema)
         lines = []
         lines.append('### Postgres SQL tables, with their properties:')
         lines.append('#')
         
-        tables = schema['table_names_original']
-        all_columns = schema['column_names_original']
-        for idx, table in enumerate(tables):
-            cols = [c[1].replace(' ', '_') for c in all_columns if c[0] == idx]
+        for idx, table in enumerate(schema.tables):
+            cols = [c.replace(' ', '_') for c in schema.table_columns[idx]]
             lines.append(f'# {table}({",".join(cols)})')
             if self.prompt_style == 'data':
                 #lines.append(f'Sample rows from {table}:')
-                file_name = files[idx]
-                sample = self._db_sample(db_dir, file_name, 5)
+                dtypes = self._table_dtypes(schema, table)
+                sample = self._db_sample(schema, table, 5, dtypes)
                 lines += ['# ' + s for s in sample]
 
         lines.append('#')
+        if correction:
+            lines.append(f'### {correction}')
         lines.append(f'### Query: "{question}"')
         lines.append('SELECT')
         return '\n'.join(lines)
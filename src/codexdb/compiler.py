@@ -0,0 +1,673 @@
+import codexdb.catalog
+import copy
+import re
+import sqlglot
+import sqlglot.expressions
+import traceback
+
+
+# Maps SQL aggregates to pandas aggregation methods
+agg_methods = {
+    'avg':'mean', 'sum':'sum', 'min':'min', 'max':'max', 'count':'count'}
+
+# Maps binary SQL operators to pandas operators
+binary_ops = {
+    'eq':'==', 'neq':'!=', 'gt':'>', 'gte':'>=', 'lt':'<', 'lte':'<=',
+    'and':'&', 'or':'|', 'add':'+', 'sub':'-', 'mul':'*'}
+
+# Keys of expressions representing (sub-)queries
+query_keys = {'select', 'union', 'intersect', 'except'}
+
+# Adapts literals to the type of compared columns (as loaded)
+coerce_code = '''def coerce(column, value):
+    numeric = pd.api.types.is_numeric_dtype(
+        getattr(column, 'dtype', type(column)))
+    if numeric and isinstance(value, str):
+        try:
+            return float(value)
+        except ValueError:
+            return value
+    if not numeric and not isinstance(value, str):
+        return str(value)
+    return value'''
+
+
+class PandasCompiler():
+    """ Translates SQL queries into pandas code without using the LLM.
+
+    Supports queries on one database with inner joins, filters,
+    aggregation (with or without grouping), ordering, limits, set
+    operations, and uncorrelated sub-queries. Compiling other
+    queries raises a ValueError. A compiler collects code for one
+    query at a time (i.e., it must not be shared between threads).
+    """
+
+    def __init__(self, schema, files, id_case):
+        """ Initializes for given database.
+
+        Args:
+            schema: schema of queried database
+            files: names of files storing tables
+            id_case: whether to consider letter case for identifiers
+        """
+        self.schema = codexdb.catalog.typed_schema(schema)
+        self.files = files
+        self.id_case = id_case
+        self.lines = []
+        self.nr_vars = 0
+        self.names = {}
+        self.coerced = False
+
+    def compile(self, query):
+        """ Generate pandas code processing given query.
+
+        Args:
+            query: SQL query to translate
+
+        Returns:
+            Python code writing query result to 'result.csv'
+        """
+        try:
+            expression = sqlglot.parse_one(query)
+        except Exception as e:
+            raise ValueError(f'Cannot parse query {query}: {e}')
+        self.lines = ['import pandas as pd']
+        self.nr_vars = 0
+        self.names = {}
+        self.coerced = False
+        result = self._query(expression)
+        if self.coerced:
+            self.lines.insert(1, coerce_code)
+        self.lines.append(f"{result}.to_csv('result.csv', index=False)")
+        return '\n'.join(self.lines)
+
+    def _aggregates(self, node):
+        """ Returns aggregates in expression (outside of sub-queries). """
+        if isinstance(node, (str, type(None))) or node.key in query_keys:
+            return []
+        if node.key in agg_methods:
+            return [node]
+        aggregates = []
+        for child in self._children(node):
+            aggregates += self._aggregates(child)
+        return aggregates
+
+    def _assign(self, code):
+        """ Add assignment of code to new variable and return variable. """
+        var = f'df{self.nr_vars}'
+        self.nr_vars += 1
+        self.lines.append(f'{var} = {code}')
+        return var
+
+    def _bare_labels(self, node, scope):
+        """ Returns labels of columns referenced outside of aggregates. """
+        if isinstance(node, str):
+            return [node]
+        if node is None or node.key in query_keys or \
+            node.key in agg_methods:
+            return []
+        if node.key == 'column':
+            resolved = self._resolve(node, scope)
+            return [] if resolved is None else [resolved[0]]
+        labels = []
+        for child in self._children(node):
+            labels += self._bare_labels(child, scope)
+        return labels
+
+    def _children(self, node):
+        """ Returns child expressions of given expression. """
+        children = []
+        for value in node.args.values():
+            values = value if isinstance(value, list) else [value]
+            for child in values:
+                if isinstance(child, sqlglot.expressions.Expression):
+                    children.append(child)
+        return children
+
+    def _column_expr(self, node, ctx):
+        """ Translate column reference (or quoted string). """
+        resolved = self._resolve(node, ctx['scope'])
+        if resolved is not None:
+            return self._label_expr(resolved[0], ctx)
+        identifier = node.args['this']
+        if identifier.args.get('quoted') and node.args.get('table') is None:
+            return repr(identifier.args['this'])
+        raise ValueError(f'Cannot resolve column {node.sql()}')
+
+    def _comparison(self, node, ctx):
+        """ Translate comparison, adapting literals to column types.
+
+        Literals are converted when the code runs, depending on the
+        type of the column as loaded (columns declared as text may
+        contain numbers). As in SQL, comparisons with missing values
+        are not satisfied.
+        """
+        operands = [node.args['this'], node.args['expression']]
+        codes = [self._expr(operand, ctx) for operand in operands]
+        for idx in range(2):
+            column, literal = operands[idx], operands[1-idx]
+            if column.key == 'column' and literal.key == 'literal':
+                codes[1-idx] = f'coerce({codes[idx]}, {codes[1-idx]})'
+                self.coerced = True
+        op = binary_ops[node.key]
+        guards = [
+            f' & pd.notna({code})' for operand, code in 
+            zip(operands, codes) if operand.key != 'literal']
+        return f'(({codes[0]} {op} {codes[1]}){"".join(guards)})'
+
+    def _conjuncts(self, node):
+        """ Split predicate into conjuncts. """
+        if node.key == 'and':
+            return self._conjuncts(node.args['this']) + \
+                self._conjuncts(node.args['expression'])
+        return [node]
+
+    def _expr(self, node, ctx):
+        """ Translate SQL expression into pandas expression.
+
+        Args:
+            node: SQL expression or label of frame column
+            ctx: context with frame, scope, and aggregates
+
+        Returns:
+            pandas expression (string)
+        """
+        E = sqlglot.expressions
+        if isinstance(node, str):
+            return self._label_expr(node, ctx)
+        if isinstance(node, E.Column):
+            return self._column_expr(node, ctx)
+        if isinstance(node, E.Literal):
+            value = node.args['this']
+            if node.args.get('is_string'):
+                return repr(value)
+            return value
+        if isinstance(node, E.Null):
+            return 'None'
+        if node.key in agg_methods:
+            return self._aggregate_expr(node, ctx)
+        if isinstance(node, E.Paren):
+            inner = node.args['this']
+            if inner.key in query_keys:
+                return f'{self._query(inner)}.iloc[0, 0]'
+            return f'({self._expr(inner, ctx)})'
+        if node.key in ['eq', 'neq', 'gt', 'gte', 'lt', 'lte']:
+            return self._comparison(node, ctx)
+        if node.key in binary_ops:
+            left = self._expr(node.args['this'], ctx)
+            right = self._expr(node.args['expression'], ctx)
+            return f'({left} {binary_ops[node.key]} {right})'
+        if isinstance(node, E.Not):
+            inner = node.args['this']
+            if inner.key in ['column', 'literal']:
+                raise ValueError(f'Unsupported negation: {node.sql()}')
+            return f'(~{self._expr(inner, ctx)})'
+        if isinstance(node, E.Neg):
+            return f'(-{self._expr(node.args["this"], ctx)})'
+        if isinstance(node, E.Between):
+            op = self._expr(node.args['this'], ctx)
+            low = self._expr(node.args['low'], ctx)
+            high = self._expr(node.args['high'], ctx)
+            return f'{op}.between({low}, {high})'
+        if isinstance(node, E.In):
+            op = self._expr(node.args['this'], ctx)
+            sub_query = node.args.get('query')
+            if sub_query is not None:
+                return f'{op}.isin({self._query(sub_query)}.iloc[:, 0])'
+            items = [self._expr(e, ctx) for e in node.args['expressions']]
+            return f'{op}.isin([{", ".join(items)}])'
+        if isinstance(node, E.Like):
+            op = self._expr(node.args['this'], ctx)
+            pattern = node.args['expression']
+            if pattern.key != 'literal':
+                raise ValueError(f'Unsupported pattern: {pattern.sql()}')
+            regex = like_regex(pattern.args['this'])
+            return f'{op}.str.fullmatch({regex!r}, case=False, na=False)'
+        if isinstance(node, E.Is):
+            op = self._expr(node.args['this'], ctx)
+            other = node.args['expression']
+            if isinstance(other, E.Null):
+                return f'{op}.isna()'
+            if isinstance(other, E.Not) and \
+                isinstance(other.args['this'], E.Null):
+                return f'{op}.notna()'
+        raise ValueError(f'Unsupported expression: {node.sql()}')
+
+    def _aggregate_expr(self, node, ctx):
+        """ Translate aggregate, depending on aggregation context. """
+        aggregates = ctx.get('aggregates')
+        if aggregates is None:
+            raise ValueError(f'Aggregate not allowed here: {node.sql()}')
+        if node.sql() in aggregates:
+            return aggregates[node.sql()]
+
+        # Aggregation over all rows of frame
+        frame = ctx['frame']
+        arg = node.args['this']
+        if node.key == 'count' and self._is_star(arg):
+            return f'len({frame})'
+        plain_ctx = {'frame':frame, 'scope':ctx['scope']}
+        arg_code = self._expr(arg, plain_ctx)
+        if node.key == 'count' and node.args.get('distinct'):
+            return f'{arg_code}.nunique()'
+        if node.key == 'sum':
+            # Sum over no values is null in SQL
+            return f'{arg_code}.sum(min_count=1)'
+        return f'{arg_code}.{agg_methods[node.key]}()'
+
+    def _from(self, select, scope):
+        """ Add code loading and joining tables, return frame variable. """
+        nr_from = len(select.args['from'].args['expressions'])
+        frame = self._load(*scope[0])
+        for alias, tbl_idx in scope[1:nr_from]:
+            table = self._load(alias, tbl_idx)
+            frame = self._assign(f"{frame}.merge({table}, how='cross')")
+
+        joins = select.args.get('joins') or []
+        for join_idx, join in enumerate(joins, nr_from):
+            if join.args.get('side') or join.args.get('kind'):
+                raise ValueError(f'Unsupported join: {join.sql()}')
+            left_scope = scope[:join_idx]
+            right_scope = [scope[join_idx]]
+            table = self._load(*scope[join_idx])
+            condition = join.args.get('on')
+            conjuncts = self._conjuncts(condition) if condition else []
+            left_keys = []
+            right_keys = []
+            others = []
+            for conjunct in conjuncts:
+                keys = self._join_keys(conjunct, left_scope, right_scope)
+                if keys is None:
+                    others.append(conjunct)
+                else:
+                    left_keys.append(keys[0])
+                    right_keys.append(keys[1])
+            if left_keys:
+                frame = self._assign(
+                    f'{frame}.merge({table}, left_on={left_keys!r}, '
+                    f'right_on={right_keys!r})')
+            else:
+                frame = self._assign(f"{frame}.merge({table}, how='cross')")
+            for conjunct in others:
+                ctx = {'frame':frame, 'scope':scope[:join_idx+1]}
+                predicate = self._expr(conjunct, ctx)
+                frame = self._assign(f'{frame}[{predicate}]')
+        return frame
+
+    def _group(self, frame, scope, group, aggregates, bare_labels):
+        """ Add code for grouping and aggregation, return context. """
+        keys = []
+        for key in group.args['expressions']:
+            resolved = self._resolve(key, scope) \
+                if key.key == 'column' else None
+            if resolved is None:
+                raise ValueError(f'Unsupported group key: {key.sql()}')
+            keys.append(resolved[0])
+
+        named = {}
+        agg_names = {}
+        for aggregate in aggregates:
+            if aggregate.sql() in agg_names:
+                continue
+            name = f'_a{len(agg_names)}'
+            agg_names[aggregate.sql()] = name
+            arg = aggregate.args['this']
+            if aggregate.key == 'count' and self._is_star(arg):
+                named[name] = (keys[0], 'size')
+                continue
+            resolved = self._resolve(arg, scope) \
+                if arg.key == 'column' else None
+            if resolved is None:
+                raise ValueError(f'Unsupported aggregate: {aggregate.sql()}')
+            method = agg_methods[aggregate.key]
+            if aggregate.key == 'count' and aggregate.args.get('distinct'):
+                method = 'nunique'
+            named[name] = (resolved[0], method)
+
+        bare_labels = [l for l in dict.fromkeys(bare_labels) if l not in keys]
+        if bare_labels and any(a.key in ['min', 'max'] for a in aggregates):
+            raise ValueError('Unsupported columns with min/max aggregate')
+        label_names = {label:label for label in keys}
+        for label in bare_labels:
+            name = f'_b{len(label_names) - len(keys)}'
+            named[name] = (label, 'first')
+            label_names[label] = name
+        if not named:
+            named['_size'] = (keys[0], 'size')
+
+        named_args = ', '.join(f'{n}={a!r}' for n, a in named.items())
+        grouped = self._assign(
+            f'{frame}.groupby({keys!r}, sort=False, dropna=False)'
+            f'.agg({named_args}).reset_index()')
+        return {
+            'frame':grouped, 'scope':scope,
+            'labels':{l:f"{grouped}['{n}']" for l, n in label_names.items()},
+            'aggregates':{s:f"{grouped}['{n}']" for s, n in agg_names.items()}}
+
+    def _id(self, name):
+        """ Returns identifier as used in data files. """
+        return name if self.id_case else name.lower()
+
+    def _is_star(self, node):
+        """ Check if expression refers to all columns. """
+        return isinstance(node, sqlglot.expressions.Star) or (
+            isinstance(node, sqlglot.expressions.Column) and
+            isinstance(node.args['this'], sqlglot.expressions.Star))
+
+    def _join_keys(self, conjunct, left_scope, right_scope):
+        """ Returns labels of left and right join keys or None. """
+        if conjunct.key != 'eq':
+            return None
+        operands = [conjunct.args['this'], conjunct.args['expression']]
+        if any(o.key != 'column' for o in operands):
+            return None
+        for left, right in [operands, reversed(operands)]:
+            left_col = self._resolve(left, left_scope)
+            right_col = self._resolve(right, right_scope)
+            if left_col is not None and right_col is not None:
+                return left_col[0], right_col[0]
+        return None
+
+    def _label_expr(self, label, ctx):
+        """ Translate reference to column with given label. """
+        labels = ctx.get('labels')
+        if labels is None:
+            return f"{ctx['frame']}['{label}']"
+        if label not in labels:
+            raise ValueError(f'Column {label} not available')
+        return labels[label]
+
+    def _load(self, alias, tbl_idx):
+        """ Add code loading table, return frame variable. """
+        file_name = self._id(self.files[tbl_idx])
+        table_format = codexdb.catalog.table_file_format(file_name)
+        reader = codexdb.catalog.table_readers[table_format]
+        return self._assign(
+            f"pd.{reader}('{file_name}').add_prefix('{alias}.')")
+
+    def _order(self, frame, keys, ascending):
+        """ Add code sorting frame by given columns. """
+        na_position = 'first' if ascending[0] else 'last'
+        return self._assign(
+            f'{frame}.sort_values({keys!r}, ascending={ascending!r}, '
+            f"na_position='{na_position}', kind='stable')")
+
+    def _outputs(self, select, scope):
+        """ Returns names and expressions (or labels) of output columns. """
+        outputs = []
+        for node in select.args['expressions']:
+            if node.key == 'alias':
+                alias = node.args['alias'].args['this']
+                outputs.append((alias, node.args['this']))
+            elif self._is_star(node):
+                table = node.args.get('table')
+                for alias, tbl_idx in scope:
+                    if table is not None and \
+                        table.args['this'].lower() != alias:
+                        continue
+                    for name in self.schema.table_columns[tbl_idx]:
+                        label = f'{alias}.{self._id(name)}'
+                        outputs.append((self._id(name), label))
+            elif node.key == 'column':
+                outputs.append((node.args['this'].args['this'], node))
+            else:
+                outputs.append((node.sql(), node))
+        return outputs
+
+    def _query(self, expression):
+        """ Add code processing query, return frame variable. """
+        if expression.key == 'select':
+            return self._select(expression)
+        if expression.key in ['union', 'intersect', 'except']:
+            return self._set_operation(expression)
+        raise ValueError(f'Unsupported query: {expression.sql()}')
+
+    def _resolve(self, column, scope):
+        """ Returns frame label and schema type of column (or None). """
+        identifier = column.args['this']
+        if not isinstance(identifier, sqlglot.expressions.Identifier):
+            return None
+        name = identifier.args['this'].lower()
+        table = column.args.get('table')
+        qualifier = table.args['this'].lower() if table else None
+        matches = []
+        for alias, tbl_idx in scope:
+            if qualifier is not None and qualifier != alias and \
+                qualifier != self.schema.lower_tables[tbl_idx]:
+                continue
+            pos = self.schema.column_positions[tbl_idx].get(name)
+            if pos is not None:
+                col_name = self.schema.table_columns[tbl_idx][pos]
+                col_type = self.schema.column_types[tbl_idx][pos]
+                matches.append((f'{alias}.{self._id(col_name)}', col_type))
+        if len(matches) > 1:
+            raise ValueError(f'Ambiguous column {column.sql()}')
+        return matches[0] if matches else None
+
+    def _scope(self, select):
+        """ Returns aliases and indexes of tables in from clause. """
+        from_clause = select.args.get('from')
+        if from_clause is None:
+            raise ValueError(f'No tables in {select.sql()}')
+        tbl_expressions = list(from_clause.args['expressions'])
+        for join in select.args.get('joins') or []:
+            tbl_expressions.append(join.args['this'])
+
+        scope = []
+        for tbl_expression in tbl_expressions:
+            alias = None
+            if tbl_expression.key == 'alias':
+                identifier = tbl_expression.args.get('alias')
+                if identifier is None or not identifier.args.get('this'):
+                    raise ValueError(f'No alias in {tbl_expression.sql()}')
+                alias = identifier.args['this'].lower()
+                tbl_expression = tbl_expression.args['this']
+            if tbl_expression.key != 'table' or \
+                not isinstance(tbl_expression.args.get('this'), 
+                               sqlglot.expressions.Identifier):
+                raise ValueError(f'Unsupported table: {tbl_expression.sql()}')
+            name = tbl_expression.args['this'].args['this']
+            if name.lower() not in self.schema.lower_tables:
+                raise ValueError(f'Unknown table: {name}')
+            tbl_idx = self.schema.lower_tables.index(name.lower())
+            scope.append((alias or name.lower(), tbl_idx))
+        return scope
+
+    def _select(self, select):
+        """ Add code processing select query, return frame variable. """
+        scope = self._scope(select)
+        frame = self._from(select, scope)
+        ctx = {'frame':frame, 'scope':scope}
+        where = select.args.get('where')
+        if where is not None:
+            predicate = self._expr(where.args['this'], ctx)
+            frame = self._assign(f'{frame}[{predicate}]')
+            ctx = {'frame':frame, 'scope':scope}
+
+        outputs = self._outputs(select, scope)
+        aliases = {n.lower():e for n, e in outputs if isinstance(n, str)}
+        order = select.args.get('order')
+        order_items = []
+        for ordered in order.args['expressions'] if order else []:
+            node = ordered.args['this']
+            if node.key == 'column' and node.args.get('table') is None and \
+                self._resolve(node, scope) is None:
+                name = node.args['this'].args['this'].lower()
+                if name in aliases:
+                    node = aliases[name]
+            order_items.append((node, not ordered.args.get('desc')))
+        having = select.args.get('having')
+        having_node = having.args['this'] if having else None
+
+        nodes = [e for _, e in outputs] + [n for n, _ in order_items]
+        aggregates = []
+        bare_labels = []
+        for node in nodes + [having_node]:
+            aggregates += self._aggregates(node)
+            bare_labels += self._bare_labels(node, scope)
+
+        group = select.args.get('group')
+        if group is not None:
+            ctx = self._group(frame, scope, group, aggregates, bare_labels)
+        elif aggregates:
+            return self._select_aggregates(select, ctx, outputs, aggregates)
+
+        frame = ctx['frame']
+        columns = [f"'c{i}':{self._expr(e, ctx)}" for i, (_, e) in
+                   enumerate(outputs)]
+        columns += [f"'o{i}':{self._expr(n, ctx)}" for i, (n, _) in
+                    enumerate(order_items)]
+        if having_node is not None:
+            columns.append(f"'h':{self._expr(having_node, ctx)}")
+        result = self._assign(
+            f'pd.DataFrame({{{", ".join(columns)}}}, index={frame}.index)')
+        if having_node is not None:
+            result = self._assign(f"{result}[{result}['h']]")
+        out_cols = [f'c{i}' for i in range(len(outputs))]
+        if select.args.get('distinct'):
+            result = self._assign(
+                f'{result}.drop_duplicates(subset={out_cols!r})')
+        if order_items:
+            keys = [f'o{i}' for i in range(len(order_items))]
+            ascending = [a for _, a in order_items]
+            result = self._order(result, keys, ascending)
+        result = self._limit(select.args.get('limit'), result)
+        names = [n for n, _ in outputs]
+        result = self._assign(
+            f'{result}[{out_cols!r}].set_axis({names!r}, axis=1)')
+        self.names[result] = names
+        return result
+
+    def _limit(self, limit, frame):
+        """ Add code applying limit (if any) to frame. """
+        if limit is None:
+            return frame
+        count = limit.args['this']
+        if count.key != 'literal':
+            raise ValueError(f'Unsupported limit: {limit.sql()}')
+        return self._assign(f'{frame}.head({count.args["this"]})')
+
+    def _select_aggregates(self, select, ctx, outputs, aggregates):
+        """ Add code aggregating over all rows, return frame variable. """
+        if select.args.get('having') is not None:
+            raise ValueError('Unsupported having clause without grouping')
+        frame = ctx['frame']
+        bare_labels = []
+        for _, node in outputs:
+            bare_labels += self._bare_labels(node, ctx['scope'])
+
+        labels = {}
+        if bare_labels:
+            extrema = [a for a in aggregates if a.key in ['min', 'max']]
+            if len(extrema) != 1:
+                raise ValueError('Unsupported columns outside aggregates')
+            extremum = extrema[0]
+            method = 'idxmin' if extremum.key == 'min' else 'idxmax'
+            arg_code = self._expr(extremum.args['this'], ctx)
+            for label in bare_labels:
+                labels[label] = f"{frame}.loc[{arg_code}.{method}(), '{label}']"
+
+        agg_ctx = {
+            'frame':frame, 'scope':ctx['scope'],
+            'labels':labels, 'aggregates':{}}
+        columns = [f"'c{i}':[{self._expr(e, agg_ctx)}]" for i, (_, e) in
+                   enumerate(outputs)]
+        result = self._assign(f'pd.DataFrame({{{", ".join(columns)}}})')
+        result = self._limit(select.args.get('limit'), result)
+        names = [n for n, _ in outputs]
+        result = self._assign(f'{result}.set_axis({names!r}, axis=1)')
+        self.names[result] = names
+        return result
+
+    def _set_operation(self, expression):
+        """ Add code for union, intersection, or difference. """
+        right = expression.args['expression']
+        order = None
+        limit = None
+        if right.key == 'select':
+            # Order and limit of last query apply to the combined result
+            right = copy.deepcopy(right)
+            order = right.args.get('order')
+            right.args['order'] = None
+            limit = right.args.get('limit')
+            right.args['limit'] = None
+
+        left_var = self._query(expression.args['this'])
+        right_var = self._query(right)
+        aligned = f'{right_var}.set_axis({left_var}.columns, axis=1)'
+        if expression.key == 'union':
+            code = f'pd.concat([{left_var}, {aligned}], ignore_index=True)'
+            if expression.args.get('distinct'):
+                code += '.drop_duplicates()'
+            result = self._assign(code)
+        elif expression.key == 'intersect':
+            result = self._assign(
+                f'{left_var}.drop_duplicates()'
+                f'.merge({aligned}.drop_duplicates())')
+        else:
+            merged = self._assign(
+                f'{left_var}.drop_duplicates().merge('
+                f"{aligned}.drop_duplicates(), how='left', indicator=True)")
+            result = self._assign(
+                f"{merged}[{merged}['_merge'] == 'left_only']"
+                ".drop(columns='_merge')")
+
+        names = self.names[left_var]
+        if order is not None:
+            lower_names = [n.lower() for n in names]
+            keys = []
+            ascending = []
+            for ordered in order.args['expressions']:
+                node = ordered.args['this']
+                name = node.args['this'].args['this'].lower() \
+                    if node.key == 'column' else None
+                if name not in lower_names:
+                    raise ValueError(f'Unsupported order: {node.sql()}')
+                keys.append(names[lower_names.index(name)])
+                ascending.append(not ordered.args.get('desc'))
+            result = self._order(result, keys, ascending)
+        result = self._limit(limit, result)
+        self.names[result] = names
+        return result
+
+
+def compile_query(query, schema, files, id_case):
+    """ Try to translate query into pandas code.
+
+    Args:
+        query: SQL query to translate
+        schema: schema of queried database
+        files: names of files storing tables
+        id_case: whether to consider letter case for identifiers
+
+    Returns:
+        Python code processing query or None (if not supported)
+    """
+    try:
+        return PandasCompiler(schema, files, id_case).compile(query)
+    except ValueError as e:
+        print(f'Cannot compile query {query}: {e}')
+        return None
+    except Exception:
+        print(f'Error compiling query {query}:\n{traceback.format_exc()}')
+        return None
+
+
+def like_regex(pattern):
+    """ Translate SQL LIKE pattern into regular expression.
+
+    Args:
+        pattern: pattern with wildcards '%' and '_'
+
+    Returns:
+        equivalent regular expression
+    """
+    parts = []
+    for char in pattern:
+        if char == '%':
+            parts.append('.*')
+        elif char == '_':
+            parts.append('.')
+        else:
+            parts.append(re.escape(char))
+    return ''.join(parts)
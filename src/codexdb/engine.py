@@ -4,25 +4,31 @@ Created on Oct 3, 2021
 @author: immanueltrummer
 '''
 import abc
+import codexdb.catalog
+import io
 import os
 import pandas as pd
 import subprocess
 import sys
 import sqlite3
+import threading
 import time
 
 class ExecutionEngine(abc.ABC):
     """ Executes code in different languages. """
     
-    def __init__(self, catalog):
+    def __init__(self, catalog, tmp_dir=None):
         """ Initialize with database catalog and variables.
         
         Args:
             catalog: informs on database schema and file locations
+            tmp_dir: working directory (default: $CODEXDB_TMP)
         """
         self.catalog = catalog
-        self.tmp_dir = os.environ['CODEXDB_TMP']
+        self.tmp_dir = tmp_dir or os.environ['CODEXDB_TMP']
         self.result_path = f'{self.tmp_dir}/result.csv'
+        # Held during execution (code of decided races may still run)
+        self.lock = threading.Lock()
     
     @abc.abstractmethod
     def execute(self, db_id, code, timeout_s):
@@ -51,17 +57,29 @@ class ExecutionEngine(abc.ABC):
     def _copy_db(self, db_id):
         """ Copies data to a temporary directory.
         
+        Packed table files are extracted from the pack file.
+        
         Args:
             db_id: database ID
         """
         src_dir = self.catalog.db_dir(db_id)
-        for tbl_file in self.catalog.files(db_id):
+        for table in self.catalog.schema(db_id).tables:
+            tbl_file = self.catalog.file_name(db_id, table)
             src_path = f'{src_dir}/{tbl_file}'
-            if self.id_case:
+            if self.id_case and self.catalog.packed(db_id, table):
+                to_path = f'{self.tmp_dir}/{tbl_file}'
+                self.catalog.stage(db_id, table, to_path)
+            elif self.id_case:
                 cmd = f'sudo cp -r {src_path} {self.tmp_dir}'
                 os.system(cmd)
+            elif codexdb.catalog.table_file_format(tbl_file) != 'csv':
+                df = self.catalog.table_data(db_id, table)
+                df.columns = [c.lower() for c in df.columns]
+                to_path = f'{self.tmp_dir}/{tbl_file.lower()}'
+                codexdb.catalog.write_table(df, to_path)
             else:
-                with open(src_path) as file:
+                with io.TextIOWrapper(
+                    self.catalog.open_file(db_id, table)) as file:
                     lines = file.readlines()
                     lines[0] = lines[0].lower()
                 to_path = f'{self.tmp_dir}/{tbl_file.lower()}'
@@ -105,14 +123,15 @@ class ExecutionEngine(abc.ABC):
 class PythonEngine(ExecutionEngine):
     """ Executes Python code. """
     
-    def __init__(self, catalog, id_case):
+    def __init__(self, catalog, id_case, tmp_dir=None):
         """ Initialize with database catalog and paths.
         
         Args:
             catalog: informs on database schema and file locations
             id_case: whether to consider letter case for identifiers
+            tmp_dir: working directory (default: $CODEXDB_TMP)
         """
-        super().__init__(catalog)
+        super().__init__(catalog, tmp_dir)
         self.id_case = id_case
         self.python_path = os.environ['CODEXDB_PYTHON']
     
@@ -173,13 +192,14 @@ class PythonEngine(ExecutionEngine):
 class SqliteEngine(ExecutionEngine):
     """ SQL execution engine using SQLite. """
     
-    def __init__(self, catalog):
+    def __init__(self, catalog, tmp_dir=None):
         """ Initialize with given catalog. 
         
         Args:
             catalog: information about database schemata
+            tmp_dir: working directory (default: $CODEXDB_TMP)
         """
-        super().__init__(catalog)
+        super().__init__(catalog, tmp_dir)
     
     def execute(self, db_id, sql, timeout_s):
         """ Execute given SQL query. 
@@ -206,8 +226,7 @@ class SqliteEngine(ExecutionEngine):
         Returns:
             success flag, result, and execution statistics
         """
-        db_dir = self.catalog.db_dir(db_id)
-        db_path = f'{db_dir}/db.db'
+        db_path = f'{self.tmp_dir}/db.db'
         try:
             with sqlite3.connect(db_path) as connection:
                 start_s = time.time()
@@ -226,16 +245,12 @@ class SqliteEngine(ExecutionEngine):
         Args:
             db_id: database ID in catalog
         """
-        db_dir = self.catalog.db_dir(db_id)
-        db_path = f'{db_dir}/db.db'
+        db_path = f'{self.tmp_dir}/db.db'
         if os.path.exists(db_path):
             subprocess.run(['rm', db_path])
         with sqlite3.connect(db_path) as connection:
             schema = self.catalog.schema(db_id)
-            tables = schema['table_names_original']
-            for table in tables:
-                file_name = self.catalog.file_name(db_id, table)
-                table_path = f'{db_dir}/{file_name}'
-                df = pd.read_csv(table_path)
+            for table in schema.tables:
+                df = self.catalog.table_data(db_id, table)
                 df.columns = df.columns.str.replace(' ', '_')
                 df.to_sql(table, connection)
\ No newline at end of file
@@ -4,7 +4,7 @@ Created on Nov 21, 2024
 @author: immanueltrummer
 '''
 import argparse
-import json
+import codexdb.results
 import jsonlines
 
 from codexdb.catalog import DbCatalog
@@ -54,8 +54,7 @@ if __name__ == '__main__':
         mod_between=args.mod_between, 
         mod_end=args.mod_end)
     
-    with open(args.in_path) as file:
-        data = json.load(file)
+    data = codexdb.results.load_results(args.in_path)
     
     samples = []
     for test_case in data.values():
@@ -19,9 +19,12 @@ sys.path.append(str(src_dir))
 sys.path.append(str(root_dir))
 print(f'sys.path: {sys.path}')
 
+import codexdb.backend
 import codexdb.catalog
 import codexdb.code
 import codexdb.engine
+import codexdb.parallel
+import codexdb.schedule
 import codexdb.solve
 
 parser = argparse.ArgumentParser()
@@ -33,6 +36,37 @@ openai.api_key = args.ai_key
 catalog = codexdb.catalog.DbCatalog(args.data_dir)
 os.environ['KMP_DUPLICATE_LIB_OK']='True'
 
+
+@st.cache_resource
+def get_backend(hedge_model, hedge_percentile):
+    """ Create backend, keeping latency statistics across reruns.
+    
+    Args:
+        hedge_model: hedge slow requests with this model (or None)
+        hedge_percentile: hedge after this percentile of latency
+    
+    Returns:
+        completion backend
+    """
+    return codexdb.backend.create_backend(hedge_model, hedge_percentile)
+
+
+@st.cache_resource
+def get_reference(sqlite_path, query):
+    """ Execute query once and normalize result for comparisons.
+    
+    Args:
+        sqlite_path: path to SQLite database file
+        query: execute this query on database
+    
+    Returns:
+        normalized reference result
+    """
+    with sqlite3.connect(sqlite_path) as con:
+        ref_result = pd.read_sql_query(query, con)
+    return codexdb.solve.ReferenceResult(ref_result)
+
+
 st.set_page_config(page_title='CARD')
 st.markdown('''
 # CARD
@@ -47,10 +81,7 @@ with st.sidebar:
         db_id = st.selectbox('Select source database:', options=db_ids)
         
         schema = catalog.schema(db_id)
-        all_tables = schema['table_names_original']
-        all_columns = schema['column_names_original']
-        for table_idx, table in enumerate(all_tables): 
-            columns = [c[1] for c in all_columns if c[0] == table_idx]
+        for table, columns in zip(schema.tables, schema.table_columns): 
             st.write(f'{table}({", ".join(columns)})')
     
     
@@ -67,6 +98,21 @@ with st.sidebar:
         final_temp = float(st.slider(
             'Final temperature:',
             min_value=0.0, max_value=1.0, value=0.5))
+        schedule_path = st.text_input(
+            'Learned schedule (optional path to success counts):')
+        
+        stream = st.checkbox('Stream code while generating', value=True)
+        hedge_options = ['No hedging'] + model_ids
+        hedge_idx = st.selectbox(
+            'Hedge slow requests with:', options=range(len(hedge_options)),
+            format_func=lambda i:hedge_options[i])
+        hedge_model = hedge_options[hedge_idx] if hedge_idx else None
+        hedge_percentile = float(st.slider(
+            'Hedge after latency percentile:',
+            min_value=50, max_value=99, value=95))
+        nr_candidates = int(st.slider(
+            'Candidates generated in parallel:',
+            min_value=1, max_value=4, value=1))
     
     
     with st.expander('Prompt Configuration'):
@@ -109,6 +155,12 @@ temp_delta = final_temp - start_temp
 temp_step = 0 if max_tries == 1 else temp_delta / (max_tries - 1.0)
 test_case = {'question':'', 'query':query, 'db_id':db_id}
 reorder = False if 'order by' in query.lower() else True
+if schedule_path:
+    scheduler = codexdb.schedule.LearnedScheduler.load(
+        schedule_path, prompt_style, nr_samples, max_tries, final_temp)
+else:
+    scheduler = codexdb.schedule.FixedScheduler([
+        start_temp + temp_step * try_idx for try_idx in range(max_tries)])
 
 coder = codexdb.code.PythonGenerator(
     catalog, examples, nr_samples, 
@@ -116,20 +168,61 @@ coder = codexdb.code.PythonGenerator(
     id_case=id_case,
     mod_start=mod_start, 
     mod_between=mod_between, 
-    mod_end=mod_end)
+    mod_end=mod_end,
+    stream=stream,
+    backend=get_backend(hedge_model, hedge_percentile))
 engine = codexdb.engine.PythonEngine(
     catalog, id_case)
 
 
-if st.button('Generate Code'):
+generate = st.button('Generate Code')
+
+if generate and nr_candidates > 1:
     
+    ref_result = None
     if condition > 1:
         sqlite_path = f'{args.data_dir}/database/{db_id}/{db_id}.sqlite'
-        with sqlite3.connect(sqlite_path) as con:
-            ref_result = pd.read_sql_query(query, con)
+        ref_result = get_reference(sqlite_path, query)
     
-    for try_idx in range(max_tries):
+    engines = codexdb.solve.create_engines(
+        catalog, 'python', id_case, nr_candidates)
+    temperatures = scheduler.schedule(test_case)
+    termination = [None, 'executed', 'solved'][condition]
+    with st.spinner(f'Racing {nr_candidates} candidates ...'):
+        results = codexdb.solve.race(
+            catalog, test_case, coder, engines, termination, temperatures, 
+            rate_limiter=codexdb.parallel.RateLimiter(0),
+            ref_output=ref_result, keep_output=True)
+    
+    for result in results:
+        winner = ' (winner)' if result['race']['winner'] else ''
+        if result['cancelled']:
+            winner = ' (cancelled)'
+        st.subheader(f'Candidate {result["nr_tries"]}{winner}')
+        st.write(
+            f'Temperature: {result["temperature"]:.2f}, ' 
+            f'finished after {result["race"]["finish_s"]:.1f} s')
+        st.code(result['code'], language='python')
+        if condition > 0:
+            st.write(f'Executed: {result["executed"]}')
+        if condition > 1:
+            with st.expander(f'Result Similarity: {result["similarity"]}'):
+                st.write('Reference Result:')
+                st.dataframe(ref_result.output)
+                st.write('CARD Result:')
+                st.dataframe(result['output'])
+
+elif generate:
+    
+    if condition > 1:
+        sqlite_path = f'{args.data_dir}/database/{db_id}/{db_id}.sqlite'
+        ref_result = get_reference(sqlite_path, query)
+    
+    tries = []
+    temperature = scheduler.next_temperature(test_case, tries)
+    while temperature is not None:
         
+        try_idx = len(tries)
         st.subheader(f'Trial {(try_idx+1)} ...')
         
         db_id = test_case['db_id']
@@ -138,10 +231,11 @@ if st.button('Generate Code'):
         db_dir = catalog.db_dir(db_id)
         prompt = coder.get_prompt(schema, db_dir, files, '', query)
         
-        temperature = start_temp + temp_step * try_idx
-        gen_stats, code = coder.generate(test_case, temperature)
-        st.write('Code Generated by CARD:')
-        st.code(code, language='python')
+        st.write(f'Code Generated by CARD (temperature {temperature:.2f}):')
+        code_area = st.empty()
+        on_code = lambda c:code_area.code(c, language='python')
+        gen_stats, code = coder.generate(test_case, temperature, on_code)
+        code_area.code(code, language='python')
         
         if condition > 0:
             executed, codb_result, elapsed_s = engine.execute(db_id, code, 30)
@@ -150,7 +244,7 @@ if st.button('Generate Code'):
                 ref_result, codb_result, reorder)        
             with st.expander(f'Result Similarity: {similarity}'):
                 st.write('Reference Result:')
-                st.dataframe(ref_result)
+                st.dataframe(ref_result.output)
                 st.write('CARD Result:')
                 st.dataframe(codb_result)
 
@@ -161,3 +255,6 @@ if st.button('Generate Code'):
             (condition == 2 and similarity >= 1.0):
             st.write('Termination Criterion Satisfied.')
             break
+        
+        tries.append(codexdb.schedule.failed_try(temperature))
+        temperature = scheduler.next_temperature(test_case, tries)
@@ -0,0 +1,155 @@
+import ast
+import collections
+
+
+class PerformanceLinter():
+    """ Detects performance anti-patterns in generated pandas code. """
+
+    def __init__(self):
+        """ Initializes severities and corrections of anti-patterns. """
+        self.severities = {
+            'iterrows':3, 'itertuples':2, 'row_apply':2,
+            'row_loop':3, 'read_in_loop':3, 'repeated_read':1}
+        self.corrections = {
+            'iterrows':'do not use iterrows',
+            'itertuples':'do not use itertuples',
+            'row_apply':'do not use apply with axis=1',
+            'row_loop':'do not loop over rows',
+            'read_in_loop':'do not read files inside loops',
+            'repeated_read':'read each file only once'}
+
+    def correction(self, findings):
+        """ Generate instruction avoiding detected anti-patterns.
+
+        Args:
+            findings: anti-patterns detected in code
+
+        Returns:
+            natural language instruction for code generation
+        """
+        patterns = sorted({f['pattern'] for f in findings})
+        instructions = [self.corrections[p] for p in patterns]
+        return 'Use vectorized pandas operations: ' + '; '.join(instructions)
+
+    def lint(self, code):
+        """ Search code for performance anti-patterns.
+
+        Args:
+            code: Python code to analyze
+
+        Returns:
+            list of findings (dictionaries with pattern, line, severity)
+        """
+        try:
+            tree = ast.parse(code)
+        except SyntaxError:
+            return []
+
+        findings = []
+        frames = self._frame_names(tree)
+        read_counts = collections.Counter()
+        loop_nodes = set()
+        for node in ast.walk(tree):
+            if isinstance(node, (ast.For, ast.While)):
+                for child in ast.walk(node):
+                    loop_nodes.add(id(child))
+                if self._is_row_loop(node, frames):
+                    findings.append(self._finding('row_loop', node))
+
+            if not isinstance(node, ast.Call) or \
+                not isinstance(node.func, ast.Attribute):
+                continue
+            method = node.func.attr
+            if method in ['iterrows', 'itertuples']:
+                findings.append(self._finding(method, node))
+            elif method == 'apply' and self._is_row_wise(node):
+                findings.append(self._finding('row_apply', node))
+            elif method.startswith('read_'):
+                if id(node) in loop_nodes:
+                    findings.append(self._finding('read_in_loop', node))
+                if node.args and isinstance(node.args[0], ast.Constant):
+                    path = node.args[0].value
+                    if read_counts[path] > 0:
+                        findings.append(
+                            self._finding('repeated_read', node))
+                    read_counts[path] += 1
+
+        return findings
+
+    def score(self, findings):
+        """ Calculates aggregate severity of findings.
+
+        Args:
+            findings: anti-patterns detected in code
+
+        Returns:
+            sum of severities over all findings
+        """
+        return sum(f['severity'] for f in findings)
+
+    def _finding(self, pattern, node):
+        """ Describe anti-pattern found at given node. """
+        return {
+            'pattern':pattern, 'line':node.lineno,
+            'severity':self.severities[pattern]}
+
+    def _frame_names(self, tree):
+        """ Collects names of variables assigned from file reads.
+
+        Args:
+            tree: syntax tree of analyzed code
+
+        Returns:
+            set of names referring to data frames
+        """
+        frames = set()
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Assign) and \
+                isinstance(node.value, ast.Call) and \
+                isinstance(node.value.func, ast.Attribute) and \
+                node.value.func.attr.startswith('read_'):
+                for target in node.targets:
+                    if isinstance(target, ast.Name):
+                        frames.add(target.id)
+        return frames
+
+    def _is_row_loop(self, node, frames):
+        """ Checks if loop iterates over row indexes of a data frame.
+
+        Args:
+            node: loop node in syntax tree
+            frames: names of variables referring to data frames
+
+        Returns:
+            True iff loop iterates over data frame rows by index
+        """
+        if not isinstance(node, ast.For):
+            return False
+        loop_iter = node.iter
+        if not isinstance(loop_iter, ast.Call) or \
+            not isinstance(loop_iter.func, ast.Name) or \
+            loop_iter.func.id != 'range' or not loop_iter.args:
+            return False
+        bound = loop_iter.args[-1]
+        bound_text = ast.unparse(bound)
+        if not (bound_text.startswith('len(') or \
+            '.shape[0]' in bound_text or bound_text.endswith('.index)')):
+            return False
+        receivers = {n.id for n in ast.walk(bound) if isinstance(n, ast.Name)}
+        if receivers & frames:
+            return True
+        for stmt in node.body:
+            for child in ast.walk(stmt):
+                if isinstance(child, ast.Attribute) and \
+                    child.attr in ['iloc', 'loc', 'iat', 'at']:
+                    return True
+        return False
+
+    def _is_row_wise(self, node):
+        """ Checks if call to apply processes rows. """
+        for keyword in node.keywords:
+            if keyword.arg == 'axis' and \
+                isinstance(keyword.value, ast.Constant) and \
+                keyword.value.value in [1, 'columns']:
+                return True
+        return False
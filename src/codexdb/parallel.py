@@ -0,0 +1,314 @@
+import argparse
+import codexdb.cases
+import codexdb.catalog
+import codexdb.plan
+import codexdb.results
+import codexdb.schedule
+import codexdb.solve
+import multiprocessing
+import multiprocessing.util
+import openai
+import os
+import sys
+import time
+
+
+class RateLimiter():
+    """ Enforces minimal delay between LLM requests across processes. """
+
+    def __init__(self, min_delay_s):
+        """ Initializes shared state for all processes.
+
+        Args:
+            min_delay_s: minimal delay between two requests in seconds
+        """
+        self.min_delay_s = min_delay_s
+        self.lock = multiprocessing.Lock()
+        self.next_s = multiprocessing.Value('d', 0.0, lock=False)
+
+    def wait(self):
+        """ Blocks until the next request slot is reached. """
+        with self.lock:
+            now_s = time.time()
+            slot_s = max(now_s, self.next_s.value)
+            self.next_s.value = slot_s + self.min_delay_s
+        time.sleep(slot_s - now_s)
+
+
+# State of worker process (initialized once per worker)
+worker = {}
+
+
+def init_worker(settings, rate_limiter, ai_key):
+    """ Initializes worker process with its own log and directory.
+
+    Worker IDs are derived from the process identity assigned by
+    the pool, so workers respawned by the pool obtain fresh IDs.
+
+    Args:
+        settings: dictionary with run settings
+        rate_limiter: rate limiter shared by all workers
+        ai_key: key for OpenAI access
+    """
+    openai.api_key = ai_key
+    os.environ['KMP_DUPLICATE_LIB_OK']='True'
+    worker_id = multiprocessing.current_process()._identity[0] - 1
+    log_path = f'{settings["log_path"]}.{worker_id}'
+    sys.stdout = open(log_path, 'a' if settings['resume'] else 'w')
+
+    tmp_dir = f'{os.environ["CODEXDB_TMP"]}/worker{worker_id}'
+    os.makedirs(tmp_dir, exist_ok=True)
+    if settings['plan_cache_path']:
+        codexdb.plan.enable_disk_cache(
+            f'{settings["plan_cache_path"]}.{worker_id}')
+    catalog = codexdb.catalog.DbCatalog(
+        settings['data_dir'], settings['table_format'])
+    coder, engine, validator, linter = codexdb.solve.create_solvers(
+        catalog, settings['language'], settings['model_id'],
+        settings['prompt_style'], settings['id_case'],
+        settings['mod_start'], settings['mod_between'],
+        settings['mod_end'], settings['examples'],
+        settings['nr_samples'], settings['stream'],
+        settings['validate'], settings['max_lint_score'], tmp_dir,
+        settings['hedge_model'], settings['hedge_percentile'],
+        optimize_plans=settings['optimize_plans'])
+    if settings['schedule_path']:
+        scheduler = codexdb.schedule.LearnedScheduler.load(
+            settings['schedule_path'], settings['prompt_style'],
+            settings['nr_samples'], settings['max_tries'],
+            settings['max_temperature'])
+    else:
+        scheduler = codexdb.solve.linear_scheduler(
+            settings['max_tries'], settings['max_temperature'])
+    worker.update({
+        'settings':settings, 'catalog':catalog, 'coder':coder,
+        'engine':engine, 'validator':validator, 'linter':linter,
+        'rate_limiter':rate_limiter, 'scheduler':scheduler})
+    multiprocessing.util.Finalize(None, close_worker, exitpriority=10)
+
+
+def close_worker():
+    """ Releases completion backend and catalog when worker exits. """
+    worker['coder'].backend.close()
+    worker['catalog'].close()
+    sys.stdout.flush()
+
+
+def solve_case(task):
+    """ Solve one test case in worker process.
+
+    Args:
+        task: tuple of test case index and test case
+
+    Returns:
+        test case index, list of tries
+    """
+    idx, test_case = task
+    settings = worker['settings']
+    print(f'Starting test case nr. {idx} ...')
+    results = codexdb.solve.solve(
+        worker['catalog'], test_case, worker['coder'],
+        worker['engine'], settings['termination'],
+        settings['max_tries'], settings['max_temperature'],
+        worker['validator'], worker['linter'],
+        settings['max_lint_score'], worker['rate_limiter'],
+        settings['pipeline'], worker['scheduler'], 
+        compile_queries=settings['compile_queries'])
+    worker['catalog'].save_stats()
+    print(results)
+    sys.stdout.flush()
+    return idx, results
+
+
+def main(
+        nr_workers, data_dir, test_path, language, model_id,
+        prompt_style, id_case, mod_start, mod_between, mod_end,
+        sample_path, nr_samples, test_start, test_step, test_end,
+        termination, max_tries, max_temperature, log_path, result_path,
+        stream=False, validate=False, max_lint_score=None, min_delay_s=3,
+        resume=False, pipeline=False, hedge_model=None, hedge_percentile=95,
+        schedule_path=None, compile_queries=False, optimize_plans=False,
+        table_format='csv', plan_cache_path=None, nr_candidates=1,
+        replay_path=None, template_path=None):
+    """ Solve test cases in parallel and write results to file.
+
+    Each worker process writes to its own log file (log path with
+    worker ID as suffix) and executes code in its own sub-directory
+    of $CODEXDB_TMP. All workers share one LLM rate limit. As in
+    the sequential driver, finished test cases are appended to a
+    progress file and skipped when resuming. Racing candidates,
+    replaying results, and code templates are only supported by
+    the sequential driver (solve.py).
+
+    Args:
+        nr_workers: number of worker processes
+        data_dir: directory containing database
+        test_path: path to file with test cases
+        language: generate code in this language
+        model_id: OpenAI engine for code generation
+        prompt_style: choose prompt template
+        id_case: whether to consider letter case of identifiers
+        mod_start: modification at plan start
+        mod_between: modifications between steps
+        mod_end: modification at plan end
+        sample_path: path to example library
+        nr_samples: number of examples in prompt
+        test_start: index of first test case
+        test_step: gap between test case indexes
+        test_end: index of last test case + 1
+        termination: termination criterion
+        max_tries: maximal tries per test case
+        max_temperature: maximal temperature
+        log_path: prefix of paths for logging output
+        result_path: path to result file (.json or compressed .json.gz)
+        stream: whether to stream completions from the LLM
+        validate: whether to check Python code before execution
+        max_lint_score: regenerate Python code above this lint score
+        min_delay_s: minimal delay between LLM requests over all workers
+        resume: whether to resume from progress file of prior run
+        pipeline: whether to generate next try during execution
+        hedge_model: hedge slow LLM requests with this model (optional)
+        hedge_percentile: hedge after this percentile of latency
+        schedule_path: schedule tries via success counts in this file
+        compile_queries: try code compiled from SQL before generating code
+        optimize_plans: order plan steps via data statistics
+        table_format: preferred format of table files
+        plan_cache_path: prefix of plan cache files (one per worker)
+        nr_candidates: number of raced candidates (not supported if above one)
+        replay_path: replay code from this file (not supported)
+        template_path: reuse code templates from this file (not supported)
+    """
+    codexdb.solve.check_settings(language, prompt_style, termination)
+    if nr_candidates > 1:
+        raise ValueError('Racing is not supported in parallel mode!')
+    if replay_path:
+        raise ValueError('Replaying is not supported in parallel mode!')
+    if template_path:
+        raise ValueError('Templates are not supported in parallel mode!')
+    examples = []
+    if sample_path:
+        catalog = codexdb.catalog.DbCatalog(data_dir, table_format)
+        examples = codexdb.solve.extract_samples(catalog, sample_path)
+
+    settings = {
+        'data_dir':data_dir, 'language':language, 'model_id':model_id,
+        'prompt_style':prompt_style, 'id_case':id_case,
+        'mod_start':mod_start, 'mod_between':mod_between,
+        'mod_end':mod_end, 'examples':examples, 'nr_samples':nr_samples,
+        'termination':termination, 'max_tries':max_tries,
+        'max_temperature':max_temperature, 'log_path':log_path,
+        'stream':stream, 'validate':validate,
+        'max_lint_score':max_lint_score, 'resume':resume,
+        'pipeline':pipeline, 'hedge_model':hedge_model,
+        'hedge_percentile':hedge_percentile, 'schedule_path':schedule_path,
+        'compile_queries':compile_queries, 'optimize_plans':optimize_plans,
+        'table_format':table_format, 'plan_cache_path':plan_cache_path}
+    rate_limiter = RateLimiter(min_delay_s)
+
+    progress_path = codexdb.results.progress_path(result_path)
+    idx_to_results = {}
+    if resume:
+        idx_to_results = codexdb.results.load_progress(progress_path)
+    with codexdb.cases.TestCaseStore(test_path) as test_cases:
+        tasks = [(i, test_cases[i]) for i in range(
+            test_start, test_end, test_step) if i not in idx_to_results]
+
+    with codexdb.results.ResultWriter(progress_path, resume) as writer, \
+        multiprocessing.Pool(
+            nr_workers, initializer=init_worker,
+            initargs=(
+                settings, rate_limiter, openai.api_key)) as pool:
+        for idx, results in pool.imap_unordered(solve_case, tasks):
+            print(f'Finished test case nr. {idx}')
+            idx_to_results[idx] = results
+            writer.write(idx, results)
+        pool.close()
+        pool.join()
+
+    codexdb.results.dump_results(idx_to_results, result_path)
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('ai_key', type=str, help='Key for OpenAI access')
+    parser.add_argument('nr_workers', type=int, help='Number of processes')
+    parser.add_argument('data_dir', type=str, help='Data directory')
+    parser.add_argument('test_path', type=str, help='Path to test case file')
+    parser.add_argument('language', type=str, help='Implementation language')
+    parser.add_argument('model_id', type=str, help='ID of OpenAI model')
+    parser.add_argument('prompt_style', type=str, help='Style of prompt')
+    parser.add_argument('mod_start', type=str, help='Instructions at start')
+    parser.add_argument('mod_between', type=str, help='Execute between steps')
+    parser.add_argument('mod_end', type=str, help='Instructions at end')
+    parser.add_argument('sample_path', type=str, help='Path to sample file')
+    parser.add_argument('nr_samples', type=int, help='Number of samples in prompt')
+    parser.add_argument('test_start', type=int, help='Index of first test case')
+    parser.add_argument('test_step', type=int, help='Gap between test case indexes')
+    parser.add_argument('test_end', type=int, help='Index of last test case +1')
+    parser.add_argument('termination', type=str, help='Termination criterion')
+    parser.add_argument('max_tries', type=int, help='Maximal number of tries')
+    parser.add_argument('log_path', type=str, help='Prefix of log files')
+    parser.add_argument('result_path', type=str, help='Contains results')
+    parser.add_argument(
+        '--stream', action='store_true',
+        help='Stream completions and stop once code is complete')
+    parser.add_argument(
+        '--validate', action='store_true',
+        help='Reject invalid code before execution')
+    parser.add_argument(
+        '--max_lint_score', type=int, default=None,
+        help='Regenerate code exceeding this performance lint score')
+    parser.add_argument(
+        '--min_delay_s', type=float, default=3,
+        help='Minimal delay between LLM requests over all workers')
+    parser.add_argument(
+        '--resume', action='store_true',
+        help='Skip test cases finished in a prior run')
+    parser.add_argument(
+        '--pipeline', action='store_true',
+        help='Generate next try while executing current try')
+    parser.add_argument(
+        '--hedge_model', type=str, default=None,
+        help='Send slow requests to this model as well')
+    parser.add_argument(
+        '--hedge_percentile', type=float, default=95,
+        help='Hedge requests slower than this latency percentile')
+    parser.add_argument(
+        '--schedule_path', type=str, default=None,
+        help='Schedule tries by success counts (written by schedule.py)')
+    parser.add_argument(
+        '--compile', action='store_true',
+        help='Try code compiled from SQL query before using the LLM')
+    parser.add_argument(
+        '--optimize_plans', action='store_true',
+        help='Order joins and filters in plans via data statistics')
+    parser.add_argument(
+        '--table_format', type=str, default='csv',
+        help='Preferred format of table files (csv, parquet, or feather)')
+    parser.add_argument(
+        '--plan_cache_path', type=str, default=None,
+        help='Reuse and store query plans in files with this prefix')
+    parser.add_argument(
+        '--race', type=int, default=1,
+        help='Not supported in parallel mode (use solve.py)')
+    parser.add_argument(
+        '--replay_path', type=str, default=None,
+        help='Not supported in parallel mode (use solve.py)')
+    parser.add_argument(
+        '--template_path', type=str, default=None,
+        help='Not supported in parallel mode (use solve.py)')
+    args = parser.parse_args()
+
+    openai.api_key = args.ai_key
+    main(
+        args.nr_workers, args.data_dir, args.test_path, args.language,
+        args.model_id, args.prompt_style, True, args.mod_start,
+        args.mod_between, args.mod_end, args.sample_path, args.nr_samples,
+        args.test_start, args.test_step, args.test_end, args.termination,
+        args.max_tries, 0.5, args.log_path, args.result_path, args.stream,
+        args.validate, args.max_lint_score, args.min_delay_s, args.resume,
+        args.pipeline, args.hedge_model, args.hedge_percentile,
+        args.schedule_path, args.compile, args.optimize_plans,
+        args.table_format, args.plan_cache_path, args.race,
+        args.replay_path, args.template_path)
@@ -3,29 +3,91 @@ Created on Jan 21, 2022
 
 @author: immanueltrummer
 '''
+import array
 import collections
+import contextvars
 import json
+import multiprocessing
+import shelve
 import sqlglot.parser
 import sqlglot.tokens
 import sqlglot.expressions
+import threading
+
+
+# Step ID allocator of current planner call (per thread and task)
+current_step_ids = contextvars.ContextVar('current_step_ids')
+
+# Database queried in current planner call (if plans are optimized)
+current_db_id = contextvars.ContextVar('current_db_id')
+
+
+class PlanStep():
+    """ One plan step, referencing results of other steps. 
+    
+    Steps are immutable once created (changes create new steps)
+    and may therefore be shared between plans.
+    
+    Attributes:
+        id: integer ID of step
+        parts: list mixing strings and IDs of referenced steps
+        refs: array with IDs of referenced steps
+    """
+    __slots__ = ('id', 'parts', 'refs')
+    
+    def __init__(self, step_id, parts):
+        """ Initializes step and extracts its references.
+        
+        Args:
+            step_id: integer ID of step
+            parts: list mixing strings and IDs of referenced steps
+        """
+        self.id = step_id
+        self.parts = parts
+        self.refs = array.array(
+            'q', [p for p in parts if isinstance(p, int)])
+
+
+class StepIdAllocator():
+    """ Allocates step IDs for plans that are combined. """
+    
+    def __init__(self, next_id=0):
+        """ Initializes with first ID to allocate.
+        
+        Args:
+            next_id: next integer ID to use for steps
+        """
+        self.next_id = next_id
+    
+    def allocate(self):
+        """ Returns next unused step ID and advances counter. """
+        self.next_id += 1
+        return self.next_id - 1
 
 
 class NlPlan():
     """ Represents a plan described in natural language. 
     
-    Attributes:
-        next_id: next integer ID to use for steps
+    Steps are stored in a table (in execution order), together with
+    an index mapping step IDs to positions in the table. The index
+    is rebuilt lazily after steps are inserted before others.
+    
+    Step IDs are allocated per plan. Plans that are combined via
+    add_plan must share their ID allocator, as do plans created
+    during the same planner call.
     """
-    next_id = 0
     
-    def __init__(self):
-        """ Initializes plan steps. 
+    def __init__(self, step_ids=None):
+        """ Initializes empty step table and index. 
         
         Args:
-            id_steps: list of tuples (step ID and step)
+            step_ids: allocator for step IDs (default: current planner call)
         """
-        # List of Tuple(Step ID, List of parts)
-        self.id_steps = []
+        if step_ids is None:
+            step_ids = current_step_ids.get(None) or StepIdAllocator()
+        self.step_ids = step_ids
+        self.step_table = []
+        self.positions = {}
     
     def add_plan(self, plan):
         """ Add steps of another plan. 
@@ -33,8 +95,23 @@ class NlPlan():
         Args:
             plan: add steps of this plan (after current steps).
         """
-        self.id_steps += plan.id_steps
+        if self.positions is not None:
+            nr_steps = len(self.step_table)
+            for pos, step in enumerate(plan.step_table, nr_steps):
+                self.positions[step.id] = pos
+        self.step_table += plan.step_table
         
+    def copy(self):
+        """ Returns copy of plan that can be extended independently. 
+        
+        The copy allocates new step IDs after the IDs used in the plan.
+        """
+        max_id = max((step.id for step in self.step_table), default=-1)
+        plan = NlPlan(StepIdAllocator(max_id + 1))
+        plan.step_table = list(self.step_table)
+        plan.positions = None
+        return plan
+    
     def add_step(self, step, at_end=True):
         """ Adds one step to plan. 
         
@@ -46,18 +123,19 @@ class NlPlan():
             integer ID of newly created step
         """
         step_id = self._step_ID()
+        plan_step = PlanStep(step_id, step)
         if at_end:
-            self.id_steps.append((step_id, step))
+            if self.positions is not None:
+                self.positions[step_id] = len(self.step_table)
+            self.step_table.append(plan_step)
         else:
-            self.id_steps.insert(0, (step_id, step))
+            self.step_table.insert(0, plan_step)
+            self.positions = None
         return step_id
     
     def id_to_step(self):
         """ Returns dictionary mapping step IDs to steps. """
-        id_to_step = {}
-        for step_id, step in self.id_steps:
-            id_to_step[step_id] = step
-        return id_to_step
+        return {step.id:step.parts for step in self.step_table}
     
     def intersperse_step(self, step):
         """ Add given step after each current plan step. 
@@ -65,23 +143,39 @@ class NlPlan():
         Args:
             step: intersperse this step
         """
-        nr_steps = len(self.id_steps)
-        for _ in range(nr_steps):
-            self.add_step(step, False)
-        
-        new_id_steps = []
-        for i in range(nr_steps):
-            new_id_steps.append(self.id_steps[i+nr_steps])
-            new_id_steps.append(self.id_steps[i])
-            
-        self.id_steps = new_id_steps
+        new_table = []
+        for plan_step in self.step_table:
+            new_table.append(plan_step)
+            new_table.append(PlanStep(self._step_ID(), step))
+        self.step_table = new_table
+        self.positions = None
         
     def last_step_id(self):
         """ Returns ID of last step or None. """
-        if self.id_steps:
-            return self.id_steps[-1][0]
+        if self.step_table:
+            return self.step_table[-1].id
         else:
             return None
+    
+    def prefix_last_step(self, prefix):
+        """ Add prefix at the start of the last plan step.
+        
+        Args:
+            prefix: string to insert before first part of last step
+        """
+        last_step = self.step_table[-1]
+        self.step_table[-1] = PlanStep(
+            last_step.id, [prefix] + last_step.parts)
+
+    def suffix_last_step(self, suffix):
+        """ Add suffix at the end of the last plan step.
+        
+        Args:
+            suffix: string to append after last part of last step
+        """
+        last_step = self.step_table[-1]
+        self.step_table[-1] = PlanStep(
+            last_step.id, last_step.parts + [suffix])
 
     def step_ref_counts(self):
         """ Count number of references for each step.
@@ -90,10 +184,9 @@ class NlPlan():
             dictionary mapping step IDs to number of references
         """
         step_ref_counts = collections.defaultdict(lambda:0)
-        for _, step in self.id_steps:
-            for part in step:
-                if isinstance(part, int):
-                    step_ref_counts[part] += 1
+        for step in self.step_table:
+            for ref in step.refs:
+                step_ref_counts[ref] += 1
         return step_ref_counts
 
     def steps(self, offset=0):
@@ -105,7 +198,7 @@ class NlPlan():
         Returns:
             list of steps (strings)
         """
-        nl_steps = [self._step_to_nl(step) for _, step in self.id_steps]
+        nl_steps = [self._step_to_nl(step.parts) for step in self.step_table]
         return [f'{(idx+offset)}. {s}.' for idx, s in enumerate(nl_steps, 1)]
 
     def _index_of(self, search):
@@ -117,15 +210,15 @@ class NlPlan():
         Returns:
             index of corresponding step or None
         """
-        for idx, (step_id, _) in enumerate(self.id_steps):
-            if step_id == search:
-                return idx + 1
-        return None
+        if self.positions is None:
+            self.positions = {
+                step.id:pos for pos, step in enumerate(self.step_table)}
+        pos = self.positions.get(search)
+        return None if pos is None else pos + 1
     
     def _step_ID(self):
-        """ Returns next unused step ID and advances counter. """
-        NlPlan.next_id += 1
-        return NlPlan.next_id - 1
+        """ Returns next unused step ID. """
+        return self.step_ids.allocate()
         
     def _step_to_nl(self, step):
         """ Transforms plan step into natural language.
@@ -148,20 +241,117 @@ class NlPlan():
         return ' '.join(out_parts)
 
 
+class PlanCache():
+    """ LRU cache for planner output, optionally backed by a file. 
+    
+    The cache can be shared by multiple threads.
+    """
+    
+    def __init__(self, max_size=1024, path=None):
+        """ Initializes empty cache.
+        
+        Args:
+            max_size: maximal number of entries kept in memory
+            path: path of shelve file storing all entries (optional)
+        """
+        self.max_size = max_size
+        self.entries = collections.OrderedDict()
+        self.shelf = shelve.open(path) if path is not None else None
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+    
+    def get(self, key):
+        """ Returns cached value for key or None.
+        
+        Args:
+            key: tuple of strings and flags
+        
+        Returns:
+            cached value or None
+        """
+        with self.lock:
+            value = self.entries.get(key)
+            if value is None and self.shelf is not None:
+                value = self.shelf.get(json.dumps(key))
+                if value is not None:
+                    self._insert(key, value)
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self.entries.move_to_end(key)
+            return value
+    
+    def info(self):
+        """ Returns numbers of hits and misses and cache size. """
+        with self.lock:
+            return {
+                'hits':self.hits, 'misses':self.misses, 
+                'size':len(self.entries)}
+    
+    def put(self, key, value):
+        """ Store value for given key.
+        
+        Args:
+            key: tuple of strings and flags
+            value: value to cache
+        """
+        with self.lock:
+            self._insert(key, value)
+            if self.shelf is not None:
+                self.shelf[json.dumps(key)] = value
+                self.shelf.sync()
+    
+    def _insert(self, key, value):
+        """ Insert into memory, evicting least recently used entry. """
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+
+# Caches shared by all planners (plans and decorated steps)
+plan_cache = PlanCache()
+steps_cache = PlanCache()
+
+
+def enable_disk_cache(path, max_size=1024):
+    """ Keep plans in file, reusing them across runs.
+    
+    The file must not be used by multiple processes concurrently.
+    
+    Args:
+        path: path of shelve file storing plans
+        max_size: maximal number of plans kept in memory
+    """
+    global plan_cache
+    plan_cache = PlanCache(max_size, path)
+
+
 class NlPlanner():
-    """ Generates natural language query plan for query. """
+    """ Generates natural language query plan for query. 
+    
+    Planners do not change their state while planning. The same
+    planner can therefore be used by multiple threads at once.
     
-    def __init__(self, id_case, quote_ids=True):
+    If a catalog is given, plans for queries on a known database
+    are optimized using table statistics: tables are joined in the
+    order minimizing estimated intermediate result sizes, and each
+    table is filtered directly after loading it.
+    """
+    
+    def __init__(self, id_case, quote_ids=True, catalog=None):
         """ Initializes planner. 
         
         Args:
             id_case: whether to consider letter case for identifiers
             quote_ids: whether to place all identifiers in quotes
+            catalog: optimize plans via statistics of this catalog
         """
         self.id_case = id_case
         self.quote_ids = quote_ids
-        self.tokenizer = sqlglot.tokens.Tokenizer()
-        self.parser = sqlglot.parser.Parser()
+        self.catalog = catalog
     
     def nl(self, expression, key=None):
         """ Returns a natural language plan for given expression. 
@@ -191,24 +381,137 @@ class NlPlanner():
         
         raise ValueError(f'Error - cannot process expression {expression.key}!')
     
-    def plan(self, query):
+    def cache_info(self):
+        """ Returns statistics on caches for plans and plan steps. """
+        return {'plans':plan_cache.info(), 'steps':steps_cache.info()}
+    
+    def plan(self, query, db_id=None):
+        """ Returns natural language plan for query.
+        
+        Plans are cached and copies are returned (which can be
+        extended without changing the cached plan).
+        
+        Args:
+            query: SQL query to plan for
+            db_id: ID of queried database (used for optimization)
+        
+        Returns:
+            plan for query with steps described in natural language
+        """
+        key = self._plan_key(query, db_id)
+        plan = plan_cache.get(key)
+        if plan is None:
+            plan = self._plan(query, key[-1])
+            plan_cache.put(key, plan)
+        return plan.copy()
+    
+    def plan_many(self, queries, nr_workers=None, db_ids=None):
+        """ Plan for multiple queries in parallel processes.
+        
+        Plans are added to the plan cache. Queries that cannot be
+        planned are reported and yield no plan.
+        
+        Args:
+            queries: list of SQL queries to plan for
+            nr_workers: number of processes (default: number of CPUs)
+            db_ids: IDs of queried databases (used for optimization)
+        
+        Returns:
+            list of plans (None for queries that cannot be planned)
+        """
+        if db_ids is None:
+            db_ids = [None] * len(queries)
+        keys = [self._plan_key(q, d) for q, d in zip(queries, db_ids)]
+        key_to_plan = {}
+        for key in set(keys):
+            plan = plan_cache.get(key)
+            if plan is not None:
+                key_to_plan[key] = plan
+        
+        tasks = [key for key in set(keys) if key not in key_to_plan]
+        if tasks:
+            with multiprocessing.Pool(
+                nr_workers, initializer=init_plan_worker, 
+                initargs=(self.id_case, self.quote_ids, self.catalog)) as pool:
+                for key, plan in pool.imap_unordered(
+                    plan_task, tasks, chunksize=16):
+                    if plan is not None:
+                        plan_cache.put(key, plan)
+                    key_to_plan[key] = plan
+        
+        plans = []
+        for key in keys:
+            plan = key_to_plan[key]
+            plans.append(None if plan is None else plan.copy())
+        return plans
+    
+    def plan_steps(
+            self, query, mod_start='', mod_between='', mod_end='', 
+            db_id=None):
+        """ Returns plan steps for query, including modifications.
+        
+        Args:
+            query: SQL query to plan for
+            mod_start: modification at plan start
+            mod_between: modification between plan steps
+            mod_end: modification at plan end
+            db_id: ID of queried database (used for optimization)
+        
+        Returns:
+            list of plan steps (strings)
+        """
+        key = self._plan_key(query, db_id) + (mod_start, mod_between, mod_end)
+        steps = steps_cache.get(key)
+        if steps is None:
+            plan = self.plan(query, db_id)
+            if mod_between:
+                plan.intersperse_step([mod_between])
+            if mod_start:
+                plan.add_step([mod_start], False)
+            if mod_end:
+                plan.add_step([mod_end])
+            steps = plan.steps()
+            steps_cache.put(key, steps)
+        return list(steps)
+    
+    def _plan(self, query, db_id=None):
         """ Parse query and return natural language plan. 
         
         Args:
             query: SQL query to plan for
+            db_id: ID of queried database (used for optimization)
         
         Returns:
             plan for query with steps described in natural language
         """
-        tokens = self.tokenizer.tokenize(query)
-        ast = self.parser.parse(tokens)[0]
+        tokens = sqlglot.tokens.Tokenizer().tokenize(query)
+        ast = sqlglot.parser.Parser().parse(tokens)[0]
         if not self.id_case:
             ast = self._lower_ids(ast)
-        labels, plan = self.nl(ast)
-        write_out = ['Write'] + labels + ["to file 'result.csv' (with header)"]
-        plan.add_step(write_out)
+        ids_token = current_step_ids.set(StepIdAllocator())
+        db_token = current_db_id.set(db_id)
+        try:
+            labels, plan = self.nl(ast)
+            write_out = ['Write'] + labels + \
+                ["to file 'result.csv' (with header)"]
+            plan.add_step(write_out)
+        finally:
+            current_db_id.reset(db_token)
+            current_step_ids.reset(ids_token)
         return plan
     
+    def _plan_key(self, query, db_id=None):
+        """ Returns key of plan for query in plan cache.
+        
+        Keys of optimized plans contain a hash over the statistics of
+        the queried tables. Cached plans are therefore not reused once
+        table data changes.
+        """
+        if self.catalog is None:
+            db_id = None
+        version = self._stats_version(db_id)
+        return (query, self.id_case, self.quote_ids, version, db_id)
+    
     def _alias(self, expression):
         """ Extract alias from alias expression. """
         assert expression.key == 'alias', 'No alias type expression'
@@ -326,45 +629,34 @@ class NlPlanner():
                 alias = self._alias(tbl_expression)
             tables_aliases += [(table, alias)]
         
-        # Load data and assign aliases
-        plan = NlPlan()
-        for table, alias in tables_aliases:
-            step = ['Load table'] + [table] + ['and store as'] + [alias]
-            plan.add_step(step)
+        load_hints = self._load_hints(expression, tbl_expressions)
+        join_order = self._join_order(expression, tbl_expressions)
+        if join_order is not None:
+            plan, left_label = self._optimized_joins(
+                expression, tables_aliases, join_order, load_hints)
+        else:
+            # Load data and assign aliases
+            plan = NlPlan()
+            for (table, alias), hint in zip(tables_aliases, load_hints):
+                step = ['Load table'] + [table] + ['and store as'] + [alias]
+                plan.add_step(step + hint)
             
-            # preds = tbl_to_preds[alias]
-            # for pred in preds:
-                # pred_label, pred_plan = self.nl(pred)
-                # plan.add_plan(pred_plan)
-                # step = ['Filter'] + [alias] + ['using'] + pred_label
-                # plan.add_step(step)
-        
-        # Apply predicates in where clause
-        if expression.args.get('where'):
-            where_expr = expression.args['where'].args['this']
-            conjuncts = self._conjuncts(where_expr)
-            for pred in conjuncts:
-                pred_labels, pred_plan = self.nl(pred)
-                pred_plan = self._simplify_plan(pred_plan)
-                tables = self._tables(pred)
-                if len(tables) == 1:
-                    table = tables.pop()
-                    prefix = f'Filter {table}:'
-                else:
-                    prefix = 'Filter table:'
-                pred_plan.id_steps[-1][1].insert(0, prefix)
-                plan.add_plan(pred_plan)
-                # plan.add_step(step)
-        
-        # Join tables considering join conditions
-        left_label = tables_aliases[0][1]
-        for idx, join in enumerate(join_expressions, 1):
-            right_label = tables_aliases[idx][1]
-            join = self._strip_tables(join)
-            eq_label = self._join_eq_label(join)
-            step = ['Join'] + [left_label] + ['with'] + \
-                [right_label] + ['- condition:'] + [eq_label]
-            left_label = plan.add_step(step)
+            # Apply predicates in where clause
+            if expression.args.get('where'):
+                where_expr = expression.args['where'].args['this']
+                conjuncts = self._conjuncts(where_expr)
+                for pred in conjuncts:
+                    plan.add_plan(self._filter_plan(pred))
+            
+            # Join tables considering join conditions
+            left_label = tables_aliases[0][1]
+            for idx, join in enumerate(join_expressions, 1):
+                right_label = tables_aliases[idx][1]
+                join = self._strip_tables(join)
+                eq_label = self._join_eq_label(join)
+                step = ['Join'] + [left_label] + ['with'] + \
+                    [right_label] + ['- condition:'] + [eq_label]
+                left_label = plan.add_step(step)
         last_labels = [left_label]
 
         if expression.args.get('group'):
@@ -423,6 +715,25 @@ class NlPlanner():
 
         return last_labels, plan
 
+    def _columns_under(self, expression, keys):
+        """ Returns lower case names of columns below nodes of given types. 
+        
+        Args:
+            expression: search columns in this expression
+            keys: keys of expression types to consider
+        
+        Returns:
+            set of column names
+        """
+        names = set()
+        for node in expression.find_all(sqlglot.expressions.Expression):
+            if node.key in keys:
+                for column in node.find_all(sqlglot.expressions.Column):
+                    name = column.args['this'].args.get('this')
+                    if isinstance(name, str):
+                        names.add(name.lower())
+        return names
+    
     def _conjuncts(self, expression):
         """ Extract list of conjuncts from expression. """
         if expression.key == 'and':
@@ -447,6 +758,29 @@ class NlPlanner():
                 ['without null values in'] + arg_labels
             return labels, prep
 
+    def _dtype_hint(self, stats, column, categorical, narrow):
+        """ Select data type for loading column.
+        
+        Args:
+            stats: statistics on table (with lower case columns)
+            column: name of column (lower case)
+            categorical: whether categorical types are admissible
+            narrow: whether narrow integer types are admissible
+        
+        Returns:
+            name of pandas data type or None (keep default)
+        """
+        dtype = stats['dtypes'][column]
+        if dtype == 'object' and categorical and \
+            2 * stats['distinct'][column] <= stats['rows']:
+            return 'category'
+        if dtype == 'int64' and narrow and column in stats['min']:
+            for narrow_type, bound in [('int16', 2**15), ('int32', 2**31)]:
+                if -bound <= stats['min'][column] and \
+                    stats['max'][column] < bound:
+                    return narrow_type
+        return None
+    
     def _eq_nl(self, expression):
         """ Translate equality condition into natural language. """
         return self._cmp(expression, 'equals')
@@ -465,6 +799,19 @@ class NlPlanner():
             labels += new_labels + [', ']
         return labels[:-1], plan
     
+    def _filter_plan(self, pred):
+        """ Returns plan filtering rows via given predicate. """
+        _, pred_plan = self.nl(pred)
+        pred_plan = self._simplify_plan(pred_plan)
+        tables = self._tables(pred)
+        if len(tables) == 1:
+            table = tables.pop()
+            prefix = f'Filter {table}:'
+        else:
+            prefix = 'Filter table:'
+        pred_plan.prefix_last_step(prefix)
+        return pred_plan
+    
     def _from_nl(self, expression):
         """ Translates from clause into natural language description. """
         last_label = None
@@ -525,12 +872,111 @@ class NlPlanner():
         assert predicate.key == 'eq', 'No equality join predicate'
         left_op = predicate.args.get('this')
         right_op = predicate.args.get('expression')
+        return self._eq_label(left_op, right_op)
+    
+    def _eq_label(self, left_op, right_op):
+        """ Translate equality between left and right column into label. """
         left_labels, _ = self._column_nl(left_op)
         right_labels, _ = self._column_nl(right_op)
         left_label = ' '.join(left_labels)
         right_label = ' '.join(right_labels)
         return left_label + ' (left) equals ' + right_label + ' (right)'
     
+    def _join_order(self, expression, tbl_expressions):
+        """ Select join order minimizing estimated intermediate results.
+        
+        Tables are joined greedily, starting with the table with the
+        smallest estimated cardinality after filtering. Then, the table
+        minimizing the estimated join result size is added in each
+        step. Estimates assume independent predicates and uniform data.
+        
+        Args:
+            expression: select query with joins
+            tbl_expressions: expressions of tables in from clause and joins
+        
+        Returns:
+            list of table indexes with join columns (left/right) or None
+        """
+        db_id = current_db_id.get(None)
+        joins = expression.args.get('joins') or []
+        if self.catalog is None or db_id is None or not joins or \
+            len(tbl_expressions) != len(joins) + 1:
+            return None
+        
+        aliases = []
+        cards = []
+        tbl_stats = []
+        for tbl_expression in tbl_expressions:
+            names = self._table_names(tbl_expression)
+            if names is None:
+                return None
+            table, alias = names
+            stats = self._table_stats(db_id, table)
+            if stats is None:
+                return None
+            aliases.append(alias)
+            cards.append(stats['rows'])
+            tbl_stats.append(stats)
+        
+        edges = []
+        for join in joins:
+            predicate = join.args.get('on')
+            if join.args.get('side') or join.args.get('kind') or \
+                predicate is None or predicate.key != 'eq':
+                return None
+            ops = [predicate.args['this'], predicate.args['expression']]
+            tbl_idxs = [self._alias_index(op, aliases) for op in ops]
+            if None in tbl_idxs or tbl_idxs[0] == tbl_idxs[1]:
+                return None
+            edges.append((tbl_idxs, ops))
+        
+        where = expression.args.get('where')
+        conjuncts = self._conjuncts(where.args['this']) if where else []
+        for pred in conjuncts:
+            tbl_idxs = {self._alias_index(c, aliases) for c in 
+                        pred.find_all(sqlglot.expressions.Column)}
+            if len(tbl_idxs) == 1 and None not in tbl_idxs:
+                tbl_idx = tbl_idxs.pop()
+                cards[tbl_idx] *= self._selectivity(pred, tbl_stats[tbl_idx])
+        
+        def nr_distinct(op, tbl_idx):
+            """ Returns number of distinct values in join column. """
+            column = op.args['this'].args.get('this').lower()
+            distinct = tbl_stats[tbl_idx]['distinct']
+            return distinct.get(column, cards[tbl_idx])
+        
+        first = min(range(len(cards)), key=lambda i:(cards[i], i))
+        order = [(first, None, None)]
+        joined = {first}
+        size = cards[first]
+        while len(joined) < len(cards):
+            best = None
+            for (idx_1, idx_2), (op_1, op_2) in edges:
+                for new, old, new_op, old_op in [
+                    (idx_2, idx_1, op_2, op_1), (idx_1, idx_2, op_1, op_2)]:
+                    if new in joined or old not in joined:
+                        continue
+                    keys = max(
+                        nr_distinct(old_op, old), 
+                        nr_distinct(new_op, new), 1)
+                    estimate = size * cards[new] / keys
+                    if best is None or (estimate, new) < best[:2]:
+                        best = (estimate, new, old_op, new_op)
+            if best is None:
+                return None
+            size, new, old_op, new_op = best
+            order.append((new, old_op, new_op))
+            joined.add(new)
+        return order
+    
+    def _alias_index(self, column, aliases):
+        """ Returns index of table referenced by column (or None). """
+        table = column.args.get('table')
+        if column.key != 'column' or table is None:
+            return None
+        alias = table.args.get('this').lower()
+        return aliases.index(alias) if alias in aliases else None
+    
     def _join_nl(self, expression):
         """ Translates join expression into natural language. """
         raise NotImplementedError
@@ -559,6 +1005,80 @@ class NlPlanner():
         """ Translate SQL LIKE into natural language. """
         return self._cmp(expression, 'matches')
 
+    def _load_hints(self, expression, tbl_expressions):
+        """ Generate hints on columns and data types for loading tables.
+        
+        Hints restrict loaded columns to the ones referenced in the
+        query. They propose categorical types for string columns with
+        many duplicates (if the query does not group, sort, or compare
+        them) and narrow integer types (unless used in arithmetic).
+        
+        Args:
+            expression: select query loading tables
+            tbl_expressions: expressions of loaded tables
+        
+        Returns:
+            list with hint for each table (empty lists without hints)
+        """
+        no_hints = [[] for _ in tbl_expressions]
+        db_id = current_db_id.get(None)
+        if self.catalog is None or db_id is None:
+            return no_hints
+        
+        schema = self.catalog.schema(db_id)
+        aliases = []
+        tbl_columns = []
+        for tbl_expression in tbl_expressions:
+            names = self._table_names(tbl_expression)
+            if names is None or names[0].lower() not in schema.lower_tables:
+                return no_hints
+            table, alias = names
+            tbl_idx = schema.lower_tables.index(table.lower())
+            aliases.append(alias)
+            tbl_columns.append(schema.table_columns[tbl_idx])
+        
+        needed = [set() for _ in tbl_expressions]
+        for column in expression.find_all(sqlglot.expressions.Column):
+            if column.args['this'].key == 'star':
+                if column.parent is None or column.parent.key != 'count':
+                    return no_hints
+                continue
+            name = column.args['this'].args.get('this').lower()
+            table = column.args.get('table')
+            for idx, columns in enumerate(tbl_columns):
+                if table is None or \
+                    table.args.get('this').lower() == aliases[idx]:
+                    needed[idx].update(
+                        c for c in columns if c.lower() == name)
+        
+        no_category = self._columns_under(expression, [
+            'group', 'order', 'gt', 'gte', 'lt', 'lte', 'max', 'min'])
+        no_narrow = self._columns_under(
+            expression, ['add', 'sub', 'mul', 'div'])
+        hints = []
+        for idx, tbl_expression in enumerate(tbl_expressions):
+            columns = [c for c in tbl_columns[idx] if c in needed[idx]]
+            columns = columns or tbl_columns[idx][:1]
+            table = self._table_names(tbl_expression)[0]
+            stats = self._table_stats(db_id, table)
+            type_labels = []
+            for column in columns:
+                dtype = None
+                name = column.lower()
+                if stats is not None and name in stats['dtypes']:
+                    dtype = self._dtype_hint(
+                        stats, name, name not in no_category, 
+                        name not in no_narrow)
+                if dtype is not None:
+                    type_labels.append(f'{self._name_label(column)}: {dtype}')
+            
+            column_labels = [self._name_label(c) for c in columns]
+            hint = '(columns ' + ', '.join(column_labels)
+            if type_labels:
+                hint += '; types ' + ', '.join(type_labels)
+            hints.append([hint + ')'])
+        return hints
+    
     def _lower_ids(self, expression):
         """ Lower references to databases, tables, and columns. """
         def lower_id(node):
@@ -589,6 +1109,14 @@ class NlPlanner():
         """ Translate minimum aggregate into natural language. """
         return self._agg_nl(expression, 'minimum')
     
+    def _name_label(self, name):
+        """ Construct text label for table or column name. """
+        if not self.id_case:
+            name = name.lower()
+        if self.quote_ids:
+            name = f"'{name}'"
+        return name
+    
     def _neg_nl(self, expression):
         """ Translates negation into natural language. """
         labels, plan = self.nl(expression, 'this')
@@ -616,6 +1144,55 @@ class NlPlanner():
         direction = '(descending)' if is_desc else '(ascending)'
         return last_labels + [direction], plan
 
+    def _optimized_joins(
+            self, expression, tables_aliases, join_order, load_hints):
+        """ Load, filter, and join tables in given order.
+        
+        Predicates on single tables are applied after loading
+        the table, other predicates after joining all tables.
+        
+        Args:
+            expression: select query with joins
+            tables_aliases: labels of tables and their aliases
+            join_order: table indexes with join columns (left/right)
+            load_hints: hints on loading each table (lists of strings)
+        
+        Returns:
+            plan and label of join result
+        """
+        aliases = [alias for _, alias in tables_aliases]
+        alias_preds = collections.defaultdict(lambda:[])
+        other_preds = []
+        if expression.args.get('where'):
+            where_expr = expression.args['where'].args['this']
+            for pred in self._conjuncts(where_expr):
+                tables = self._tables(pred)
+                if len(tables) == 1 and list(tables)[0] in aliases:
+                    alias_preds[tables.pop()].append(pred)
+                else:
+                    other_preds.append(pred)
+        
+        plan = NlPlan()
+        for tbl_idx, _, _ in join_order:
+            table, alias = tables_aliases[tbl_idx]
+            step = ['Load table'] + [table] + ['and store as'] + [alias]
+            plan.add_step(step + load_hints[tbl_idx])
+            for pred in alias_preds[alias]:
+                plan.add_plan(self._filter_plan(pred))
+        
+        left_label = tables_aliases[join_order[0][0]][1]
+        for tbl_idx, left_op, right_op in join_order[1:]:
+            right_label = tables_aliases[tbl_idx][1]
+            eq_label = self._eq_label(
+                self._strip_tables(left_op), self._strip_tables(right_op))
+            step = ['Join'] + [left_label] + ['with'] + \
+                [right_label] + ['- condition:'] + [eq_label]
+            left_label = plan.add_step(step)
+        
+        for pred in other_preds:
+            plan.add_plan(self._filter_plan(pred))
+        return plan, left_label
+    
     def _or_nl(self, expression):
         """ Translate logical or into natural language. """
         return self._cmp(expression, 'or')
@@ -634,7 +1211,11 @@ class NlPlanner():
             return self._complex_select_nl(expression)
 
         else:
+            from_expressions = expression.args['from'].args['expressions']
+            load_hints = self._load_hints(expression, from_expressions)
             from_labels, plan = self.nl(expression, 'from')
+            if len(from_expressions) == 1 and load_hints[0]:
+                plan.suffix_last_step(*load_hints[0])
             last_labels = from_labels
             
             if expression.args.get('where'):
@@ -694,6 +1275,32 @@ class NlPlanner():
             
             return last_labels, plan
     
+    def _selectivity(self, pred, stats):
+        """ Estimate fraction of rows satisfying predicate.
+        
+        Args:
+            pred: predicate on one table
+            stats: statistics on table (with lower case columns)
+        
+        Returns:
+            estimated selectivity of predicate
+        """
+        if pred.key in ['eq', 'is']:
+            operands = [pred.args['this'], pred.args['expression']]
+            for column, other in [operands, reversed(operands)]:
+                if column.key != 'column':
+                    continue
+                name = column.args['this'].args.get('this')
+                if not isinstance(name, str):
+                    continue
+                nulls = stats['nulls'].get(name.lower(), 0)
+                if pred.key == 'is' and other.key == 'null':
+                    return nulls
+                if pred.key == 'eq' and other.key == 'literal':
+                    distinct = stats['distinct'].get(name.lower(), 1)
+                    return (1 - nulls) / max(distinct, 1)
+        return 1.0 / 3
+    
     def _set_operation(self, expression, prefix, connector, postfix):
         """ Translate set expression into natural language.
         
@@ -728,9 +1335,9 @@ class NlPlanner():
         """
         id_to_step = plan.id_to_step()
         step_ref_counts = plan.step_ref_counts()
-        for step_id, step in plan.id_steps:
+        for step in plan.step_table:
             new_step = []
-            for part in step:
+            for part in step.parts:
                 if isinstance(part, int):
                     ref_step = id_to_step[part]
                     if ref_step[0] == 'Check if':
@@ -741,11 +1348,12 @@ class NlPlanner():
                         continue
                 
                 new_step += [part]
-            id_to_step[step_id] = new_step
-        id_steps = sorted(id_to_step.items(), key=lambda t:t[0])
+            id_to_step[step.id] = new_step
         
         new_plan = NlPlan()
-        new_plan.id_steps = id_steps
+        for step_id in sorted(id_to_step):
+            new_plan.step_table.append(PlanStep(step_id, id_to_step[step_id]))
+        new_plan.positions = None
         return new_plan
     
     def _star_nl(self, _):
@@ -785,6 +1393,43 @@ class NlPlanner():
         last_labels = [plan.add_step(step)]
         return last_labels, plan
     
+    def _table_stats(self, db_id, table):
+        """ Returns table statistics (with lower case columns) or None. """
+        schema = self.catalog.schema(db_id)
+        if table.lower() not in schema.lower_tables:
+            return None
+        tbl_idx = schema.lower_tables.index(table.lower())
+        try:
+            stats = self.catalog.table_stats(db_id, schema.tables[tbl_idx])
+        except Exception as e:
+            print(f'Cannot obtain statistics for {table}: {e}')
+            return None
+        lower_stats = {'rows':stats['rows']}
+        for key in ['distinct', 'nulls', 'dtypes', 'min', 'max']:
+            lower_stats[key] = {c.lower():v for c, v in stats[key].items()}
+        return lower_stats
+    
+    def _stats_version(self, db_id):
+        """ Returns hash over statistics of database tables or None. """
+        if db_id is None:
+            return None
+        try:
+            return self.catalog.stats_version(db_id)
+        except Exception as e:
+            print(f'Cannot obtain statistics for {db_id}: {e}')
+            return None
+    
+    def _table_names(self, tbl_expression):
+        """ Returns table name and lower case alias (or None). """
+        alias = None
+        if tbl_expression.key == 'alias':
+            alias = tbl_expression.args['alias'].args.get('this')
+            tbl_expression = tbl_expression.args['this']
+        if tbl_expression.key != 'table':
+            return None
+        table = tbl_expression.args['this'].args.get('this')
+        return table, (alias or table).lower()
+    
     def _tables(self, expression):
         """ Returns set of tables mentioned in expression. """
         tables = set()
@@ -829,6 +1474,41 @@ class NlPlanner():
         return self._set_operation(expression, 'Form union of', 'and', postfix)
 
 
+# Planner of worker process (initialized once per worker)
+worker_planner = None
+
+
+def init_plan_worker(id_case, quote_ids, catalog):
+    """ Initializes planner of worker process.
+    
+    Args:
+        id_case: whether to consider letter case for identifiers
+        quote_ids: whether to place all identifiers in quotes
+        catalog: optimize plans via statistics of this catalog
+    """
+    global worker_planner
+    worker_planner = NlPlanner(id_case, quote_ids, catalog)
+
+
+def plan_task(key):
+    """ Plan for query in worker process.
+    
+    Args:
+        key: key of plan in plan cache (starting with query)
+    
+    Returns:
+        key and plan (None if query cannot be planned)
+    """
+    query = key[0]
+    db_id = key[-1]
+    try:
+        plan = worker_planner._plan(query, db_id)
+    except Exception as e:
+        print(f'Cannot plan for query {query}: {e}')
+        plan = None
+    return key, plan
+
+
 if __name__ == '__main__':
     
     with open('/Users/immanueltrummer/benchmarks/spider/results_dev.json') as file:
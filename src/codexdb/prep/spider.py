@@ -4,6 +4,8 @@ Created on Sep 19, 2021
 @author: immanueltrummer
 '''
 import argparse
+import codexdb.cases
+import codexdb.catalog
 import collections
 import json
 import pandas as pd
@@ -22,12 +24,13 @@ def get_db_path(spider_dir, db_id):
     return f'{spider_dir}/database/{db_id}/{db_id}.sqlite'
 
 
-def extract(spider_dir, db_json):
+def extract(spider_dir, db_json, table_format='csv'):
     """ Extract data from database into .csv files. 
     
     Args:
         spider_dir: path to SPIDER main directory
         db_json: JSON description of database
+        table_format: store copies of .csv files in this format
     """
     db_id = db_json['db_id']
     db_dir = f'{spider_dir}/database/{db_id}'
@@ -41,6 +44,8 @@ def extract(spider_dir, db_json):
             df = pd.read_sql_query(query, con)
             out_path = f'{db_dir}/{tbl}.csv'
             df.to_csv(out_path, index=False)
+            if table_format != 'csv':
+                codexdb.catalog.convert_table(out_path, table_format)
 
 
 def get_result(spider_dir, query_json):
@@ -69,6 +74,9 @@ if __name__ == '__main__':
     
     parser = argparse.ArgumentParser()
     parser.add_argument('spider', type=str, help='Path to SPIDER benchmark')
+    parser.add_argument(
+        '--table_format', type=str, default='csv', 
+        help='Store copies of tables in this format (parquet or feather)')
     args = parser.parse_args()
         
     tables_path = f'{args.spider}/tables.json'
@@ -80,16 +88,19 @@ if __name__ == '__main__':
             db_id = db['db_id']
             db_to_s[db_id] = db
             print(f'Extracting {db_id} ({db_idx+1}/{nr_dbs})')
-            extract(args.spider, db)
+            extract(args.spider, db, args.table_format)
     db_path = f'{args.spider}/schemata.json'
     with open(db_path, 'w') as file:
         json.dump(db_to_s, file)
+    store_path = f'{args.spider}/schemata.jsonl'
+    codexdb.catalog.write_schema_store(db_to_s, store_path)
     
     for in_file in ['train_spider', 'dev']:
         db_to_q = collections.defaultdict(lambda:[])
-        all_results = []
         train_path = f'{args.spider}/{in_file}.json'
-        with open(train_path) as file:
+        results_path = f'{args.spider}/results_{in_file}.jsonl'
+        with open(train_path) as file, \
+            codexdb.cases.TestCaseWriter(results_path) as writer:
             queries = json.load(file)
             nr_queries = len(queries)
             nr_valid = 0
@@ -106,15 +117,12 @@ if __name__ == '__main__':
                     row = {
                         'db_id':db_id, 'question':question,
                         'query':query, 'results':result}
-                    all_results.append(row)
+                    writer.write(row)
                     nr_valid += 1
                 except:
                     print(f'Invalid Query: {query} on {db_id}')
         
             print(f'Processed {nr_valid}/{nr_queries} queries')
-            results_path = f'{args.spider}/results_{in_file}.json'
-            with open(results_path, 'w') as file:
-                json.dump(all_results, file)
         
         q_path = f'{args.spider}/{in_file}_queries.json'
         with open(q_path, 'w') as file:
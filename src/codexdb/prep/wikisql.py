@@ -4,6 +4,9 @@ Created on Jan 15, 2022
 @author: immanueltrummer
 '''
 import argparse
+import codexdb.cases
+import codexdb.catalog
+import io
 import json
 import jsonlines
 import lib.dbengine
@@ -28,13 +31,14 @@ def sql_name(raw_name):
     return sql_name.strip()
 
 
-def extract_data(source_dir, split, target_dir):
+def extract_data(source_dir, split, target_dir, pack=None):
     """ Extract data from given split and store on hard disk.
     
     Args:
         source_dir: source data directory
         split: treat this split of data
         target_dir: write into this directory
+        pack: write table files into this pack (optional)
     """
     tbl_path = f'{source_dir}/{split}.tables.jsonl'
     db_path = f'{source_dir}/{split}.db'
@@ -50,6 +54,10 @@ def extract_data(source_dir, split, target_dir):
             df = pd.read_sql_query(query, connection)
             raw_columns = table['header']
             df.columns = [sql_name(c) for c in raw_columns]
+            if pack is not None:
+                content = df.to_csv(index=False).encode()
+                pack.write(table_id, 'Data.csv', content)
+                continue
             out_dir = f'{target_dir}/database/{table_id}'
             os.makedirs(out_dir, exist_ok=True)
             out_path = f'{out_dir}/Data.csv'
@@ -84,27 +92,30 @@ def extract_schemata(source_dir, split):
     return schemata
 
 
-def extract_tests(source_dir, split, target_dir):
+def extract_tests(source_dir, split, target_dir, pack=None):
     """ Extract test cases from file.
     
     Args:
         source_dir: source directory of WikiSQL
         split: extract queries from this split
         target_dir: target directory for data
+        pack: read table files from this pack (optional)
     
     Returns:
-        list of extracted test cases
+        generator yielding extracted test cases
     """
     in_path = f'{source_dir}/{split}.jsonl'
     with jsonlines.open(in_path) as file:
-        out_cases = []
         for idx, in_case in enumerate(file):
             # if idx == 3729:
                 # print('Here!')
             out_case = {}
             db_id = in_case['table_id']
             out_case['db_id'] = db_id
-            csv_path = f'{target_dir}/database/{db_id}/Data.csv'
+            if pack is not None:
+                csv_path = io.BytesIO(pack.read(db_id, 'Data.csv'))
+            else:
+                csv_path = f'{target_dir}/database/{db_id}/Data.csv'
             db_path = '/tmp/tmp.db'
             df = pd.read_csv(csv_path)
             with sqlite3.connect(db_path) as connection:
@@ -126,32 +137,46 @@ def extract_tests(source_dir, split, target_dir):
             out_case['query'] = str(query)
             result = [[r] for r in raw_result if r is not None]
             out_case['results'] = result
-            out_cases.append(out_case)
-
-    return out_cases
+            yield out_case
 
 if __name__ == '__main__':
     
     parser = argparse.ArgumentParser()
     parser.add_argument('source_dir', type=str, help='Path of WikiSQL directory')
     parser.add_argument('target_dir', type=str, help='Write test cases here')
+    parser.add_argument(
+        '--pack', action='store_true', 
+        help='Pack all table files into one file (tables.pack)')
     args = parser.parse_args()
     
     schemata = {}
     test_cases = []
+    splits = ['dev', 'test', 'train']
     
-    for split in ['dev', 'test', 'train']:
-        print(f'Processing {split} split ...')
-        
-        extract_data(args.source_dir, split, args.target_dir)
+    os.makedirs(args.target_dir, exist_ok=True)
+    pack_path = f'{args.target_dir}/tables.pack'
+    writer = codexdb.catalog.TablePackWriter(pack_path) if args.pack else None
+    for split in splits:
+        print(f'Extracting data of {split} split ...')
+        extract_data(args.source_dir, split, args.target_dir, writer)
         split_schemata = extract_schemata(args.source_dir, split)
         schemata = {**schemata, **split_schemata}
-        
-        tests = extract_tests(args.source_dir, split, args.target_dir)
-        test_out = f'{args.source_dir}/results_{split}.json'
-        with open(test_out, 'w') as file:
-            json.dump(tests, file)
+    pack = None
+    if writer is not None:
+        writer.close()
+        pack = codexdb.catalog.TablePack(pack_path)
+    
+    for split in splits:
+        print(f'Processing {split} split ...')
+        tests = extract_tests(
+            args.source_dir, split, args.target_dir, pack)
+        test_out = f'{args.source_dir}/results_{split}.jsonl'
+        with codexdb.cases.TestCaseWriter(test_out) as writer:
+            for test_case in tests:
+                writer.write(test_case)
     
     schema_out = f'{args.target_dir}/schemata.json'
     with open(schema_out, 'w') as file:
-        json.dump(schemata, file)
\ No newline at end of file
+        json.dump(schemata, file)
+    store_out = f'{args.target_dir}/schemata.jsonl'
+    codexdb.catalog.write_schema_store(schemata, store_out)
\ No newline at end of file
@@ -0,0 +1,243 @@
+import gzip
+import json
+import os
+
+
+class ResultWriter():
+    """ Appends results of finished test cases to a progress file. """
+
+    def __init__(self, path, resume, sync_every=5):
+        """ Opens progress file (one JSON object per line).
+
+        Results are flushed after each test case, surviving a crash
+        or kill of the writing process. Calls to fsync, protecting
+        against system crashes, are batched.
+
+        Args:
+            path: path to progress file
+            resume: whether to append to existing progress file
+            sync_every: synchronize with disk after that many cases
+        """
+        self.path = path
+        self.sync_every = sync_every
+        self.nr_unsynced = 0
+        self.db_ids = set()
+        if resume and os.path.exists(path):
+            truncate_torn_line(path)
+            for entry in progress_entries(path):
+                if 'db' in entry and 'idx' not in entry:
+                    self.db_ids.add(entry['db'])
+        self.file = open(path, 'a' if resume else 'w')
+
+    def __enter__(self):
+        """ Returns writer for use in with statement. """
+        return self
+
+    def __exit__(self, *_):
+        """ Synchronizes and closes progress file. """
+        self.close()
+
+    def close(self):
+        """ Synchronizes and closes progress file. """
+        self.sync()
+        self.file.close()
+
+    def sync(self):
+        """ Forces pending results to disk. """
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.nr_unsynced = 0
+
+    def write(self, idx, results):
+        """ Appends results for one test case.
+
+        The schema of each database is written once (in a separate
+        line, before the first test case referencing it).
+
+        Args:
+            idx: index of test case
+            results: list of tries for test case
+        """
+        schemata = {}
+        results = normalize(results, schemata)
+        for db_id, db_info in schemata.items():
+            if db_id not in self.db_ids:
+                self.db_ids.add(db_id)
+                line = json.dumps({'db':db_id, **db_info})
+                self.file.write(line + '\n')
+        line = json.dumps({'idx':idx, 'results':results})
+        self.file.write(line + '\n')
+        self.file.flush()
+        self.nr_unsynced += 1
+        if self.nr_unsynced >= self.sync_every:
+            self.sync()
+
+
+def dump_results(idx_to_results, path):
+    """ Write results for all test cases into one file.
+
+    Paths ending with .gz select the normalized format: schema and
+    files of each database are stored once and referenced by tries
+    via database ID, and the file is compressed. Otherwise, results
+    are written in the legacy format (one plain JSON dictionary).
+
+    Args:
+        idx_to_results: maps test case indexes to lists of tries
+        path: path to result file (.json or .json.gz)
+    """
+    idx_to_results = dict(sorted(idx_to_results.items()))
+    if path.endswith('.gz'):
+        schemata = {}
+        idx_to_results = {
+            idx:normalize(results, schemata) for 
+            idx, results in idx_to_results.items()}
+        data = {'schemata':schemata, 'results':idx_to_results}
+        with gzip.open(path, 'wt') as file:
+            json.dump(data, file)
+    else:
+        with open(path, 'w') as file:
+            json.dump(idx_to_results, file)
+
+
+def load_progress(path):
+    """ Load results for finished test cases from progress file.
+
+    Args:
+        path: path to progress file
+
+    Returns:
+        dictionary mapping test case indexes to lists of tries
+    """
+    idx_to_results = {}
+    schemata = {}
+    if os.path.exists(path):
+        for entry in progress_entries(path):
+            if 'idx' in entry:
+                idx_to_results[entry['idx']] = entry['results']
+            else:
+                schemata[entry.pop('db')] = entry
+    for results in idx_to_results.values():
+        rehydrate(results, schemata)
+    return idx_to_results
+
+
+def load_results(path, with_schemata=True):
+    """ Load results for all test cases from result file.
+
+    Supports both formats written by dump_results. If requested,
+    tries in normalized files are completed with schema and files
+    (shared between tries on the same database).
+
+    Args:
+        path: path to result file (.json or .json.gz)
+        with_schemata: whether tries must contain schema and files
+
+    Returns:
+        dictionary mapping test case indexes to lists of tries
+    """
+    with open(path, 'rb') as file:
+        compressed = file.read(2) == b'\x1f\x8b'
+    if not compressed:
+        with open(path) as file:
+            return json.load(file)
+
+    with gzip.open(path, 'rt') as file:
+        data = json.load(file)
+    idx_to_results = data['results']
+    if with_schemata:
+        for results in idx_to_results.values():
+            rehydrate(results, data['schemata'])
+    return idx_to_results
+
+
+def normalize(results, schemata):
+    """ Replace schema and files in tries by database reference.
+
+    Args:
+        results: list of tries for one test case
+        schemata: maps database IDs to schema and files (extended)
+
+    Returns:
+        list of tries without schema and files
+    """
+    normalized = []
+    for one_try in results:
+        one_try = dict(one_try)
+        schema = one_try.pop('schema', None)
+        files = one_try.pop('files', None)
+        if schema is not None:
+            db_id = one_try['db']
+            schemata[db_id] = {'schema':schema, 'files':files}
+        normalized.append(one_try)
+    return normalized
+
+
+def progress_entries(path):
+    """ Iterates over complete entries in progress file.
+
+    Args:
+        path: path to progress file
+
+    Returns:
+        generator of test case results and database schemata
+    """
+    with open(path) as file:
+        for line in file:
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                print(f'Skipping incomplete line in {path}')
+
+
+def progress_path(result_path):
+    """ Returns path of progress file for given result file.
+
+    Args:
+        result_path: path to result .json file
+
+    Returns:
+        path to associated progress file (.jsonl)
+    """
+    if result_path.endswith('.gz'):
+        result_path = result_path[:-3]
+    return os.path.splitext(result_path)[0] + '.jsonl'
+
+
+def truncate_torn_line(path):
+    """ Remove incomplete last line (e.g., after a crash) from file.
+
+    Lines appended afterwards would otherwise be merged with the
+    incomplete line and lost when loading progress.
+
+    Args:
+        path: path to progress file
+    """
+    with open(path, 'rb+') as file:
+        size = file.seek(0, os.SEEK_END)
+        end = size
+        while end > 0:
+            start = max(0, end - (1 << 16))
+            file.seek(start)
+            chunk = file.read(end - start)
+            newline = chunk.rfind(b'\n')
+            if newline >= 0:
+                end = start + newline + 1
+                break
+            end = start
+        if end < size:
+            print(f'Removing incomplete last line from {path}')
+            file.truncate(end)
+
+
+def rehydrate(results, schemata):
+    """ Add schema and files to tries referencing a database.
+
+    Args:
+        results: list of tries for one test case (changed in place)
+        schemata: maps database IDs to schema and files
+    """
+    for one_try in results:
+        db_id = one_try.get('db')
+        if 'schema' not in one_try and db_id in schemata:
+            one_try['schema'] = schemata[db_id]['schema']
+            one_try['files'] = schemata[db_id]['files']
@@ -0,0 +1,280 @@
+import abc
+import argparse
+import codexdb.results
+import collections
+import json
+
+
+class TryScheduler(abc.ABC):
+    """ Decides on temperature of next try and when to stop. """
+
+    def __init__(self, max_tries):
+        """ Initializes with maximal number of tries.
+
+        Args:
+            max_tries: maximal number of tries per test case
+        """
+        self.max_tries = max_tries
+
+    @abc.abstractmethod
+    def next_temperature(self, test_case, tries):
+        """ Select temperature for next try.
+
+        Args:
+            test_case: test case to solve
+            tries: prior (failed) tries for test case
+
+        Returns:
+            temperature for next try or None to stop trying
+        """
+        raise NotImplementedError()
+
+    def schedule(self, test_case):
+        """ Plan temperatures of all tries, assuming they fail.
+
+        Args:
+            test_case: test case to solve
+
+        Returns:
+            list of temperatures
+        """
+        temperatures = []
+        tries = []
+        while True:
+            temperature = self.next_temperature(test_case, tries)
+            if temperature is None:
+                return temperatures
+            temperatures.append(temperature)
+            tries.append(failed_try(temperature))
+
+
+class FixedScheduler(TryScheduler):
+    """ Uses a fixed sequence of temperatures. """
+
+    def __init__(self, temperatures):
+        """ Initializes with temperature for each try.
+
+        Args:
+            temperatures: list of temperatures
+        """
+        super().__init__(len(temperatures))
+        self.temperatures = temperatures
+
+    def next_temperature(self, test_case, tries):
+        """ Returns next temperature in sequence (None at end). """
+        if len(tries) >= self.max_tries:
+            return None
+        return self.temperatures[len(tries)]
+
+
+class LearnedScheduler(TryScheduler):
+    """ Selects temperatures by success rates in prior runs.
+
+    Success rates are estimated per run settings (prompt style and
+    number of samples), query features, try index, and temperature.
+    Estimates with few observations are smoothed towards the rate
+    for the same try index and temperature over all queries (and,
+    successively, towards the rate over all temperatures and tries).
+    """
+
+    def __init__(
+            self, counts, prompt_style, nr_samples, max_tries,
+            max_temperature, min_success=0.05, prior_weight=5):
+        """ Initializes with success counts from prior runs.
+
+        Args:
+            counts: maps observation keys to [nr_successes, nr_tries]
+            prompt_style: prompt style of current run
+            nr_samples: number of samples in prompts of current run
+            max_tries: maximal number of tries per test case
+            max_temperature: maximal temperature
+            min_success: stop if success probability is below
+            prior_weight: weight of smoothing prior (in observations)
+        """
+        super().__init__(max_tries)
+        self.counts = counts
+        self.prompt_style = prompt_style
+        self.nr_samples = nr_samples
+        self.max_temperature = max_temperature
+        self.min_success = min_success
+        self.prior_weight = prior_weight
+
+    @staticmethod
+    def fit(runs):
+        """ Count successes over tries in result files.
+
+        Tries without recorded temperature use the linear schedule
+        of the run, if its maximal tries and temperature are given.
+
+        Args:
+            runs: list of dictionaries with result path, prompt style,
+                  nr. samples, and (optionally) max. tries/temperature
+
+        Returns:
+            maps observation keys to [nr_successes, nr_tries]
+        """
+        counts = collections.defaultdict(lambda:[0, 0])
+        for run in runs:
+            results = codexdb.results.load_results(run['path'], False)
+            for tries in results.values():
+                for one_try in tries:
+                    if one_try.get('template_hit') or \
+                        one_try.get('compiled') or \
+                        one_try.get('cancelled'):
+                        continue
+                    try_idx = one_try['nr_tries'] - 1
+                    temperature = one_try.get('temperature')
+                    if temperature is None:
+                        if 'max_tries' not in run:
+                            continue
+                        temperature = try_idx * \
+                            run['max_temperature'] / run['max_tries']
+                    features = query_features(one_try['query'])
+                    solved = one_try['similarity'] >= 1.0
+                    for key in observation_keys(
+                        run['prompt_style'], run['nr_samples'],
+                        features, try_idx, temperature):
+                        counts[key][0] += solved
+                        counts[key][1] += 1
+        return dict(counts)
+
+    @staticmethod
+    def load(path, *pargs, **kwargs):
+        """ Load success counts from file.
+
+        Args:
+            path: path to file written via save
+            pargs: further arguments of constructor
+            kwargs: further keyword arguments of constructor
+
+        Returns:
+            learned scheduler
+        """
+        with open(path) as file:
+            counts = {
+                tuple(e['key']):e['counts'] for e in json.load(file)}
+        return LearnedScheduler(counts, *pargs, **kwargs)
+
+    @staticmethod
+    def save(counts, path):
+        """ Write success counts into file.
+
+        Args:
+            counts: maps observation keys to [nr_successes, nr_tries]
+            path: write counts to this file
+        """
+        entries = [{'key':k, 'counts':c} for k, c in counts.items()]
+        with open(path, 'w') as file:
+            json.dump(entries, file)
+
+    def next_temperature(self, test_case, tries):
+        """ Select temperature maximizing success probability. """
+        try_idx = len(tries)
+        if try_idx >= self.max_tries:
+            return None
+        features = query_features(test_case['query'])
+        nr_steps = round(self.max_temperature * 10)
+        temperatures = [s / 10 for s in range(nr_steps + 1)]
+        temperature = max(temperatures, key=lambda t:(
+            self.success_rate(features, try_idx, t), -t))
+        success = self.success_rate(features, try_idx, temperature)
+        print(f'Estimated success rate of try {try_idx}: {success}')
+        if success < self.min_success:
+            return None
+        return temperature
+
+    def success_rate(self, features, try_idx, temperature):
+        """ Estimates probability that next try succeeds.
+
+        Args:
+            features: query features
+            try_idx: index of next try
+            temperature: temperature of next try
+
+        Returns:
+            estimated success probability
+        """
+        keys = observation_keys(
+            self.prompt_style, self.nr_samples,
+            features, try_idx, temperature)
+        nr_successes, nr_tries = self.counts.get(keys[-1], [0, 0])
+        rate = (nr_successes + 1) / (nr_tries + 2)
+        for key in reversed(keys[:-1]):
+            nr_successes, nr_tries = self.counts.get(key, [0, 0])
+            rate = (nr_successes + self.prior_weight * rate) / \
+                (nr_tries + self.prior_weight)
+        return rate
+
+
+def failed_try(temperature):
+    """ Returns placeholder for try that is assumed to fail.
+
+    Args:
+        temperature: temperature of try
+
+    Returns:
+        dictionary describing failed try
+    """
+    return {'temperature':temperature, 'executed':False, 'similarity':0}
+
+
+def observation_keys(
+        prompt_style, nr_samples, features, try_idx, temperature):
+    """ Returns keys of try observations, from specific to general.
+
+    Args:
+        prompt_style: prompt style of run
+        nr_samples: number of samples in prompts
+        features: features of query
+        try_idx: index of try
+        temperature: temperature of try
+
+    Returns:
+        list of observation keys (tuples)
+    """
+    temperature = round(temperature, 1)
+    return [
+        (prompt_style, nr_samples, *features, try_idx, temperature),
+        (prompt_style, nr_samples, try_idx, temperature),
+        (try_idx, temperature), (try_idx,), ()]
+
+
+def query_features(query):
+    """ Extract features of SQL query relevant for success.
+
+    Args:
+        query: SQL query
+
+    Returns:
+        tuple of flags: joins, grouping, nesting
+    """
+    query = ' '.join(query.lower().split())
+    has_join = ' join ' in query
+    has_group = 'group by' in query
+    has_nesting = query.count('select') > 1
+    return has_join, has_group, has_nesting
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('out_path', type=str, help='Path of output file')
+    parser.add_argument(
+        'runs', type=str, nargs='+', help='Result files of prior runs, '
+        'each as PATH:PROMPT_STYLE:NR_SAMPLES[:MAX_TRIES:MAX_TEMPERATURE]')
+    args = parser.parse_args()
+
+    runs = []
+    for run_spec in args.runs:
+        parts = run_spec.split(':')
+        run = {
+            'path':parts[0], 'prompt_style':parts[1],
+            'nr_samples':int(parts[2])}
+        if len(parts) == 5:
+            run['max_tries'] = int(parts[3])
+            run['max_temperature'] = float(parts[4])
+        runs.append(run)
+
+    counts = LearnedScheduler.fit(runs)
+    LearnedScheduler.save(counts, args.out_path)
+    print(f'Wrote success counts for {len(counts)} keys to {args.out_path}')
@@ -4,14 +4,26 @@ Created on Jan 3, 2022
 @author: immanueltrummer
 '''
 import argparse
+import codexdb.backend
+import codexdb.cases
 import codexdb.catalog
 import codexdb.code
+import codexdb.compiler
 import codexdb.engine
+import codexdb.lint
+import codexdb.plan
+import codexdb.results
+import codexdb.schedule
+import codexdb.template
+import codexdb.validate
+import concurrent.futures
 import contextlib
-import json
+import numpy as np
 import os
 import openai
 import pandas as pd
+import queue
+import threading
 import time
 
 def extract_samples(catalog, path_to_results):
@@ -24,8 +36,7 @@ def extract_samples(catalog, path_to_results):
     Returns:
         list of extracted examples
     """
-    with open(path_to_results) as file:
-        prior_results = json.load(file)
+    prior_results = codexdb.results.load_results(path_to_results)
     
     examples = []
     for cur_results in prior_results.values():
@@ -41,84 +52,319 @@ def extract_samples(catalog, path_to_results):
             
     return examples
     
+def column_kind(ref_column, cmp_column):
+    """ Determine common representation for comparing two columns.
+    
+    Args:
+        ref_column: column of reference result
+        cmp_column: column of result to compare
+    
+    Returns:
+        'int' or 'float' if both columns are numeric, 'str' otherwise
+    """
+    types = pd.api.types
+    if types.is_integer_dtype(ref_column) and \
+        types.is_integer_dtype(cmp_column):
+        return 'int'
+    numeric = [
+        types.is_numeric_dtype(c) and not types.is_bool_dtype(c) 
+        for c in [ref_column, cmp_column]]
+    return 'float' if all(numeric) else 'str'
+
+def column_hashes(column, kind):
+    """ Hash normalized values of result column.
+    
+    Equal values in string representation (after removing
+    the suffix '.0' from integers stored as floats) obtain
+    equal hashes, regardless of the representation kind.
+    
+    Args:
+        column: column of query result
+        kind: representation used for hashing ('int', 'float', 'str')
+    
+    Returns:
+        numpy array with one unsigned 64 bit hash per value
+    """
+    if kind == 'int':
+        values = column.to_numpy(dtype='int64')
+    elif kind == 'float':
+        values = column.to_numpy(dtype='float64', copy=True)
+        values[np.isnan(values)] = np.nan
+        values += 0.0
+    else:
+        values = column.astype(str)
+        values = values.str.replace(r'\.0$', '', regex=True)
+        values = values.to_numpy(dtype=object)
+    return pd.util.hash_array(values)
+
+def row_hashes(hashes_by_column, nr_rows):
+    """ Combine column hashes into one hash per row.
+    
+    Args:
+        hashes_by_column: list of hash arrays (one per column)
+        nr_rows: number of rows in result
+    
+    Returns:
+        numpy array with one unsigned 64 bit hash per row
+    """
+    combined = np.zeros(nr_rows, dtype='uint64')
+    for col_hashes in hashes_by_column:
+        combined = (combined ^ col_hashes) * np.uint64(0x100000001b3)
+    return combined
+
+class ReferenceResult():
+    """ Reference query result, normalized once for many comparisons. """
+    
+    def __init__(self, output):
+        """ Initializes from reference result.
+        
+        Args:
+            output: reference query result as data frame
+        """
+        self.output = output
+        self.shape = output.shape
+        self.kinds_to_hashes = {}
+    
+    @classmethod
+    def from_rows(cls, rows):
+        """ Create reference from result rows (as stored in test cases).
+        
+        Args:
+            rows: list of result rows
+        
+        Returns:
+            reference result with typed columns
+        """
+        return cls(pd.DataFrame(rows))
+    
+    def multiset(self, kinds):
+        """ Returns row hashes for given column representations.
+        
+        Args:
+            kinds: representation kind for each column
+        
+        Returns:
+            row hashes, distinct sorted row hashes, their multiplicities
+        """
+        kinds = tuple(kinds)
+        if kinds not in self.kinds_to_hashes:
+            hashes_by_column = []
+            for col_idx, kind in enumerate(kinds):
+                column = self.output.iloc[:, col_idx]
+                hashes_by_column.append(column_hashes(column, kind))
+            hashes = row_hashes(hashes_by_column, self.shape[0])
+            distinct, counts = np.unique(hashes, return_counts=True)
+            self.kinds_to_hashes[kinds] = (hashes, distinct, counts)
+        return self.kinds_to_hashes[kinds]
+    
+    def nr_diffs(self, cmp_output, reorder):
+        """ Count rows that differ from reference, using row hashes.
+        
+        Args:
+            cmp_output: compare this result (with equal shape)
+            reorder: whether to ignore row order (multiset comparison)
+        
+        Returns:
+            number of rows in one result without match in the other
+        """
+        kinds = []
+        cmp_by_column = []
+        for col_idx in range(self.shape[1]):
+            ref_column = self.output.iloc[:, col_idx]
+            cmp_column = cmp_output.iloc[:, col_idx]
+            kind = column_kind(ref_column, cmp_column)
+            kinds.append(kind)
+            cmp_by_column.append(column_hashes(cmp_column, kind))
+        cmp_hashes = row_hashes(cmp_by_column, cmp_output.shape[0])
+        ref_hashes, ref_distinct, ref_counts = self.multiset(kinds)
+        if not reorder:
+            return 2 * int(np.count_nonzero(ref_hashes != cmp_hashes))
+        
+        cmp_distinct, cmp_counts = np.unique(cmp_hashes, return_counts=True)
+        positions = np.searchsorted(ref_distinct, cmp_distinct)
+        positions = np.minimum(positions, len(ref_distinct) - 1)
+        matched = ref_distinct[positions] == cmp_distinct
+        nr_common = np.minimum(
+            cmp_counts[matched], ref_counts[positions[matched]]).sum()
+        return int(len(ref_hashes) + len(cmp_hashes) - 2 * nr_common)
+
+    def __str__(self):
+        """ Returns string representation of reference result. """
+        return str(self.output)
+
 def result_cmp(ref_output, cmp_output, reorder):
     """ Compares query result output against reference.
     
     Args:
-        ref_output: reference query result
+        ref_output: reference query result (data frame or reference)
         cmp_output: compare this against reference
         reorder: whether to consider reordering
     
     Returns:
         Comparable flag, number of differences, similarity
     """
+    if not isinstance(ref_output, ReferenceResult):
+        ref_output = ReferenceResult(ref_output)
     print(f'-- CodexDB output:\n{cmp_output}\n--\n')
-    print(f'CodexDB Index: {cmp_output.index}')
-    print(f'CodexDB info: {cmp_output.info()}')
     print(f'-- Reference output:\n{ref_output}\n--\n')
-    print(f'Reference Index: {ref_output.index}')
-    print(f'Reference info: {ref_output.info()}')
     
-    ref_output.columns = range(ref_output.shape[1])
-    cmp_output.columns = range(cmp_output.shape[1])
+    nr_ref_rows = ref_output.shape[0]
+    nr_cmp_rows = cmp_output.shape[0]
+    if nr_ref_rows == 0 and nr_cmp_rows == 0:
+        return True, 0, 1.0
+    if ref_output.shape != cmp_output.shape:
+        print('(Incomparable)')
+        print(f'Shapes differ: {ref_output.shape} vs. {cmp_output.shape}')
+        return False, -1, 0
+    
     try:
-        print('Casting all columns to string type ...')
-        ref_output = ref_output.astype(str)
-        cmp_output = cmp_output.astype(str)
-        
-        print('Normalizing representation of integers ...')
-        def to_int(float_str):
-            """ Transforms rounded float values into integers. """
-            if float_str.endswith('.0'):
-                return float_str[:-2]
-            else:
-                return float_str
-        ref_output = ref_output.applymap(to_int)
-        cmp_output = cmp_output.applymap(to_int)
-        
-        print('Normalizing representation of lists ...')
-        def unwrap(cell):
-            """ Unwrap elements from singleton lists. """
-            if isinstance(cell, list) and len(cell) == 1:
-                return cell[0]
-            else:
-                return cell
-        ref_output = ref_output.applymap(unwrap)
-        cmp_output = cmp_output.applymap(unwrap)
-        
-        if reorder:
-            print('Reordering Rows Before Comparison')
-            nr_columns = len(ref_output.columns)
-            column_idxs = list(range(nr_columns))
-            ref_output.sort_values(by=column_idxs, inplace=True)
-            cmp_output.sort_values(by=column_idxs, inplace=True)
-
-        ref_output.reset_index(drop=True, inplace=True)
-        cmp_output.reset_index(drop=True, inplace=True)
-
-        print(f'--- CodexDB column types:\n{cmp_output.dtypes}')
-        print(f'--- CodexDB normalized output:\n{cmp_output}\n--\n')
-        print(f'--- Reference column types:\n{ref_output.dtypes}')
-        print(f'--- Normalized reference output:\n{ref_output}\n--\n')
-        
-        nr_ref_rows = ref_output.shape[0]
-        nr_cmp_rows = cmp_output.shape[0]
-        if nr_ref_rows == 0 and nr_cmp_rows == 0:
-            diffs = pd.DataFrame()
-        else:
-            diffs = ref_output.compare(cmp_output, align_axis=0)
-        print(f'-- Differences:\n{diffs}\n--\n')
-        nr_diffs = diffs.shape[0]
+        nr_diffs = ref_output.nr_diffs(cmp_output, reorder)
+        print(f'-- Number of differences: {nr_diffs}')
         return True, nr_diffs, 1.0/(nr_diffs+1)
     except Exception as e:
         print('(Incomparable)')
         print(f'Exception: {e}')
         return False, -1, 0
 
+def screen(db_id, code, validator, linter, max_lint_score):
+    """ Screen generated code before executing it.
+    
+    Args:
+        db_id: code references data in this database
+        code: generated code to screen
+        validator: rejects invalid code (optional)
+        linter: detects performance anti-patterns (optional)
+        max_lint_score: reject code exceeding this lint score (optional)
+    
+    Returns:
+        reason for rejecting code (or None), lint findings
+    """
+    invalid_reason = None
+    if validator is not None:
+        _, invalid_reason = validator.validate(db_id, code)
+    
+    findings = []
+    if linter is not None:
+        findings = linter.lint(code)
+        lint_score = linter.score(findings)
+        print(f'Performance lint score: {lint_score}')
+        if invalid_reason is None and max_lint_score is not None and \
+            lint_score > max_lint_score:
+            invalid_reason = f'Lint score {lint_score} exceeds ' \
+                f'{max_lint_score}'
+    
+    return invalid_reason, findings
+
+def bypass_try(
+        test_case, schema, files, code, gen_total_s, engine, 
+        validator, linter, ref_output, reorder):
+    """ Execute code obtained without LLM (e.g., from a template).
+    
+    Args:
+        test_case: test case solved by code
+        schema: schema of queried database
+        files: names of files storing tables
+        code: code to execute
+        gen_total_s: time for obtaining code in seconds
+        engine: execution engine for code
+        validator: rejects invalid code before execution (optional)
+        linter: detects performance anti-patterns in code (optional)
+        ref_output: reference result
+        reorder: whether to ignore row order when comparing results
+    
+    Returns:
+        dictionary describing try (with try number zero)
+    """
+    db_id = test_case['db_id']
+    invalid_reason, findings = screen(db_id, code, validator, linter, None)
+    executed = False
+    codb_result = pd.DataFrame([[]])
+    elapsed_s = {'total_s':0}
+    if invalid_reason is None:
+        executed, codb_result, elapsed_s = engine.execute(db_id, code, 30)
+    comparable, nr_diffs, similarity = result_cmp(
+        ref_output, codb_result, reorder)
+    return {
+        'nr_tries':0, 'executed':executed, 
+        'comparable':comparable, 'nr_diffs':nr_diffs, 
+        'similarity':similarity, 'outsize':len(codb_result), 
+        'question':test_case['question'], 'query':test_case['query'], 
+        'db':db_id, 'schema':schema, 'files':files, 
+        'code':code, 'gen_stats':{}, 
+        'gen_total_s':gen_total_s, 'execution_s':elapsed_s, 
+        'invalid_reason':invalid_reason, 'lint':findings, 
+        'temperature':None, 'template_hit':False, 'compiled':False}
+
+def compilable(coder):
+    """ Check if code compiled from queries can replace generated code.
+    
+    Args:
+        coder: code generator
+    
+    Returns:
+        True iff coder generates Python code without modifications
+    """
+    return isinstance(coder, codexdb.code.PythonGenerator) and \
+        not (coder.mod_start or coder.mod_between or coder.mod_end)
+
+def generate_try(coder, test_case, temperature, rate_limiter, correction=None):
+    """ Generate code for one try, respecting the LLM rate limit.
+    
+    Args:
+        coder: code generator to use
+        test_case: a natural language query
+        temperature: temperature used for generation
+        rate_limiter: delays requests to respect LLM rate limit (optional)
+        correction: additional instruction for generated code (optional)
+    
+    Returns:
+        generation statistics, generated code, generation time
+    """
+    print("Waiting due to OpenAI's rate limit ...")
+    if rate_limiter is None:
+        time.sleep(3)
+    else:
+        rate_limiter.wait()
+    gen_start_s = time.time()
+    gen_stats, code = coder.generate(
+        test_case, temperature, correction=correction)
+    gen_total_s = time.time() - gen_start_s
+    return gen_stats, code, gen_total_s
+
 def solve(catalog, test_case, coder, engine, 
-          termination, max_tries, max_temperature):
+          termination, max_tries, max_temperature, 
+          validator=None, linter=None, max_lint_score=None, 
+          rate_limiter=None, pipeline=False, scheduler=None, 
+          templates=None, compile_queries=False):
     """ Solve given test case by generating code.
     
+    If queries are compiled, code translated directly from the SQL
+    query (without using the LLM) is tried first. This requires the
+    Python code generator without modifications (which would be
+    ignored by the translation). If the compiled code satisfies the
+    termination criterion, no code is generated.
+    
+    If a template cache is given, code instantiated from a cached
+    template (for a query differing only in literals) is tried
+    first. If it satisfies the termination criterion, no code is
+    generated. Code solving the test case is added to the cache.
+    
+    The scheduler selects the temperature of each try and decides
+    when to stop trying. By default, temperatures increase linearly
+    up to the maximal temperature over the maximal number of tries.
+    
+    If lint findings exceed the maximal score, the code is not
+    executed. Instead, the next try uses an instruction to avoid
+    the detected anti-patterns (passed to the code generator). 
+    
+    In pipelined mode, code for the next try is generated while
+    code of the current try executes. If the current try satisfies
+    the termination criterion, the speculative generation is
+    cancelled. If it started already, its result is awaited and
+    recorded as discarded try (with its generation statistics) in
+    the last try. The temperature of the speculative try is
+    selected assuming that the current try fails.
+    
     Args:
         catalog: database catalog
         test_case: a natural language query
@@ -127,6 +373,14 @@ def solve(catalog, test_case, coder, engine,
         termination: criterion to advance to next case
         max_tries: maximal number of tries
         max_temperature: maximal temperature
+        validator: rejects invalid code before execution (optional)
+        linter: detects performance anti-patterns in code (optional)
+        max_lint_score: maximal lint score before regeneration (optional)
+        rate_limiter: delays requests to respect LLM rate limit (optional)
+        pipeline: whether to overlap generation and execution
+        scheduler: selects temperatures and number of tries (optional)
+        templates: cache of code templates (optional)
+        compile_queries: whether to try code compiled from the query
     
     Returns:
         list of dictionaries with generated code and statistics
@@ -137,49 +391,499 @@ def solve(catalog, test_case, coder, engine,
     question = test_case['question']
     query = test_case['query']
     reorder = False if 'order by' in query.lower() else True
-    temperature_step = max_temperature / max_tries
+    ref_output = ReferenceResult.from_rows(test_case['results'])
+    if scheduler is None:
+        scheduler = linear_scheduler(max_tries, max_temperature)
     print(f'Treating query {query}, question {question}.')
 
+    template_tries = []
+    if compile_queries and compilable(coder):
+        start_s = time.time()
+        code = codexdb.compiler.compile_query(
+            query, schema, files, coder.id_case)
+        gen_total_s = time.time() - start_s
+        if code is not None:
+            print(f'Compiled code:\n-------\n{code}\n-------\n')
+            compiled_try = bypass_try(
+                test_case, schema, files, code, gen_total_s, engine, 
+                validator, linter, ref_output, reorder)
+            compiled_try['compiled'] = True
+            template_tries.append(compiled_try)
+            if terminates(
+                termination, compiled_try['executed'], 
+                compiled_try['similarity']):
+                print('Termination Criterion Satisfied by Compiled Code.')
+                return template_tries
+    
+    if templates is not None:
+        code = templates.instantiate(schema, files, query)
+        if code is not None:
+            print(f'Instantiated template code:\n-------\n{code}\n-------\n')
+            template_try = bypass_try(
+                test_case, schema, files, code, 0, engine, 
+                validator, linter, ref_output, reorder)
+            template_try['template_hit'] = True
+            template_tries.append(template_try)
+            if terminates(
+                termination, template_try['executed'], 
+                template_try['similarity']):
+                print('Termination Criterion Satisfied by Template.')
+                return template_tries
+
     results = []
-    for try_idx in range(max_tries):
-        print("Waiting due to OpenAI's rate limit ...")
-        time.sleep(3)
-        print(f'Starting try number {try_idx} ...')
-        gen_start_s = time.time()
-        temperature = try_idx * temperature_step
-        gen_stats, code = coder.generate(test_case, temperature)
-        print(f'Generated code:\n-------\n{code}\n-------\n')
-        print(f'Reference Query: "{query}"')
-        gen_total_s = time.time() - gen_start_s
-        executed, codb_result, elapsed_s = engine.execute(db_id, code, 30)
-        print(f'CodexDB executed: {executed} in {elapsed_s}s')
-        ref_output = pd.DataFrame(test_case['results'])
+    correction = None
+    executor = concurrent.futures.ThreadPoolExecutor(1) if pipeline else None
+    next_try = None
+    try:
+        temperature = scheduler.next_temperature(test_case, results)
+        while temperature is not None:
+            try_idx = len(results)
+            print(f'Starting try number {try_idx} ...')
+            if next_try is None:
+                gen_stats, code, gen_total_s = generate_try(
+                    coder, test_case, temperature, rate_limiter, correction)
+            else:
+                gen_stats, code, gen_total_s = next_try.result()
+                next_try = None
+            print(f'Generated code:\n-------\n{code}\n-------\n')
+            print(f'Reference Query: "{query}"')
+            last_try = (try_idx == scheduler.max_tries - 1)
+            invalid_reason, findings = screen(
+                db_id, code, validator, linter, 
+                None if last_try else max_lint_score)
+            if invalid_reason is not None and findings and \
+                linter.score(findings) > max_lint_score:
+                correction = linter.correction(findings)
+            
+            next_temperature = None
+            if pipeline:
+                next_temperature = scheduler.next_temperature(
+                    test_case, 
+                    results + [codexdb.schedule.failed_try(temperature)])
+            if next_temperature is not None:
+                next_try = executor.submit(
+                    generate_try, coder, test_case, 
+                    next_temperature, rate_limiter, correction)
+            
+            if invalid_reason is None:
+                executed, codb_result, elapsed_s = engine.execute(
+                    db_id, code, 30)
+            else:
+                print(f'Code rejected before execution: {invalid_reason}')
+                executed = False
+                codb_result = pd.DataFrame([[]])
+                elapsed_s = {'total_s':0}
+            print(f'CodexDB executed: {executed} in {elapsed_s}s')
+            comparable, nr_diffs, similarity = result_cmp(
+                ref_output, codb_result, reorder)
+            nr_tries = try_idx + 1
+            results.append({
+                'nr_tries':nr_tries, 'executed':executed, 
+                'comparable':comparable, 'nr_diffs':nr_diffs, 
+                'similarity':similarity, 'outsize':len(codb_result), 
+                'question':question, 'query':query, 
+                'db':db_id, 'schema':schema, 'files':files, 
+                'code':code, 'gen_stats':gen_stats, 
+                'gen_total_s':gen_total_s, 'execution_s':elapsed_s, 
+                'invalid_reason':invalid_reason, 'lint':findings, 
+                'temperature':temperature, 'template_hit':False, 
+                'compiled':False})
+    
+            if terminates(termination, executed, similarity):
+                print('Termination Criterion Satisfied.')
+                break
+            
+            if pipeline:
+                temperature = next_temperature
+            else:
+                temperature = scheduler.next_temperature(test_case, results)
+    finally:
+        if next_try is not None and not next_try.cancel():
+            print('Waiting for speculatively generated code ...')
+            try:
+                gen_stats, code, gen_total_s = next_try.result()
+                discarded = {
+                    'code':code, 'gen_stats':gen_stats, 
+                    'gen_total_s':gen_total_s, 
+                    'temperature':next_temperature}
+                print(f'Discarding speculative try: {gen_stats}')
+                if results:
+                    results[-1]['discarded'] = discarded
+            except Exception as e:
+                print(f'Speculative generation failed: {e}')
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    if templates is not None:
+        solved = [r for r in results if r['similarity'] >= 1.0]
+        if solved:
+            templates.add(schema, files, query, solved[0]['code'])
+    return template_tries + results
+
+def terminates(termination, executed, similarity):
+    """ Check whether try satisfies termination criterion.
+    
+    Args:
+        termination: criterion to stop ('executed', 'solved', or None)
+        executed: whether code executed successfully
+        similarity: similarity between code result and reference
+    
+    Returns:
+        True if no further tries are required
+    """
+    return termination is None or \
+        (termination == 'executed' and executed) or \
+        (termination == 'solved' and similarity >= 1.0)
+
+def run_candidate(
+        coder, test_case, free_engines, engine_lock, stop, try_idx, 
+        temperature, ref_output, reorder, validator, linter, 
+        max_lint_score, rate_limiter):
+    """ Generate, execute, and compare one candidate of a race.
+    
+    Args:
+        coder: code generator to use
+        test_case: a natural language query
+        free_engines: queue of execution engines not in use
+        engine_lock: protects checking for stop and taking an engine
+        stop: event signaling that the race is decided
+        try_idx: index of candidate in temperature schedule
+        temperature: temperature used for generation
+        ref_output: reference result (or None to skip comparison)
+        reorder: whether result order is irrelevant
+        validator: rejects invalid code before execution (optional)
+        linter: detects performance anti-patterns in code (optional)
+        max_lint_score: maximal lint score before rejection (optional)
+        rate_limiter: delays requests to respect LLM rate limit (optional)
+    
+    Returns:
+        try record (flagged as cancelled if race was decided before)
+    """
+    db_id = test_case['db_id']
+    gen_stats, code, gen_total_s = generate_try(
+        coder, test_case, temperature, rate_limiter)
+    invalid_reason, findings = screen(
+        db_id, code, validator, linter, max_lint_score)
+    executed = False
+    codb_result = pd.DataFrame([[]])
+    elapsed_s = {'total_s':0}
+    cancelled = False
+    if invalid_reason is None:
+        with engine_lock:
+            cancelled = stop.is_set()
+            if not cancelled:
+                engine = free_engines.get()
+        if not cancelled:
+            try:
+                with engine.lock:
+                    executed, codb_result, elapsed_s = engine.execute(
+                        db_id, code, 30)
+            finally:
+                free_engines.put(engine)
+    
+    if ref_output is None or cancelled:
+        comparable, nr_diffs, similarity = False, -1, 0
+    else:
         comparable, nr_diffs, similarity = result_cmp(
             ref_output, codb_result, reorder)
-        nr_tries = try_idx + 1
-        results.append({
-            'nr_tries':nr_tries, 'executed':executed, 'comparable':comparable, 
-            'nr_diffs':nr_diffs, 'similarity':similarity, 
-            'outsize':len(codb_result), 
-            'question':question, 'query':query, 
-            'db':db_id, 'schema':schema, 'files':files, 
-            'code':code, 'gen_stats':gen_stats, 'gen_total_s':gen_total_s,
-            'execution_s':elapsed_s})
+    return {
+        'nr_tries':try_idx+1, 'executed':executed, 
+        'comparable':comparable, 'nr_diffs':nr_diffs, 
+        'similarity':similarity, 'outsize':len(codb_result), 
+        'question':test_case['question'], 'query':test_case['query'], 
+        'db':db_id, 'code':code, 'gen_stats':gen_stats, 
+        'gen_total_s':gen_total_s, 'execution_s':elapsed_s, 
+        'invalid_reason':invalid_reason, 'lint':findings, 
+        'temperature':temperature, 'cancelled':cancelled, 
+        'output':codb_result}
 
-        if (termination == 'executed' and executed) or \
-            (termination == 'solved' and similarity >= 1.0):
-            print('Termination Criterion Satisfied.')
-            break
+def pending_candidate(test_case, try_idx, temperature):
+    """ Create record for candidate not finished when race is decided.
+    
+    Args:
+        test_case: a natural language query
+        try_idx: index of candidate in temperature schedule
+        temperature: temperature used for generation
+    
+    Returns:
+        try record flagged as cancelled (without generation statistics)
+    """
+    return {
+        'nr_tries':try_idx+1, 'executed':False, 'comparable':False, 
+        'nr_diffs':-1, 'similarity':0, 'outsize':0, 
+        'question':test_case['question'], 'query':test_case['query'], 
+        'db':test_case['db_id'], 'code':None, 'gen_stats':None, 
+        'gen_total_s':None, 'execution_s':{'total_s':0}, 
+        'invalid_reason':None, 'lint':None, 'temperature':temperature, 
+        'cancelled':True, 'race':{'finish_s':None, 'winner':False}, 
+        'output':pd.DataFrame([[]])}
 
+def race(catalog, test_case, coder, engines, termination, temperatures, 
+         validator=None, linter=None, max_lint_score=None, 
+         rate_limiter=None, ref_output=None, keep_output=False):
+    """ Solve given test case by racing concurrent candidates.
+    
+    Candidates are generated in rounds, one candidate per engine,
+    following the temperature schedule. Each candidate is executed
+    as soon as its code is available. The first candidate satisfying
+    the termination criterion wins and the race returns immediately.
+    Candidates that did not start executing by then are not executed.
+    They are still recorded and flagged as cancelled. Generation
+    statistics of candidates still generating code are added to
+    their records once generation finishes. Without termination
+    criterion, the first finished candidate wins.
+    
+    Args:
+        catalog: database catalog
+        test_case: a natural language query
+        coder: code generator to use
+        engines: execution engines with separate working directories
+        termination: criterion to stop ('executed', 'solved', or None)
+        temperatures: temperature for each candidate
+        validator: rejects invalid code before execution (optional)
+        linter: detects performance anti-patterns in code (optional)
+        max_lint_score: maximal lint score of executed code (optional)
+        rate_limiter: delays requests to respect LLM rate limit (optional)
+        ref_output: reference result (default: from test case)
+        keep_output: whether to keep query results in try records
+    
+    Returns:
+        list of dictionaries with generated code and statistics
+    """
+    db_id = test_case['db_id']
+    schema = catalog.schema(db_id)
+    files = catalog.files(db_id)
+    query = test_case['query']
+    reorder = False if 'order by' in query.lower() else True
+    if ref_output is None and 'results' in test_case:
+        ref_output = ReferenceResult.from_rows(test_case['results'])
+    print(f'Racing {len(engines)} candidates for query {query}.')
+    
+    free_engines = queue.Queue()
+    for engine in engines:
+        free_engines.put(engine)
+    engine_lock = threading.Lock()
+    stop = threading.Event()
+    executor = concurrent.futures.ThreadPoolExecutor(len(engines))
+    start_s = time.time()
+    results = []
+    submitted = []
+    collected = set()
+    
+    def collect(future):
+        """ Add record of finished candidate to results. """
+        collected.add(future)
+        result = future.result()
+        result['race'] = {
+            'finish_s':time.time() - start_s, 'winner':False}
+        results.append(result)
+        return result
+    
+    def complete(record, future):
+        """ Add generation statistics to record of pending candidate. """
+        if future.cancelled():
+            return
+        try:
+            result = future.result()
+        except Exception as e:
+            print(f'Candidate failed: {e}')
+            return
+        for key in ['code', 'gen_stats', 'gen_total_s', 'lint']:
+            record[key] = result[key]
+    
+    try:
+        nr_candidates = len(temperatures)
+        for round_start in range(0, nr_candidates, len(engines)):
+            round_end = min(round_start + len(engines), nr_candidates)
+            futures = []
+            for try_idx in range(round_start, round_end):
+                last_try = (try_idx == nr_candidates - 1)
+                future = executor.submit(
+                    run_candidate, coder, test_case, free_engines, 
+                    engine_lock, stop, try_idx, temperatures[try_idx], 
+                    ref_output, reorder, validator, linter, 
+                    None if last_try else max_lint_score, rate_limiter)
+                futures.append(future)
+                submitted.append((try_idx, future))
+            
+            for future in concurrent.futures.as_completed(futures):
+                result = collect(future)
+                print(f'Candidate {result["nr_tries"]} finished: ' 
+                      f'executed: {result["executed"]}, ' 
+                      f'similarity: {result["similarity"]}')
+                if terminates(
+                    termination, result['executed'], result['similarity']):
+                    print('Termination Criterion Satisfied.')
+                    result['race']['winner'] = True
+                    with engine_lock:
+                        stop.set()
+                    break
+            if stop.is_set():
+                break
+    finally:
+        with engine_lock:
+            stop.set()
+        # Record candidates in flight without waiting for them
+        for try_idx, future in submitted:
+            if future in collected:
+                continue
+            if future.done() and not future.cancelled():
+                try:
+                    collect(future)
+                except Exception as e:
+                    print(f'Candidate failed: {e}')
+                continue
+            record = pending_candidate(
+                test_case, try_idx, temperatures[try_idx])
+            results.append(record)
+            future.add_done_callback(
+                lambda future, record=record: complete(record, future))
+        executor.shutdown(wait=False, cancel_futures=True)
+    
+    for result in results:
+        result['schema'] = schema
+        result['files'] = files
+        if not keep_output:
+            del result['output']
+    results.sort(key=lambda r:r['nr_tries'])
     return results
 
+def check_settings(language, prompt_style, termination):
+    """ Verify that run settings are supported.
+    
+    Args:
+        language: generate code in this language
+        prompt_style: choose prompt template
+        termination: termination criterion
+    
+    Raises:
+        ValueError if settings are not supported
+    """
+    if language not in ['python', 'sql']:
+        raise ValueError(f'Unknown implementation language: {language}!')
+    if prompt_style not in ['question', 'query', 'plan', 'data']:
+        raise ValueError(f'Unknown prompt style: {prompt_style}!')
+    if termination not in ['executed', 'solved']:
+        raise ValueError(f'Unknown termination criterion: {termination}')
+
+def create_solvers(
+        catalog, language, model_id, prompt_style, id_case,
+        mod_start, mod_between, mod_end, examples, nr_samples,
+        stream=False, validate=False, max_lint_score=None, tmp_dir=None,
+        hedge_model=None, hedge_percentile=95, replay_path=None,
+        optimize_plans=False):
+    """ Create components for generating and executing code.
+    
+    Args:
+        catalog: database catalog
+        language: generate code in this language
+        model_id: OpenAI engine for code generation
+        prompt_style: choose prompt template
+        id_case: whether to consider letter case of identifiers
+        mod_start: modification at plan start
+        mod_between: modifications between steps
+        mod_end: modification at plan end
+        examples: examples for few-shot learning
+        nr_samples: number of examples in prompt
+        stream: whether to stream completions from the LLM
+        validate: whether to check Python code before execution
+        max_lint_score: regenerate Python code above this lint score
+        tmp_dir: working directory of engine (default: $CODEXDB_TMP)
+        hedge_model: hedge slow LLM requests with this model (optional)
+        hedge_percentile: hedge after this percentile of latency
+        replay_path: replay code from this result file (no LLM access)
+        optimize_plans: whether to order plan steps via data statistics
+    
+    Returns:
+        code generator, execution engine, validator, linter
+    """
+    validator = None
+    linter = None
+    backend = codexdb.backend.create_backend(
+        hedge_model, hedge_percentile, replay_path)
+    if language == 'python':
+        coder = codexdb.code.PythonGenerator(
+            catalog, examples, nr_samples, 
+            prompt_style, model_id, 
+            id_case=id_case,
+            mod_start=mod_start, 
+            mod_between=mod_between, 
+            mod_end=mod_end, 
+            optimize_plans=optimize_plans,
+            stream=stream,
+            backend=backend)
+        engine = codexdb.engine.PythonEngine(
+            catalog, id_case, tmp_dir)
+        if validate:
+            validator = codexdb.validate.CodeValidator(
+                catalog, id_case)
+        if max_lint_score is not None:
+            linter = codexdb.lint.PerformanceLinter()
+    elif language == 'sql':
+        coder = codexdb.code.SqlGenerator(
+            catalog, examples, nr_samples, 
+            prompt_style, model_id, 
+            stream=stream,
+            backend=backend)
+        engine = codexdb.engine.SqliteEngine(catalog, tmp_dir)
+    return coder, engine, validator, linter
+
+def create_engines(catalog, language, id_case, nr_engines, tmp_dir=None):
+    """ Create engines that can execute code concurrently.
+    
+    Args:
+        catalog: database catalog
+        language: execute code in this language
+        id_case: whether to consider letter case of identifiers
+        nr_engines: number of engines to create
+        tmp_dir: parent of engine working directories (optional)
+    
+    Returns:
+        list of execution engines with separate working directories
+    """
+    tmp_dir = tmp_dir or os.environ['CODEXDB_TMP']
+    engines = []
+    for engine_id in range(nr_engines):
+        engine_dir = f'{tmp_dir}/engine{engine_id}'
+        os.makedirs(engine_dir, exist_ok=True)
+        if language == 'python':
+            engine = codexdb.engine.PythonEngine(
+                catalog, id_case, engine_dir)
+        else:
+            engine = codexdb.engine.SqliteEngine(catalog, engine_dir)
+        engines.append(engine)
+    return engines
+
+def linear_scheduler(max_tries, max_temperature):
+    """ Create scheduler increasing temperature linearly over tries.
+    
+    Args:
+        max_tries: maximal number of tries
+        max_temperature: maximal temperature
+    
+    Returns:
+        scheduler with temperature i*max_temperature/max_tries for try i
+    """
+    temperature_step = max_temperature / max_tries
+    return codexdb.schedule.FixedScheduler(
+        [i * temperature_step for i in range(max_tries)])
+
 def main(
         data_dir, test_path, language, model_id, prompt_style, id_case,
         mod_start, mod_between, mod_end, sample_path, nr_samples, 
         test_start, test_step, test_end, termination, max_tries,
-        max_temperature, log_path, result_path):
+        max_temperature, log_path, result_path, stream=False, 
+        validate=False, max_lint_score=None, resume=False, pipeline=False,
+        nr_candidates=1, hedge_model=None, hedge_percentile=95, 
+        replay_path=None, schedule_path=None, template_path=None,
+        compile_queries=False, optimize_plans=False, table_format='csv',
+        plan_cache_path=None):
     """ Try solving given test cases and write results to file.
     
+    Results for each finished test case are appended to a progress
+    file (.jsonl) next to the result file. When resuming, test cases
+    with results in the progress file are skipped.
+    
     Args:
         data_dir: directory containing database
         test_path: path to file with test cases
@@ -199,54 +903,89 @@ def main(
         max_tries: maximal tries per test case
         max_temperature: maximal temperature
         log_path: path for logging output
-        result_path: path to result .json file
+        result_path: path to result file (.json or compressed .json.gz)
+        stream: whether to stream completions from the LLM
+        validate: whether to check Python code before execution
+        max_lint_score: regenerate Python code above this lint score
+        resume: whether to resume from progress file of prior run
+        pipeline: whether to generate next try during execution
+        nr_candidates: race that many candidates concurrently if above one
+        hedge_model: hedge slow LLM requests with this model (optional)
+        hedge_percentile: hedge after this percentile of latency
+        replay_path: replay code from this result file (no LLM access)
+        schedule_path: schedule tries via success counts in this file
+        template_path: reuse and store code templates in this file
+        compile_queries: try code compiled from SQL before generating code
+        optimize_plans: order plan steps via data statistics
+        table_format: preferred format of table files
+        plan_cache_path: reuse and store query plans in this file
     """
-    catalog = codexdb.catalog.DbCatalog(data_dir)
+    catalog = codexdb.catalog.DbCatalog(data_dir, table_format)
     os.environ['KMP_DUPLICATE_LIB_OK']='True'
+    if plan_cache_path:
+        codexdb.plan.enable_disk_cache(plan_cache_path)
     
-    with open(test_path) as file:
-        test_cases = json.load(file)
-    if language not in ['python', 'sql']:
-        raise ValueError(f'Unknown implementation language: {language}!')
+    check_settings(language, prompt_style, termination)
+    if pipeline and nr_candidates > 1:
+        raise ValueError('Pipelining and racing cannot be combined!')
     examples = []
     if sample_path:
-        with open(sample_path) as file:
-            examples = extract_samples(catalog, sample_path)
-    if prompt_style not in ['question', 'query', 'plan', 'data']:
-        raise ValueError(f'Unknown prompt style: {prompt_style}!')
-    if termination not in ['executed', 'solved']:
-        raise ValueError(f'Unknown termination criterion: {termination}')
+        examples = extract_samples(catalog, sample_path)
+    if schedule_path:
+        scheduler = codexdb.schedule.LearnedScheduler.load(
+            schedule_path, prompt_style, nr_samples, 
+            max_tries, max_temperature)
+    else:
+        scheduler = linear_scheduler(max_tries, max_temperature)
+    templates = None
+    if template_path:
+        templates = codexdb.template.TemplateCache(template_path)
+
+    progress_path = codexdb.results.progress_path(result_path)
+    idx_to_results = {}
+    if resume:
+        idx_to_results = codexdb.results.load_progress(progress_path)
 
-    with open(log_path, 'w') as log_file:
+    with open(log_path, 'a' if resume else 'w') as log_file, \
+        codexdb.results.ResultWriter(progress_path, resume) as writer, \
+        codexdb.cases.TestCaseStore(test_path) as test_cases:
         with contextlib.redirect_stdout(log_file):
-            if language == 'python':
-                coder = codexdb.code.PythonGenerator(
-                    catalog, examples, nr_samples, 
-                    prompt_style, model_id, 
-                    id_case=id_case,
-                    mod_start=mod_start, 
-                    mod_between=mod_between, 
-                    mod_end=mod_end)
-                engine = codexdb.engine.PythonEngine(
-                    catalog, id_case)
-            elif language == 'sql':
-                coder = codexdb.code.SqlGenerator(
-                    catalog, examples, nr_samples, 
-                    prompt_style, model_id)
-                engine = codexdb.engine.SqliteEngine(catalog)
+            coder, engine, validator, linter = create_solvers(
+                catalog, language, model_id, prompt_style, id_case, 
+                mod_start, mod_between, mod_end, examples, nr_samples, 
+                stream, validate, max_lint_score, None, 
+                hedge_model, hedge_percentile, replay_path, optimize_plans)
+            if nr_candidates > 1:
+                engines = create_engines(
+                    catalog, language, id_case, nr_candidates)
         
-            idx_to_results = {}
             for i in range(test_start, test_end, test_step):
+                if i in idx_to_results:
+                    print(f'Skipping finished test case nr. {i}')
+                    continue
                 print(f'Starting test case nr. {i} ...')
                 test_case = test_cases[i]
-                cur_results = solve(
-                    catalog, test_case, coder, engine, 
-                    termination, max_tries, max_temperature)
+                if nr_candidates > 1:
+                    cur_results = race(
+                        catalog, test_case, coder, engines, 
+                        termination, scheduler.schedule(test_case), 
+                        validator, linter, max_lint_score)
+                else:
+                    cur_results = solve(
+                        catalog, test_case, coder, engine, 
+                        termination, max_tries, max_temperature, 
+                        validator, linter, max_lint_score, 
+                        pipeline=pipeline, scheduler=scheduler, 
+                        templates=templates, compile_queries=compile_queries)
+                    if templates is not None:
+                        templates.save()
                 idx_to_results[i] = cur_results
+                writer.write(i, cur_results)
                 print(cur_results)
         
-            with open(result_path, 'w') as results_file:
-                json.dump(idx_to_results, results_file)
+            coder.backend.close()
+            codexdb.results.dump_results(idx_to_results, result_path)
+            catalog.close()
 
 if __name__ == '__main__':
     
@@ -269,6 +1008,52 @@ if __name__ == '__main__':
     parser.add_argument('max_tries', type=int, help='Maximal number of tries')
     parser.add_argument('log_path', type=str, help='Redirect output here')
     parser.add_argument('result_path', type=str, help='Contains results')
+    parser.add_argument(
+        '--stream', action='store_true', 
+        help='Stream completions and stop once code is complete')
+    parser.add_argument(
+        '--validate', action='store_true', 
+        help='Reject invalid code before execution')
+    parser.add_argument(
+        '--max_lint_score', type=int, default=None, 
+        help='Regenerate code exceeding this performance lint score')
+    parser.add_argument(
+        '--resume', action='store_true', 
+        help='Skip test cases finished in a prior run')
+    parser.add_argument(
+        '--pipeline', action='store_true', 
+        help='Generate next try while executing current try')
+    parser.add_argument(
+        '--race', type=int, default=1, 
+        help='Number of candidates generated and executed concurrently')
+    parser.add_argument(
+        '--hedge_model', type=str, default=None, 
+        help='Send slow requests to this model as well (replayed if '
+        'replaying results)')
+    parser.add_argument(
+        '--hedge_percentile', type=float, default=95, 
+        help='Hedge requests slower than this latency percentile')
+    parser.add_argument(
+        '--replay_path', type=str, default=None, 
+        help='Replay code from this result file instead of using OpenAI')
+    parser.add_argument(
+        '--schedule_path', type=str, default=None, 
+        help='Schedule tries by success counts (written by schedule.py)')
+    parser.add_argument(
+        '--template_path', type=str, default=None, 
+        help='Reuse code of solved queries differing only in literals')
+    parser.add_argument(
+        '--compile', action='store_true', 
+        help='Try code compiled from SQL query before using the LLM')
+    parser.add_argument(
+        '--optimize_plans', action='store_true', 
+        help='Order joins and filters in plans via data statistics')
+    parser.add_argument(
+        '--table_format', type=str, default='csv', 
+        help='Preferred format of table files (csv, parquet, or feather)')
+    parser.add_argument(
+        '--plan_cache_path', type=str, default=None, 
+        help='Reuse and store query plans in this file (across runs)')
     args = parser.parse_args()
     
     openai.api_key = args.ai_key
@@ -277,4 +1062,8 @@ if __name__ == '__main__':
         args.prompt_style, True, args.mod_start, args.mod_between, args.mod_end, 
         args.sample_path, args.nr_samples, args.test_start, args.test_step, 
         args.test_end, args.termination, args.max_tries, 0.5, 
-        args.log_path, args.result_path)
\ No newline at end of file
+        args.log_path, args.result_path, args.stream, args.validate, 
+        args.max_lint_score, args.resume, args.pipeline, args.race, 
+        args.hedge_model, args.hedge_percentile, args.replay_path, 
+        args.schedule_path, args.template_path, args.compile, 
+        args.optimize_plans, args.table_format, args.plan_cache_path)
\ No newline at end of file
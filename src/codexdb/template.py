@@ -0,0 +1,240 @@
+import ast
+import codexdb.catalog
+import hashlib
+import json
+import os
+import sqlglot
+import sqlglot.expressions
+
+
+class TemplateCache():
+    """ Reuses code of solved queries that differ only in literals.
+
+    Templates are keyed by the query with abstracted literals and
+    by the database schema. Code for a new query is obtained from
+    the template code by replacing old literals with new ones.
+    """
+
+    def __init__(self, path=None):
+        """ Initializes cache, loading templates from file if possible.
+
+        Args:
+            path: path of file storing templates (optional)
+        """
+        self.path = path
+        self.templates = {}
+        self.nr_hits = 0
+        self.nr_misses = 0
+        self.changed = False
+        if path is not None and os.path.exists(path):
+            with open(path) as file:
+                for template in json.load(file):
+                    self.templates[template['key']] = template
+
+    def add(self, schema, files, query, code):
+        """ Add code solving given query as template.
+
+        Args:
+            schema: schema of queried database
+            files: names of files storing tables
+            query: SQL query solved by code
+            code: code solving query
+        """
+        abstraction = abstract_query(query, schema)
+        if abstraction is None:
+            return
+        sql_template, literals = abstraction
+        key = template_key(sql_template, schema, files)
+        if key not in self.templates:
+            self.templates[key] = {
+                'key':key, 'literals':literals, 'code':code}
+            self.changed = True
+
+    def instantiate(self, schema, files, query):
+        """ Generate code for query from cached template.
+
+        Args:
+            schema: schema of queried database
+            files: names of files storing tables
+            query: SQL query to generate code for
+
+        Returns:
+            code for query or None (if no template applies)
+        """
+        code = None
+        abstraction = abstract_query(query, schema)
+        if abstraction is not None:
+            sql_template, literals = abstraction
+            key = template_key(sql_template, schema, files)
+            template = self.templates.get(key)
+            if template is not None:
+                code = substitute(
+                    template['code'], template['literals'], literals)
+
+        if code is None:
+            self.nr_misses += 1
+        else:
+            self.nr_hits += 1
+        print(f'Template cache hits: {self.nr_hits}, '
+              f'misses: {self.nr_misses}')
+        return code
+
+    def save(self):
+        """ Write templates to file if they changed. """
+        if self.path is not None and self.changed:
+            with open(self.path, 'w') as file:
+                json.dump(list(self.templates.values()), file)
+            self.changed = False
+
+
+def abstract_query(query, schema):
+    """ Replace literals in query by placeholders.
+
+    Quoted identifiers that do not refer to tables or columns of
+    the schema are considered string literals.
+
+    Args:
+        query: SQL query
+        schema: schema of queried database
+
+    Returns:
+        canonical query template and list of literals (or None)
+    """
+    try:
+        expression = sqlglot.parse_one(query)
+    except Exception as e:
+        print(f'Cannot parse {query} for template: {e}')
+        return None
+
+    schema = codexdb.catalog.typed_schema(schema)
+    names = set(schema.lower_tables)
+    for columns in schema.lower_columns:
+        names.update(columns)
+    literals = []
+
+    def abstract(node):
+        """ Replace node by placeholder if it is a literal. """
+        literal = None
+        if isinstance(node, sqlglot.expressions.Literal):
+            literal = [node.args['this'], node.args.get('is_string', False)]
+        elif isinstance(node, sqlglot.expressions.Column) and \
+            isinstance(node.args.get('this'), sqlglot.expressions.Identifier):
+            identifier = node.args['this']
+            name = identifier.args['this']
+            if identifier.args.get('quoted') and \
+                name.lower() not in names and \
+                node.args.get('table') is None:
+                literal = [name, True]
+        if literal is None:
+            return node
+        literals.append(literal)
+        return sqlglot.expressions.Literal(this='?', is_string=False)
+
+    sql_template = expression.transform(abstract).sql().lower()
+    return sql_template, literals
+
+
+def substitute(code, old_literals, new_literals):
+    """ Replace literals of template query in code by new literals.
+
+    Only literals that change are replaced. Substitution fails if a
+    changed literal does not appear in the code as constant or if a
+    changed numerical literal appears multiple times (e.g., the code
+    may use the same number for unrelated purposes).
+
+    Args:
+        code: code solving template query with old literals
+        old_literals: literals of template query
+        new_literals: literals of new query
+
+    Returns:
+        code for new query or None (if substitution fails)
+    """
+    try:
+        tree = ast.parse(code)
+    except SyntaxError:
+        return None
+
+    in_fstring = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.JoinedStr):
+            for child in ast.walk(node):
+                in_fstring.add(id(child))
+    constants = [
+        n for n in ast.walk(tree) if isinstance(n, ast.Constant)
+        and id(n) not in in_fstring and n.lineno == n.end_lineno
+        and not isinstance(n.value, bool)]
+
+    replacements = {}
+    for (old_value, is_string), (new_value, _) in zip(
+        old_literals, new_literals):
+        if old_value == new_value:
+            continue
+        nr_matches = 0
+        for node in constants:
+            new_constant = replace_constant(
+                node.value, old_value, new_value, is_string)
+            if new_constant is None:
+                continue
+            nr_matches += 1
+            position = (node.lineno, node.col_offset, node.end_col_offset)
+            if replacements.get(position, new_constant) != new_constant:
+                return None
+            replacements[position] = new_constant
+        if nr_matches == 0 or (not is_string and nr_matches > 1):
+            return None
+
+    lines = [line.encode() for line in code.split('\n')]
+    for (lineno, start, end), new_constant in sorted(
+        replacements.items(), reverse=True):
+        line = lines[lineno-1]
+        lines[lineno-1] = line[:start] + repr(new_constant).encode() + \
+            line[end:]
+    return '\n'.join(line.decode() for line in lines)
+
+
+def replace_constant(constant, old_value, new_value, is_string):
+    """ Returns replacement for constant if it represents old literal.
+
+    Args:
+        constant: value of constant in code
+        old_value: text of old literal
+        new_value: text of new literal
+        is_string: whether literals are strings
+
+    Returns:
+        new constant or None (if constant does not match)
+    """
+    if isinstance(constant, str):
+        if constant == old_value:
+            return new_value
+        if constant == old_value.lower():
+            return new_value.lower()
+    elif isinstance(constant, (int, float)) and not is_string:
+        try:
+            if constant == float(old_value):
+                new_number = float(new_value)
+                if isinstance(constant, int) and new_number.is_integer():
+                    return int(new_number)
+                return new_number
+        except ValueError:
+            pass
+    return None
+
+
+def template_key(sql_template, schema, files):
+    """ Combine query template and schema signature into key.
+
+    Args:
+        sql_template: query with abstracted literals
+        schema: schema of queried database
+        files: names of files storing tables
+
+    Returns:
+        key of template
+    """
+    signature = json.dumps([
+        schema['table_names_original'],
+        schema['column_names_original'], files])
+    digest = hashlib.sha1(signature.encode()).hexdigest()
+    return f'{digest}:{sql_template}'
@@ -0,0 +1,168 @@
+import ast
+import codexdb.catalog
+import os.path
+
+
+class CodeValidator():
+    """ Rejects generated code that is certain to fail before execution. """
+
+    def __init__(self, catalog, id_case):
+        """ Initializes with database catalog.
+
+        Args:
+            catalog: informs on database schema and file names
+            id_case: whether to consider letter case for identifiers
+        """
+        self.catalog = catalog
+        self.id_case = id_case
+        # Column names introduced by pandas operations
+        self.generated_columns = {'index', 'count', 'size', 'proportion'}
+        self.merge_suffixes = {'_x', '_y'}
+        self.db_columns = {}
+
+    def validate(self, db_id, code):
+        """ Check generated code using static analysis.
+
+        Args:
+            db_id: code references data in this database
+            code: Python code to check
+
+        Returns:
+            Boolean validity flag, reason for rejection (or None)
+        """
+        if 'result.csv' not in code:
+            return False, "No write to 'result.csv'"
+
+        try:
+            tree = ast.parse(code)
+        except SyntaxError as e:
+            return False, f'Syntax error in line {e.lineno}: {e.msg}'
+
+        loaded, defined = self._string_uses(tree)
+        for name in loaded.union(defined):
+            if self._is_unknown_file(db_id, name):
+                return False, f'Unknown data file: {name}'
+
+        columns = self._columns(db_id)
+        for name in sorted(loaded):
+            if not self._is_known_column(name, columns, defined):
+                return False, f'Unknown column: {name}'
+
+        return True, None
+
+    def _columns(self, db_id):
+        """ Returns set of column names in database.
+
+        Column names are taken from the headers of table files (which
+        may differ from the schema). Schema columns are used for tables
+        whose files cannot be read.
+
+        Args:
+            db_id: retrieve columns of this database
+
+        Returns:
+            set of column names (normalized for letter case)
+        """
+        if db_id not in self.db_columns:
+            schema = self.catalog.schema(db_id)
+            columns = set()
+            for table, table_columns in zip(
+                schema.tables, schema.table_columns):
+                try:
+                    df = self.catalog.table_data(db_id, table, nrows=0)
+                    table_columns = list(df.columns)
+                except Exception as e:
+                    print(f'Cannot read columns of {table}: {e}')
+                columns.update(self._normalize(c) for c in table_columns)
+            self.db_columns[db_id] = columns
+        return self.db_columns[db_id]
+
+    def _is_known_column(self, name, columns, defined):
+        """ Checks whether code may access column with given name.
+
+        Args:
+            name: name of accessed column
+            columns: normalized column names in database
+            defined: strings that appear outside of column accesses
+
+        Returns:
+            True iff the column may exist at run time
+        """
+        if name in defined or name in self.generated_columns:
+            return True
+
+        norm_name = self._normalize(name)
+        if norm_name in columns:
+            return True
+
+        suffixes = self.merge_suffixes.union(defined)
+        for column in columns:
+            if norm_name.startswith(column):
+                suffix = name[len(column):]
+                if suffix in suffixes:
+                    return True
+        return False
+
+    def _is_unknown_file(self, db_id, name):
+        """ Checks whether string references non-existing data file.
+
+        Args:
+            db_id: code references data in this database
+            name: string literal that appears in code
+
+        Returns:
+            True iff string references unknown table file
+        """
+        file_name = os.path.basename(name)
+        table_format = os.path.splitext(file_name)[1][1:].lower()
+        if table_format not in codexdb.catalog.table_readers or \
+            file_name == 'result.csv':
+            return False
+
+        files = {self._normalize(f) for f in self.catalog.files(db_id)}
+        return self._normalize(file_name) not in files
+
+    def _normalize(self, name):
+        """ Normalize letter case of identifier if required. """
+        return name if self.id_case else name.lower()
+
+    def _string_uses(self, tree):
+        """ Collects string literals by their usage.
+
+        Args:
+            tree: abstract syntax tree of generated code
+
+        Returns:
+            strings used to read columns, other strings and keywords
+        """
+        accessed = set()
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Subscript) and \
+                isinstance(node.ctx, ast.Load) and \
+                not self._is_environment(node.value):
+                keys = node.slice
+                if isinstance(keys, ast.List):
+                    keys = keys.elts
+                else:
+                    keys = [keys]
+                for key in keys:
+                    if isinstance(key, ast.Constant) and \
+                        isinstance(key.value, str):
+                        accessed.add(id(key))
+
+        loaded = set()
+        defined = set()
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Constant) and isinstance(node.value, str):
+                if id(node) in accessed:
+                    loaded.add(node.value)
+                else:
+                    defined.add(node.value)
+            elif isinstance(node, ast.keyword) and node.arg:
+                defined.add(node.arg)
+
+        return loaded, defined
+
+    def _is_environment(self, node):
+        """ Checks whether node refers to environment variables. """
+        return isinstance(node, ast.Attribute) and node.attr == 'environ'
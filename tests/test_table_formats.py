@@ -0,0 +1,78 @@
+import codexdb.catalog
+import json
+import os
+import pandas as pd
+import pytest
+import time
+
+
+@pytest.fixture
+def data_dir(tmp_path):
+    """ Creates data directory with one database and one table. """
+    schemata = {'db': {
+        'db_id':'db', 'table_names_original':['singer'],
+        'column_names_original':[[-1, '*'], [0, 'Name'], [0, 'Age']],
+        'column_types':['text', 'text', 'number'],
+        'primary_keys':[], 'foreign_keys':[]}}
+    with open(tmp_path / 'schemata.json', 'w') as file:
+        json.dump(schemata, file)
+    db_dir = tmp_path / 'database' / 'db'
+    os.makedirs(db_dir)
+    df = pd.DataFrame({'Name':['Joe', 'Ann', None], 'Age':[30, 41, 25]})
+    df.to_csv(db_dir / 'singer.csv', index=False)
+    return str(tmp_path)
+
+
+def test_fallback_without_pyarrow(data_dir, monkeypatch, capsys):
+    """ Uses CSV files if libraries for preferred format are missing. """
+    monkeypatch.setattr(
+        codexdb.catalog, 'format_available', lambda f:f == 'csv')
+    catalog = codexdb.catalog.DbCatalog(data_dir, 'parquet')
+    assert 'pyarrow' in capsys.readouterr().out
+    catalog.convert()
+    assert catalog.files('db') == ['singer.csv']
+
+
+@pytest.mark.parametrize('table_format', ['parquet', 'feather'])
+def test_converted_copies(data_dir, table_format):
+    """ Reads copies in preferred format with types of CSV files. """
+    pytest.importorskip('pyarrow')
+    catalog = codexdb.catalog.DbCatalog(data_dir, table_format)
+    catalog.convert()
+    assert catalog.files('db') == [f'singer.{table_format}']
+    csv_df = pd.read_csv(catalog.csv_path('db', 'singer'))
+    df = catalog.table_data('db', 'singer')
+    pd.testing.assert_frame_equal(df, csv_df)
+    assert catalog.table_data('db', 'singer', nrows=1).shape == (1, 2)
+    assert catalog.table_stats('db', 'singer')['rows'] == 3
+
+
+@pytest.mark.parametrize('table_format', ['parquet', 'feather'])
+def test_outdated_copies(data_dir, table_format):
+    """ Uses CSV files that changed after conversion. """
+    pytest.importorskip('pyarrow')
+    catalog = codexdb.catalog.DbCatalog(data_dir, table_format)
+    catalog.convert()
+    csv_path = catalog.csv_path('db', 'singer')
+    time.sleep(0.01)
+    with open(csv_path, 'a') as file:
+        file.write('Bob,50\n')
+    os.utime(csv_path)
+    catalog = codexdb.catalog.DbCatalog(data_dir, table_format)
+    assert catalog.files('db') == ['singer.csv']
+    catalog.convert()
+    assert catalog.files('db') == [f'singer.{table_format}']
+    assert len(catalog.table_data('db', 'singer')) == 4
+
+
+@pytest.mark.parametrize('table_format', ['parquet', 'feather'])
+def test_packed_copies(data_dir, table_format):
+    """ Reads packed copies in preferred format. """
+    pytest.importorskip('pyarrow')
+    catalog = codexdb.catalog.DbCatalog(data_dir, table_format)
+    catalog.convert()
+    catalog.pack()
+    catalog = codexdb.catalog.DbCatalog(data_dir, table_format)
+    assert catalog.packed('db', 'singer')
+    df = catalog.table_data('db', 'singer')
+    assert df['Age'].tolist() == [30, 41, 25]